@@ -19,6 +19,45 @@ export async function handleApiResponse(response) {
     return response.status === 204 ? null : response.json();
 }
 
+// --- Editor Bundle ---
+// The editor lists and the room graph load from one request (/api/games/<id>/editor). The
+// response is kept with its ETag and revalidated with If-None-Match, so reloading an
+// unchanged game costs a 304. Loaders that run at the same time share one request.
+let editorBundleCache = null; // { gameId, etag, data }
+let editorBundleRequest = null; // { gameId, promise } while a request is in flight
+
+/**
+ * Fetches the editor bundle of a game: { game, revision, rooms, connections, entities,
+ * scripts, conversations } (conversations as {id, name} summaries).
+ * @param {string} gameId - The UUID of the game.
+ * @returns {Promise<object>} - The bundle; the cached one when the server answers 304.
+ * @throws {Error} - If the request fails (see handleApiResponse).
+ */
+export function fetchEditorBundle(gameId) {
+    if (editorBundleRequest?.gameId === gameId) {
+        return editorBundleRequest.promise;
+    }
+    const promise = (async () => {
+        const cached = editorBundleCache?.gameId === gameId ? editorBundleCache : null;
+        const response = await fetch(`/api/games/${gameId}/editor`, {
+            headers: cached ? { 'If-None-Match': cached.etag } : {}
+        });
+        if (response.status === 304 && cached) {
+            console.log(`Editor bundle for game ${gameId} unchanged (revision ${cached.data.revision})`);
+            return structuredClone(cached.data); // The editor modifies its state arrays in place
+        }
+        const data = await handleApiResponse(response);
+        const etag = response.headers.get('ETag');
+        editorBundleCache = etag ? { gameId, etag, data: structuredClone(data) } : null;
+        return data;
+    })();
+    editorBundleRequest = { gameId, promise };
+    promise.finally(() => {
+        if (editorBundleRequest?.promise === promise) editorBundleRequest = null;
+    }).catch(() => {}); // Failures are reported to the caller
+    return promise;
+}
+
 // Add other generic API call wrappers here if needed later
 // e.g., export async function get(url) { ... }
 // export async function post(url, data) { ... }
@@ -52,16 +52,16 @@ export async function loadConversationsUI(gameId) {
 }
 
 /**
- * Fetches conversations for the given game from the API and updates state.
+ * Fetches the conversations ({id, name}) of the given game from the editor bundle and updates
+ * state; a conversation's structure is fetched when it is selected.
  * @param {string} gameId - The UUID of the game.
  */
 async function fetchConversationsForGame(gameId) {
     if (!gameId) return;
     console.log(`Fetching conversations for game ${gameId}`);
     try {
-        const response = await fetch(`/api/games/${gameId}/conversations`);
-        const fetchedConversations = await api.handleApiResponse(response);
-        state.setCurrentConversations(fetchedConversations); // Update state
+        const bundle = await api.fetchEditorBundle(gameId);
+        state.setCurrentConversations(bundle.conversations); // Update state
         console.log("Conversations fetched:", state.currentConversations);
         renderConversationList();
         // Also update conversation dropdowns elsewhere (e.g., in entity editor)
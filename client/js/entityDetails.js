@@ -225,7 +225,7 @@ export function updateEntityImageThumbnail(imagePath, targetThumbnailElement = e
 
     if (imagePath) {
         const imageUrl = `/uploads/images/entiteiten/${imagePath}`; // Construct full URL
-        targetThumbnailElement.src = imageUrl;
+        targetThumbnailElement.src = uiUtils.imageVariantUrl(imageUrl, 160);
         targetThumbnailElement.style.display = 'inline-block';
     } else {
         targetThumbnailElement.src = defaultImagePath; // Show default image
@@ -11,16 +11,15 @@ const entityListUl = document.getElementById('entity-list-ul');
 // --- Entity List Fetching and Rendering ---
 
 /**
- * Fetches the list of entities for the currently selected game.
+ * Fetches the list of entities for the currently selected game (from the editor bundle).
  * @param {string} gameId - The UUID of the game.
  */
 export async function fetchEntitiesForGame(gameId) {
     if (!gameId) return;
     console.log(`Fetching entities for game ${gameId}`);
     try {
-        const response = await fetch(`/api/games/${gameId}/entities`);
-        const fetchedEntities = await api.handleApiResponse(response);
-        state.setCurrentEntities(fetchedEntities); // Update state
+        const bundle = await api.fetchEditorBundle(gameId);
+        state.setCurrentEntities(bundle.entities); // Update state
         console.log("Entities fetched:", state.currentEntities);
         renderEntityList(); // Initial render with all entities
     } catch (error) {
@@ -106,7 +106,7 @@ export function renderGameList() {
             li.dataset.gameId = game.id; // Store game ID
 
             const img = document.createElement('img');
-            img.src = imagePath;
+            img.src = uiUtils.imageVariantUrl(imagePath, 160);
             img.alt = `Thumbnail for ${game.name}`;
             li.appendChild(img);
 
@@ -170,7 +170,7 @@ export function renderSpellenGrid() {
             // Set data
             title.textContent = game.name;
             const defaultImagePath = '/uploads/avonturen/standaard_spel_start.png';
-            thumbnail.src = game.start_image_path ? `/uploads/avonturen/${game.start_image_path}` : defaultImagePath;
+            thumbnail.src = uiUtils.imageVariantUrl(game.start_image_path ? `/uploads/avonturen/${game.start_image_path}` : defaultImagePath, 320);
             thumbnail.alt = `Thumbnail for ${game.name}`;
             // description.textContent = game.description || 'Geen beschrijving.'; // Uncomment if using description
 
@@ -477,6 +477,28 @@ function closeSubmitToStoreModal() {
     }
 }
 
+/**
+ * Polls a store submission job until it finishes, showing progress in the modal.
+ * @param {string} jobId - The ID of the submission job.
+ * @returns {Promise<object>} - The store API response once the job succeeded.
+ * @throws {Error} - If the job failed.
+ */
+async function pollStoreSubmissionJob(jobId) {
+    while (true) {
+        const response = await fetch(`/api/store/jobs/${jobId}`);
+        const job = await api.handleApiResponse(response);
+        if (job.status === 'succeeded') return job.result || {};
+        if (job.status === 'failed') {
+            uiUtils.showFlashMessage(`Error: ${job.error}`, 5000);
+            throw new Error(job.error || 'Submission failed');
+        }
+        const { bytes_sent: sent, bytes_total: total } = job.progress || {};
+        const percentage = total ? ` (${Math.floor((sent || 0) * 100 / total)}%)` : '';
+        submitStoreStatusSpan.textContent = `${job.message}${percentage}`;
+        await new Promise(resolve => setTimeout(resolve, 1500));
+    }
+}
+
 /** Handles the submission of the game to the store API. */
 async function handleSubmitToStore(event) {
     event.preventDefault();
@@ -505,7 +527,8 @@ async function handleSubmitToStore(event) {
             headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify({ tags: tags })
         });
-        const result = await api.handleApiResponse(response); // Handles errors and success (201)
+        const job = await api.handleApiResponse(response); // Submission is queued (202)
+        const result = await pollStoreSubmissionJob(job.id);
         submitStoreStatusSpan.textContent = `Success! ${result.message || 'Game submitted.'}`;
         const gameNameForMessage = result.name || 'Unknown';
         uiUtils.showFlashMessage(`Game "${gameNameForMessage}" successfully submitted to the store!`);
@@ -582,6 +605,74 @@ function handleDirectExportGame(gameId) {
     window.location.href = `/api/games/${gameId}/export`;
 }
 
+const IMPORT_CHUNK_SIZE = 4 * 1024 * 1024; // Server caps this at IMPORT_UPLOAD_CHUNK_SIZE
+const IMPORT_CHUNK_ATTEMPTS = 4;
+
+/** Returns the hex SHA-256 of a blob, or null where WebCrypto is unavailable (non-HTTPS). */
+async function sha256Hex(blob) {
+    if (!window.crypto?.subtle) return null;
+    const digest = await window.crypto.subtle.digest('SHA-256', await blob.arrayBuffer());
+    return Array.from(new Uint8Array(digest)).map(b => b.toString(16).padStart(2, '0')).join('');
+}
+
+/**
+ * Uploads a game archive in numbered chunks (see server/api/import_uploads.py).
+ * The upload id is remembered per file, so a retry after an interruption only sends
+ * the chunks the server does not have yet.
+ * @param {File} file - The archive to upload.
+ * @returns {Promise<{uploadId: string, resumeKey: string}>} The upload, ready to be completed.
+ */
+async function uploadImportArchive(file) {
+    const resumeKey = `importUpload:${file.name}:${file.size}:${file.lastModified}`;
+    let status = null;
+    const previousUploadId = localStorage.getItem(resumeKey);
+    if (previousUploadId) {
+        const response = await fetch(`/api/games/import/uploads/${previousUploadId}`);
+        if (response.ok) status = await response.json();
+    }
+    if (!status) {
+        const response = await fetch('/api/games/import/uploads', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ filename: file.name, size: file.size, chunk_size: IMPORT_CHUNK_SIZE }),
+        });
+        status = await api.handleApiResponse(response);
+        localStorage.setItem(resumeKey, status.upload_id);
+    }
+
+    const missing = status.missing_chunks;
+    for (let i = 0; i < missing.length; i++) {
+        const index = missing[i];
+        const chunk = file.slice(index * status.chunk_size, Math.min((index + 1) * status.chunk_size, file.size));
+        const headers = { 'Content-Type': 'application/octet-stream' };
+        const checksum = await sha256Hex(chunk);
+        if (checksum) headers['X-Chunk-SHA256'] = checksum;
+
+        for (let attempt = 1; ; attempt++) {
+            try {
+                const response = await fetch(`/api/games/import/uploads/${status.upload_id}/chunks/${index}`, {
+                    method: 'PUT',
+                    headers,
+                    body: chunk,
+                });
+                if (response.ok) break;
+                if (response.status < 500 && response.status !== 422) {
+                    await api.handleApiResponse(response); // Not retryable: shows the error and throws
+                }
+            } catch (error) {
+                if (attempt >= IMPORT_CHUNK_ATTEMPTS) throw error;
+            }
+            if (attempt >= IMPORT_CHUNK_ATTEMPTS) {
+                throw new Error(`Chunk ${index + 1} could not be uploaded. Import again to resume.`);
+            }
+            await new Promise(resolve => setTimeout(resolve, 1000 * attempt));
+        }
+        const sent = status.total_chunks - missing.length + i + 1;
+        uiUtils.showFlashMessage(`Uploading "${file.name}"... ${Math.round(sent * 100 / status.total_chunks)}%`, 5000);
+    }
+    return { uploadId: status.upload_id, resumeKey };
+}
+
 /** Handles the file selection for game import. */
 async function handleImportGame(event) {
     const file = event.target.files[0];
@@ -590,16 +681,35 @@ async function handleImportGame(event) {
     console.log("Selected file for import:", file);
     uiUtils.showFlashMessage(`Importing "${file.name}"...`, 5000);
 
-    const formData = new FormData();
-    formData.append('file', file);
-
     try {
-        const response = await fetch('/api/games/import', {
-            method: 'POST',
-            body: formData,
-        });
-        const result = await api.handleApiResponse(response); // Handles errors and success (201)
-        uiUtils.showFlashMessage(`Game "${result.name}" successfully imported!`);
+        const { uploadId, resumeKey } = await uploadImportArchive(file);
+        const completeUrl = `/api/games/import/uploads/${uploadId}/complete`;
+        let response = await fetch(completeUrl, { method: 'POST' });
+        // 409: the game already exists. Offer to update it with only the changed content
+        // (the uploaded archive stays on the server, so nothing is sent again).
+        if (response.status === 409) {
+            const conflict = await response.json().catch(() => ({}));
+            if (!confirm(`${conflict.error || 'This game already exists.'}\n\nUpdate the existing game with the contents of "${file.name}"?`)) {
+                await fetch(`/api/games/import/uploads/${uploadId}`, { method: 'DELETE' });
+                localStorage.removeItem(resumeKey);
+                event.target.value = null;
+                return;
+            }
+            response = await fetch(completeUrl, {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ mode: 'merge' }),
+            });
+        }
+        const result = await api.handleApiResponse(response); // Handles errors and success (201/200)
+        localStorage.removeItem(resumeKey);
+        if (result.import_summary) {
+            const changes = Object.values(result.import_summary)
+                .reduce((total, counts) => total + (counts.inserted || 0) + (counts.updated || 0) + (counts.deleted || 0), 0);
+            uiUtils.showFlashMessage(`Game "${result.name}" updated (${changes} changed rows).`);
+        } else {
+            uiUtils.showFlashMessage(`Game "${result.name}" successfully imported!`);
+        }
         await fetchGames(); // Refresh game list and grid
     } catch (error) {
         // Error message is already shown by handleApiResponse
@@ -629,7 +739,19 @@ async function handleCompressGameImages(gameId, gameName) {
             headers: { 'Content-Type': 'application/json' },
             // No body needed for this request
         });
-        const result = await api.handleApiResponse(response); // Handles errors and success (200)
+        let job = await api.handleApiResponse(response); // Compression is queued (202)
+        // Poll the job; the server compresses on all cores and reports per-image progress
+        while (job.status !== 'succeeded' && job.status !== 'failed') {
+            await new Promise(resolve => setTimeout(resolve, 1500));
+            job = await api.handleApiResponse(await fetch(job.status_url || `/api/admin/compress-jobs/${job.id}`));
+            const { images_done: done, images_total: total } = job.progress || {};
+            if (total) uiUtils.showFlashMessage(`Compressing images for "${gameName}"... ${done || 0}/${total}`, 3000);
+        }
+        if (job.status === 'failed') {
+            uiUtils.showFlashMessage(`Error: ${job.error}`, 5000);
+            return;
+        }
+        const result = job.result || {};
         uiUtils.showFlashMessage(result.message || `Images for "${gameName}" compressed.`, 8000); // Show result message
         // Optionally refresh game data if image paths might have changed display (e.g., thumbnails)
         // await fetchGames(); // Could refresh the grid if needed
@@ -140,7 +140,7 @@ function updateGameImageThumbnail(thumbnailElement, imageType, imagePath) {
     if (!thumbnailElement) return;
 
     const imageUrl = imagePath ? `/uploads/avonturen/${imagePath}` : defaultImagePath;
-    thumbnailElement.src = imageUrl;
+    thumbnailElement.src = uiUtils.imageVariantUrl(imageUrl, 160);
     thumbnailElement.style.display = 'inline-block'; // Ensure visible
 }
 
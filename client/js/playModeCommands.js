@@ -79,7 +79,7 @@ export async function sendPlayCommand(command, isInitialization = false) {
                 playOutputDiv.innerHTML += `\n<div style="white-space: pre-wrap;">${result.message}</div>\n`;
             } else {
                 // Not in conversation, normal command
-                ui.updateRoomImage(result.image_path); // Update room image only if not in convo
+                ui.updateRoomImage(result.image_path, result.image_preview); // Update room image only if not in convo
 
                 // Add command echo and response to output
                 if (!isInitialization) {
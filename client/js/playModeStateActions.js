@@ -72,7 +72,7 @@ async function loadGameState() {
         // Backend state (inventory, vars) is loaded server-side, client doesn't need direct access here.
 
         // Update UI elements
-        ui.updateRoomImage(result.image_path);
+        ui.updateRoomImage(result.image_path, result.image_preview);
         ui.updateScoreDisplay(result.current_score);
         showFlashMessage("Spel geladen!", 4000);
 
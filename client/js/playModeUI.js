@@ -2,7 +2,7 @@
 // Handles UI updates for the Play Mode tab.
 
 import * as state from './state.js';
-import { showFlashMessage } from './uiUtils.js';
+import { showFlashMessage, imageVariantUrl, applyImagePreview } from './uiUtils.js';
 import { initializePlayMode, resetPlayMode as resetPlayModeCore } from './playMode.js'; // Import core logic
 
 // --- DOM Elements ---
@@ -30,11 +30,16 @@ const playControlsDiv = document.getElementById('play-controls');
 /**
  * Updates the room image displayed in play mode.
  * @param {string | null} imagePath - Relative path to the image or null for default.
+ * @param {object | null} [preview] - The response's image_preview (size and placeholder), if any.
  */
-export function updateRoomImage(imagePath) {
+export function updateRoomImage(imagePath, preview = null) {
     const defaultImagePath = '/uploads/images/kamers/standaard_kamer.png';
     const imageUrl = imagePath ? `/uploads/images/kamers/${imagePath}` : defaultImagePath;
-    if (playRoomImage) playRoomImage.src = imageUrl;
+    if (!playRoomImage) return;
+    const variantUrl = imageVariantUrl(imageUrl, playRoomImage.clientWidth || 800);
+    if (playRoomImage.getAttribute('src') === variantUrl) return; // Same room, nothing to load
+    applyImagePreview(playRoomImage, preview);
+    playRoomImage.src = variantUrl;
 }
 
 /**
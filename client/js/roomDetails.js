@@ -166,7 +166,7 @@ function updateRoomImageThumbnail(imagePath) {
 
     if (imagePath) {
         const imageUrl = `/uploads/images/kamers/${imagePath}`; // Construct full URL for rooms
-        roomImageThumbnail.src = imageUrl;
+        roomImageThumbnail.src = uiUtils.imageVariantUrl(imageUrl, 160);
         roomImageThumbnail.style.display = 'inline-block';
     } else {
         roomImageThumbnail.src = defaultImagePath; // Show default image
@@ -87,12 +87,12 @@ export async function initializeGraphView() {
     graphContainer.innerHTML = ''; // Clear container
     graphInitialized = false; // Reset flag
 
-    // Fetch all connections for the current game
+    // Fetch all connections for the current game (editor bundle: a 304 when nothing changed)
     let allConnections = [];
     try {
         console.log(`Fetching all connections for game ${state.selectedGameId}...`);
-        const response = await fetch(`/api/games/${state.selectedGameId}/connections`);
-        allConnections = await api.handleApiResponse(response);
+        const bundle = await api.fetchEditorBundle(state.selectedGameId);
+        allConnections = bundle.connections;
         console.log("All connections fetched:", allConnections);
     } catch (error) {
         console.error("Failed to fetch all connections for graph:", error);
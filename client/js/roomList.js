@@ -17,16 +17,15 @@ let draggedRoomId = null;
 // --- Room List Fetching and Rendering ---
 
 /**
- * Fetches the list of rooms for the currently selected game.
+ * Fetches the list of rooms for the currently selected game (from the editor bundle).
  * @param {string} gameId - The UUID of the game.
  */
 export async function fetchRoomsForGame(gameId) {
     if (!gameId) return;
     console.log(`Fetching rooms for game ${gameId}`);
     try {
-        const response = await fetch(`/api/games/${gameId}/rooms`);
-        const fetchedRooms = await api.handleApiResponse(response);
-        state.setCurrentRooms(fetchedRooms); // Update state
+        const bundle = await api.fetchEditorBundle(gameId);
+        state.setCurrentRooms(bundle.rooms); // Update state
         console.log("Rooms fetched:", state.currentRooms);
         renderRoomList();
         // If graph view is active, update or initialize it
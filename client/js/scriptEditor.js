@@ -49,16 +49,15 @@ export async function loadScriptsUI(gameId) {
 }
 
 /**
- * Fetches scripts for the given game from the API and updates state.
+ * Fetches scripts for the given game (from the editor bundle) and updates state.
  * @param {string} gameId - The UUID of the game.
  */
 async function fetchScriptsForGame(gameId) {
     if (!gameId) return;
     console.log(`Fetching scripts for game ${gameId}`);
     try {
-        const response = await fetch(`/api/games/${gameId}/scripts`);
-        const fetchedScripts = await api.handleApiResponse(response);
-        state.setCurrentScripts(fetchedScripts); // Update state
+        const bundle = await api.fetchEditorBundle(gameId);
+        state.setCurrentScripts(bundle.scripts); // Update state
         console.log("Scripts fetched:", state.currentScripts);
         renderScriptList();
     } catch (error) {
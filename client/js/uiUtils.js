@@ -414,13 +414,46 @@ const imagePopupContainer = document.getElementById('entity-image-popup'); // As
 const imagePopupImg = document.getElementById('entity-image-popup-img');
 const imagePopupCloseBtn = document.getElementById('entity-image-popup-close');
 
+/**
+ * Returns the URL of a resized variant of an uploaded image (rendered and cached by the server).
+ * @param {string} imageUrl - The /uploads/... URL of the original image.
+ * @param {number} width - Display width in CSS pixels; scaled by the device pixel ratio.
+ * @returns {string} The variant URL.
+ */
+export function imageVariantUrl(imageUrl, width) {
+    const pixelWidth = Math.ceil(width * (window.devicePixelRatio || 1));
+    return `${imageUrl}?w=${pixelWidth}`;
+}
+
+/**
+ * Reserves the layout space of an image that is about to load and shows its tiny placeholder
+ * (from a play response's *_preview field) until the real image has arrived.
+ * @param {HTMLImageElement} img - The image element whose src is about to change.
+ * @param {{width: number, height: number, placeholder: string | null} | null} preview - Preview data, or null if unknown.
+ */
+export function applyImagePreview(img, preview) {
+    img.style.backgroundImage = '';
+    if (!preview) {
+        img.removeAttribute('width');
+        img.removeAttribute('height');
+        return;
+    }
+    // With height: auto in CSS the attributes only set the aspect ratio
+    img.width = preview.width;
+    img.height = preview.height;
+    if (preview.placeholder) {
+        img.style.background = `center / contain no-repeat url("${preview.placeholder}")`;
+        img.addEventListener('load', () => { img.style.backgroundImage = ''; }, { once: true });
+    }
+}
+
 /**
  * Shows the image popup with the specified image URL.
  * @param {string} imageUrl - The URL of the image to display.
  */
 export function showImagePopup(imageUrl) {
     if (imagePopupContainer && imagePopupImg) {
-        imagePopupImg.src = imageUrl;
+        imagePopupImg.src = imageUrl.split('?')[0]; // Thumbnails may pass a variant URL; show the original
         imagePopupContainer.classList.add('visible');
     }
 }
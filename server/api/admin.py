@@ -1,16 +1,29 @@
-from flask import Blueprint, request, jsonify, current_app
+import json
+import time
+from concurrent.futures import as_completed
+from flask import Blueprint, request, jsonify, current_app, send_file
 from flask_login import current_user
-from pathlib import Path
+from pathlib import Path, PurePosixPath
+from sqlalchemy import select, update, func, bindparam
 from app import db
 from models import User, UserRole, Game, Room, Entity, Script, Conversation, SystemSetting, SavedGame, HighScore
 from decorators import admin_required
 from argon2 import PasswordHasher
 import uuid
-from image_utils import get_absolute_image_path, compress_and_convert_image, delete_file
+from image_utils import get_absolute_image_path, compress_image_file, delete_file, IMAGE_SUBDIRS
+from storage_stats import adjust_for_file_change, apply_storage_deltas, refresh_image_storage, TABLE_SIZE_COLUMNS
+from jobs import submit_job, get_job, get_process_pool, JobStatus, JOB_RETENTION_SECONDS
+from api.games import write_catalog_archive
+from upload_gc import collect_orphaned_uploads
+from upload_storage import get_upload_storage
+from list_query import list_response, search_filter
 
 admin_bp = Blueprint('admin_bp', __name__, url_prefix='/api/admin')
 ph = PasswordHasher()
 
+# Fields a user list can be projected to (?fields=...)
+USER_LIST_FIELDS = ('id', 'name', 'email', 'role', 'theme_preference')
+
 # --- Helper Functions ---
 def serialize_user(user):
     """Serializes a User object for the admin panel."""
@@ -27,10 +40,21 @@ def serialize_user(user):
 @admin_bp.route('/users', methods=['GET'])
 @admin_required
 def list_users():
-    """Lists all users."""
+    """
+    Lists the users by name. Filters: q (name or email contains), role.
+    Supports the paging and projection parameters of list_query.list_response.
+    """
+    query = select(User)
+    if request.args.get('q'):
+        query = query.where(search_filter(User.name, request.args['q']) | search_filter(User.email, request.args['q']))
+    if request.args.get('role'):
+        try:
+            query = query.where(User.role == UserRole(request.args['role'].lower()))
+        except ValueError:
+            valid_roles = [r.value for r in UserRole]
+            return jsonify({"error": f"Invalid role. Must be one of: {', '.join(valid_roles)}"}), 400
     try:
-        users = User.query.order_by(User.name).all()
-        return jsonify([serialize_user(user) for user in users]), 200
+        return list_response(query, User, User.name, serialize_user, USER_LIST_FIELDS)
     except Exception as e:
         current_app.logger.error(f"Error fetching users: {e}")
         return jsonify({"error": "Failed to retrieve users"}), 500
@@ -251,95 +275,282 @@ def get_admin_stats():
 
 # --- NEW: Game Compression Route ---
 
+IMAGE_COMPRESSION_JOB = 'image_compression'
+
+# (model, attribute, image type) for every column that references an image file
+IMAGE_REFERENCE_COLUMNS = [
+    (Game, 'start_image_path', 'game_start'),
+    (Game, 'win_image_path', 'game_win'),
+    (Game, 'loss_image_path', 'game_loss'),
+    (Room, 'image_path', 'room'),
+    (Entity, 'image_path', 'entity'),
+]
+
+def _collect_game_images(game_id) -> dict:
+    """Returns {(uploads subdirectory, filename): image type} for every image the game references."""
+    images = {}
+    for model, attr_name, image_type in IMAGE_REFERENCE_COLUMNS:
+        column = getattr(model, attr_name)
+        owner = model.id if model is Game else model.game_id
+        for (filename,) in db.session.execute(select(column).where(owner == game_id, column.isnot(None)).distinct()):
+            images.setdefault((IMAGE_SUBDIRS[image_type], filename), image_type)
+    return images
+
+def _apply_renamed_images(game_id, renames: dict):
+    """
+    Points all references of a game at the converted files, in one transaction with one
+    batched UPDATE per column. renames maps (subdir, old filename) -> new filename.
+    """
+    table_deltas = {}
+    for model, attr_name, image_type in IMAGE_REFERENCE_COLUMNS:
+        subdir = IMAGE_SUBDIRS[image_type]
+        params = [{'old_name': old_name, 'new_name': new_name}
+                  for (rename_subdir, old_name), new_name in renames.items() if rename_subdir == subdir]
+        if not params:
+            continue
+        column = getattr(model, attr_name)
+        owner = model.id if model is Game else model.game_id
+        # Bulk updates bypass the storage listeners: account for the changed JSON lengths
+        reference_counts = dict(db.session.execute(
+            select(column, func.count()).where(owner == game_id, column.in_([param['old_name'] for param in params]))
+            .group_by(column)).all())
+        size_column = TABLE_SIZE_COLUMNS[model]
+        for param in params:
+            table_deltas[size_column] = table_deltas.get(size_column, 0) + reference_counts.get(param['old_name'], 0) * (
+                len(json.dumps(param['new_name'])) - len(json.dumps(param['old_name'])))
+        statement = update(model.__table__).where(owner == game_id, column == bindparam('old_name'))\
+            .values({attr_name: bindparam('new_name')})
+        db.session.execute(statement, params)
+    apply_storage_deltas(game_id, table_deltas)
+
+def _run_image_compression(job, game_id) -> dict:
+    """
+    Job body: compresses every image of a game on the shared process pool, reporting
+    per-image progress, then applies all database path changes in one batch.
+    """
+    game = db.session.get(Game, game_id)
+    if not game:
+        raise ValueError("Game not found")
+    game_name = game.name
+    images = _collect_game_images(game_id)
+    total = len(images)
+    job.update(message=f"Compressing {total} images", images_total=total, images_done=0,
+               converted=0, failed=0)
+
+    futures = {}
+    failed_count = 0
+    pool = get_process_pool()
+    for (subdir, filename), image_type in images.items():
+        absolute_source_path = get_absolute_image_path(filename, image_type)
+        if not absolute_source_path or not absolute_source_path.is_file():
+            current_app.logger.warning(f"Compress: Skipping missing source file '{subdir}/{filename}'")
+            failed_count += 1
+            continue
+        futures[pool.submit(compress_image_file, str(absolute_source_path))] = (subdir, filename)
+
+    processed_count = 0
+    renames = {}
+    original_files_to_delete = []
+    for done_count, future in enumerate(as_completed(futures), start=1):
+        subdir, filename = futures[future]
+        try:
+            result = future.result()
+        except Exception as e: # Worker crashed (e.g. decoder bug)
+            current_app.logger.error(f"Compress: Worker failed for '{subdir}/{filename}': {e}")
+            result = {'target': None}
+        if not result['target']:
+            failed_count += 1
+        else:
+            processed_count += 1
+            if result['extension_changed']:
+                renames[(subdir, filename)] = str(PurePosixPath(filename).with_name(Path(result['target']).name)) # Keeps a shard prefix
+                get_upload_storage().push(f"{subdir}/{renames[(subdir, filename)]}")
+                original_files_to_delete.append((subdir, filename, Path(result['source']), result['original_size']))
+            else:
+                # Compressed in place: same path, new size for every game using it
+                get_upload_storage().push(f"{subdir}/{filename}")
+                adjust_for_file_change(f"{subdir}/{filename}", result['original_size'], result['new_size'], commit=False)
+        job.update(message=f"Compressed {done_count}/{len(futures)}: {filename}",
+                   images_done=done_count + (total - len(futures)), converted=len(renames), failed=failed_count)
+
+    # One transaction for all database path updates
+    job.update(message="Updating image references")
+    try:
+        _apply_renamed_images(game_id, renames)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        for subdir, filename, _, _ in original_files_to_delete: # Keep the originals, drop the new copies
+            get_upload_storage().delete(f"{subdir}/{renames[(subdir, filename)]}")
+        raise
+
+    # Delete original files AFTER successful DB commit
+    deleted_originals_count = 0
+    for subdir, filename, original_path, original_size in original_files_to_delete:
+        if delete_file(original_path):
+            get_upload_storage().delete(f"{subdir}/{filename}") # The bucket's copy (local: already gone)
+            deleted_originals_count += 1
+            # Other games that still reference the original lose the file
+            adjust_for_file_change(f"{subdir}/{filename}", original_size, None, commit=False)
+    refresh_image_storage(game_id)
+
+    message = f"Compression complete for game '{game_name}'. Processed: {processed_count}, Converted to JPG: {len(renames)}, Failed: {failed_count}."
+    if deleted_originals_count > 0:
+        message += f" Deleted {deleted_originals_count} original non-JPG files."
+    current_app.logger.info(message)
+    return {"message": message, "processed": processed_count, "converted": len(renames), "failed": failed_count, "deleted_originals": deleted_originals_count}
+
 @admin_bp.route('/games/<uuid:game_id>/compress', methods=['POST'])
 @admin_required
 def compress_game_images(game_id):
     """
-    Compresses all images associated with a specific game.
+    Starts a background job that compresses all images associated with a specific game.
     Resizes images to fit within 800x800, converts to JPG (80% quality),
     updates database references if extensions change, and deletes original files
     if they were successfully converted to JPG.
+    Returns 202 with the job; poll /api/admin/compress-jobs/<job_id> for per-image progress.
     """
     game = db.session.get(Game, game_id)
     if not game:
         return jsonify({"error": "Game not found"}), 404
 
     current_app.logger.info(f"Starting image compression for game '{game.name}' (ID: {game_id})")
+    job = submit_job(IMAGE_COMPRESSION_JOB, _run_image_compression, game_id, owner_id=current_user.id)
+    response = job.to_dict()
+    response['status_url'] = f"/api/admin/compress-jobs/{job.id}"
+    return jsonify(response), 202
 
-    # Fetch associated rooms and entities
-    rooms = Room.query.filter_by(game_id=game_id).all()
-    entities = Entity.query.filter_by(game_id=game_id).all()
-
-    # Collect unique relative image paths and their associated objects/types
-    # Store as {relative_path: [(object, attribute_name, image_type)]}
-    image_references = {}
-
-    def add_reference(relative_path, obj, attr_name, img_type):
-        if not relative_path: return
-        if relative_path not in image_references:
-            image_references[relative_path] = []
-        image_references[relative_path].append((obj, attr_name, img_type))
-
-    # Game images
-    add_reference(game.start_image_path, game, 'start_image_path', 'game_start')
-    add_reference(game.win_image_path, game, 'win_image_path', 'game_win')
-    # Room images
-    for room in rooms:
-        add_reference(room.image_path, room, 'image_path', 'room')
-    # Entity images
-    for entity in entities:
-        add_reference(entity.image_path, entity, 'image_path', 'entity')
+@admin_bp.route('/compress-jobs/<job_id>', methods=['GET'])
+@admin_required
+def get_compression_status(job_id):
+    """Returns the status, per-image progress and (when finished) the summary of a compression job."""
+    job = get_job(job_id, kind=IMAGE_COMPRESSION_JOB)
+    if not job:
+        return jsonify({"error": "Compression job not found"}), 404
+    return jsonify(job.to_dict()), 200
 
-    processed_count = 0
-    converted_count = 0
-    failed_count = 0
-    original_files_to_delete = set()
+# --- Catalog Export ---
 
-    # Process each unique relative path
-    for relative_path, references in image_references.items():
-        # Assume all references for the same relative path use the same image_type
-        _, _, image_type = references[0]
+CATALOG_EXPORT_JOB = 'catalog_export'
 
-        absolute_source_path = get_absolute_image_path(relative_path, image_type)
-        if not absolute_source_path or not absolute_source_path.is_file():
-            current_app.logger.warning(f"Compress: Skipping missing source file for relative path '{relative_path}'")
-            failed_count += 1
+def _catalog_exports_dir() -> Path:
+    exports_dir = Path(current_app.config['INSTANCE_FOLDER_PATH']) / 'exports'
+    exports_dir.mkdir(parents=True, exist_ok=True)
+    return exports_dir
+
+def _catalog_export_path(job_id: str) -> Path:
+    return _catalog_exports_dir() / f'catalog-{job_id}.zip'
+
+def _prune_catalog_exports():
+    """Removes finished export files once their job is no longer retained."""
+    cutoff = time.time() - JOB_RETENTION_SECONDS
+    for path in _catalog_exports_dir().glob('catalog-*.zip'):
+        try:
+            if path.stat().st_mtime < cutoff:
+                path.unlink()
+        except OSError:
             continue
 
-        new_absolute_path, extension_changed = compress_and_convert_image(absolute_source_path)
+def _run_catalog_export(job, game_ids) -> dict:
+    """Job body: streams the selected games into an archive in the instance folder."""
+    archive_path = _catalog_export_path(job.id)
 
-        if new_absolute_path:
-            processed_count += 1
-            if extension_changed:
-                converted_count += 1
-                new_relative_path = new_absolute_path.name # The new filename (e.g., 'image.jpg')
-                # Update all DB objects referencing this image
-                for obj, attr_name, _ in references:
-                    setattr(obj, attr_name, new_relative_path)
-                    current_app.logger.info(f"Compress: Updated DB reference for {obj.__class__.__name__} ID {obj.id}.{attr_name} to '{new_relative_path}'")
-                # Mark original file for deletion only if conversion happened and extension changed
-                original_files_to_delete.add(absolute_source_path)
-        else:
-            failed_count += 1
-            current_app.logger.error(f"Compress: Failed to process image: {absolute_source_path}")
+    def report_progress(done, total, game, archive_bytes):
+        job.update(message=f"Exported '{game.name}' ({done}/{total})",
+                   games_done=done, games_total=total, archive_bytes=archive_bytes)
 
-    # Commit DB changes (updated image paths)
+    job.update(message="Exporting games", games_done=0)
     try:
-        db.session.commit()
-        current_app.logger.info(f"Compress: Database updates committed for game '{game.name}'.")
-    except Exception as e:
-        db.session.rollback()
-        current_app.logger.error(f"Compress: Database commit failed after image processing for game '{game.name}': {e}", exc_info=True)
-        return jsonify({"error": "Failed to save image path updates to database."}), 500
+        catalog = write_catalog_archive(archive_path, game_ids, progress=report_progress)
+    except Exception:
+        archive_path.unlink(missing_ok=True)
+        raise
+    return {"games": len(catalog["games"]), "image_files": catalog["image_files"],
+            "archive_bytes": archive_path.stat().st_size,
+            "download_url": f"/api/admin/catalog-exports/{job.id}/download"}
+
+@admin_bp.route('/catalog-exports', methods=['POST'])
+@admin_required
+def start_catalog_export():
+    """
+    Starts a background export of several games into one archive.
+    JSON body (optional): {"game_ids": [...]}; omit to export every game.
+    Returns 202 with the job; poll the status URL, then fetch the result's download_url.
+    """
+    data = request.get_json(silent=True) or {}
+    game_ids = data.get('game_ids')
+    if game_ids is not None:
+        try:
+            game_ids = [uuid.UUID(str(game_id)) for game_id in game_ids]
+        except (TypeError, ValueError):
+            return jsonify({"error": "'game_ids' must be a list of game IDs"}), 400
+        if not game_ids:
+            return jsonify({"error": "'game_ids' is empty"}), 400
+
+    _prune_catalog_exports()
+    job = submit_job(CATALOG_EXPORT_JOB, _run_catalog_export, game_ids, owner_id=current_user.id)
+    response = job.to_dict()
+    response['status_url'] = f"/api/admin/catalog-exports/{job.id}"
+    return jsonify(response), 202
+
+@admin_bp.route('/catalog-exports/<job_id>', methods=['GET'])
+@admin_required
+def get_catalog_export_status(job_id):
+    job = get_job(job_id, kind=CATALOG_EXPORT_JOB)
+    if not job:
+        return jsonify({"error": "Export job not found"}), 404
+    return jsonify(job.to_dict()), 200
 
-    # Delete original files AFTER successful DB commit
-    deleted_originals_count = 0
-    for original_path in original_files_to_delete:
-        if delete_file(original_path):
-            deleted_originals_count += 1
+@admin_bp.route('/catalog-exports/<job_id>/download', methods=['GET'])
+@admin_required
+def download_catalog_export(job_id):
+    job = get_job(job_id, kind=CATALOG_EXPORT_JOB)
+    if not job or job.status != JobStatus.SUCCEEDED:
+        return jsonify({"error": "Export not found or not finished"}), 404
+    archive_path = _catalog_export_path(job.id)
+    if not archive_path.is_file():
+        return jsonify({"error": "Export file is no longer available"}), 410
+    download_name = f"catalog-{job.created_at.strftime('%Y%m%d-%H%M%S')}.zip"
+    return send_file(archive_path, mimetype='application/zip', as_attachment=True, download_name=download_name)
 
-    message = f"Compression complete for game '{game.name}'. Processed: {processed_count}, Converted to JPG: {converted_count}, Failed: {failed_count}."
-    if deleted_originals_count > 0:
-        message += f" Deleted {deleted_originals_count} original non-JPG files."
-    current_app.logger.info(message)
-    return jsonify({"message": message, "processed": processed_count, "converted": converted_count, "failed": failed_count, "deleted_originals": deleted_originals_count}), 200
+# --- Orphaned Upload Collection ---
+
+UPLOAD_GC_JOB = 'upload_gc'
+
+def _run_upload_gc(job, dry_run, grace_seconds) -> dict:
+    """Job body: scans the image folders for unreferenced files and (unless dry_run) deletes expired ones."""
+    job.update(message="Scanning uploads")
+
+    def report_progress(done, total):
+        job.update(message=f"Deleting orphans ({done}/{total})", deleted=done, total=total)
+
+    return collect_orphaned_uploads(dry_run=dry_run, grace_seconds=grace_seconds, progress=report_progress)
+
+@admin_bp.route('/uploads/gc', methods=['POST'])
+@admin_required
+def start_upload_gc():
+    """
+    Starts a background scan for uploads no game, room or entity references.
+    JSON body (optional): {"dry_run": true, "grace_seconds": N}. Dry runs (the default) only
+    report; otherwise orphans older than the grace period are deleted.
+    Returns 202 with the job; poll /api/admin/uploads/gc/<job_id> for the report.
+    """
+    data = request.get_json(silent=True) or {}
+    dry_run = data.get('dry_run', True) is not False
+    grace_seconds = data.get('grace_seconds')
+    if grace_seconds is not None and (not isinstance(grace_seconds, int) or grace_seconds < 0):
+        return jsonify({"error": "'grace_seconds' must be a non-negative integer"}), 400
+
+    job = submit_job(UPLOAD_GC_JOB, _run_upload_gc, dry_run, grace_seconds, owner_id=current_user.id)
+    response = job.to_dict()
+    response['status_url'] = f"/api/admin/uploads/gc/{job.id}"
+    return jsonify(response), 202
+
+@admin_bp.route('/uploads/gc/<job_id>', methods=['GET'])
+@admin_required
+def get_upload_gc_status(job_id):
+    """Returns the status and, when finished, the orphan report of an upload GC job."""
+    job = get_job(job_id, kind=UPLOAD_GC_JOB)
+    if not job:
+        return jsonify({"error": "Upload GC job not found"}), 404
+    return jsonify(job.to_dict()), 200
@@ -1,5 +1,6 @@
 # /server/api/conversations.py
 from flask import Blueprint, request, jsonify
+from sqlalchemy import select
 from sqlalchemy.exc import IntegrityError
 from flask_login import login_required, current_user
 import uuid
@@ -7,10 +8,14 @@ import uuid
 from decorators import admin_required
 from app import db
 from models import Game, Conversation, Entity, EntityType
+from list_query import list_response, search_filter
 
 # Create a Blueprint for conversation routes
 conversations_bp = Blueprint('conversations_bp', __name__)
 
+# Fields a conversation list can be projected to (?fields=id,name skips the structures)
+CONVERSATION_LIST_FIELDS = ('id', 'game_id', 'name', 'structure')
+
 # --- Helper Functions ---
 
 def serialize_conversation(conversation):
@@ -75,14 +80,19 @@ def create_conversation(game_id):
 @conversations_bp.route('/games/<uuid:game_id>/conversations', methods=['GET'])
 @admin_required # Only admins need the full list for the editor
 def list_conversations_for_game(game_id):
-    """Lists all conversations for a specific game."""
+    """
+    Lists the conversations of a game by name. Filter: q (name contains).
+    Supports the paging and projection parameters of list_query.list_response.
+    """
     game = db.session.get(Game, game_id)
     if not game:
         return jsonify({"error": "Game not found"}), 404
 
     try:
-        conversations = Conversation.query.filter_by(game_id=game_id).order_by(Conversation.name).all()
-        return jsonify([serialize_conversation(conv) for conv in conversations]), 200
+        query = select(Conversation).where(Conversation.game_id == game_id)
+        if request.args.get('q'):
+            query = query.where(search_filter(Conversation.name, request.args['q']))
+        return list_response(query, Conversation, Conversation.name, serialize_conversation, CONVERSATION_LIST_FIELDS)
     except Exception as e:
         print(f"Error fetching conversations for game {game_id}: {e}")
         return jsonify({"error": "Failed to retrieve conversations"}), 500
@@ -1,15 +1,25 @@
 from flask import Blueprint, request, jsonify
+import json
+from types import SimpleNamespace
+from sqlalchemy import select, insert, update, delete, func
 from sqlalchemy.exc import IntegrityError
 import uuid
 
 from app import db
-from models import Game, Room, Entity, EntityType, Conversation
+from models import Game, Room, Entity, EntityType, Conversation, Connection
 from flask_login import login_required, current_user
 from decorators import admin_required
+from list_query import list_response, request_flag, search_filter, presence_filter
+from storage_stats import serialized_row_size, apply_storage_deltas, refresh_image_storage, TABLE_SIZE_COLUMNS
 
 # Create a Blueprint for entity routes
 entities_bp = Blueprint('entities_bp', __name__)
 
+# Fields an entity list can be projected to (?fields=...)
+ENTITY_LIST_FIELDS = ('id', 'game_id', 'room_id', 'container_id', 'type', 'name', 'description', 'is_takable',
+                      'is_container', 'conversation_id', 'image_path', 'is_mobile', 'pickup_message')
+MAX_BATCH_OPERATIONS = 5000 # Operations per batch request
+
 # --- Helper Functions ---
 
 def serialize_entity(entity):
@@ -137,15 +147,36 @@ def create_entity(game_id):
 @entities_bp.route('/games/<uuid:game_id>/entities', methods=['GET'])
 @login_required # Only admins need the full list for editing
 def list_entities_for_game(game_id):
-    """Lists all entities for a specific game."""
+    """
+    Lists the entities of a game by name. Filters: q (name contains), type (ITEM/NPC),
+    room_id, container_id, has_image. Supports the paging and projection parameters of
+    list_query.list_response.
+    """
     game = db.session.get(Game, game_id)
     if not game:
         return jsonify({"error": "Game not found"}), 404
 
+    query = select(Entity).where(Entity.game_id == game_id)
+    if request.args.get('q'):
+        query = query.where(search_filter(Entity.name, request.args['q']))
+    if request.args.get('type'):
+        entity_type_str = request.args['type'].upper()
+        if entity_type_str not in EntityType.__members__:
+            valid_types = ", ".join(EntityType.__members__.keys())
+            return jsonify({"error": f"Invalid entity type. Valid types: {valid_types}"}), 400
+        query = query.where(Entity.type == EntityType[entity_type_str])
+    for param, column in (('room_id', Entity.room_id), ('container_id', Entity.container_id)):
+        if request.args.get(param):
+            try:
+                query = query.where(column == uuid.UUID(request.args[param]))
+            except ValueError:
+                return jsonify({"error": f"Invalid '{param}' format"}), 400
+    has_image = request_flag('has_image')
+    if has_image is not None:
+        query = query.where(presence_filter(Entity.image_path, has_image))
+
     try:
-        # Add filtering later (e.g., by room_id, type) if needed
-        entities = Entity.query.filter_by(game_id=game_id).order_by(Entity.name).all()
-        return jsonify([serialize_entity(entity) for entity in entities]), 200
+        return list_response(query, Entity, Entity.name, serialize_entity, ENTITY_LIST_FIELDS)
     except Exception as e:
         print(f"Error fetching entities for game {game_id}: {e}")
         return jsonify({"error": "Failed to retrieve entities"}), 500
@@ -306,3 +337,312 @@ def delete_entity(entity_id):
         print(f"Error deleting entity {entity_id}: {e}")
         # Consider potential foreign key constraint errors if other tables reference entities
         return jsonify({"error": "Failed to delete entity"}), 500
+
+
+# --- Batch Operations ---
+# The batch endpoint works on plain row dicts (column -> value) instead of ORM objects:
+# every reference is resolved up front with one IN query per table, the resulting state is
+# checked in memory, and the changes are written with bulk statements.
+
+def _entity_row(entity) -> dict:
+    return {column: getattr(entity, column) for column in ENTITY_LIST_FIELDS}
+
+def _row_size(row: dict) -> int:
+    """Size of the row's JSON-lines record, as counted in the storage stats."""
+    return serialized_row_size(Entity.to_dict(SimpleNamespace(**row)))
+
+def _batch_uuid(value, field: str) -> uuid.UUID:
+    try:
+        return uuid.UUID(str(value))
+    except ValueError:
+        raise ValueError(f"Invalid '{field}' format")
+
+def _batch_text(value, field: str) -> str:
+    if not isinstance(value, str):
+        raise ValueError(f"'{field}' must be a string")
+    return value.strip()
+
+def _batch_optional_text(value, field: str) -> str | None:
+    """A string field that may be null; empty strings are stored as None."""
+    if value is None:
+        return None
+    return _batch_text(value, field) or None
+
+def _batch_type(value) -> EntityType:
+    entity_type_str = value.upper() if isinstance(value, str) else ''
+    if entity_type_str not in EntityType.__members__:
+        valid_types = ", ".join(EntityType.__members__.keys())
+        raise ValueError(f"Invalid or missing entity type. Valid types: {valid_types}")
+    return EntityType[entity_type_str]
+
+def _batch_reference(value, field: str, owners: dict, game_id, label: str) -> uuid.UUID:
+    """Checks a room or conversation id against {id: game_id} from the IN query."""
+    reference_id = _batch_uuid(value, field)
+    if reference_id not in owners:
+        raise ValueError(f"Target {label} not found")
+    if owners[reference_id] != game_id:
+        raise ValueError(f"Cannot use a {label} from a different game")
+    return reference_id
+
+def _batch_create_row(game_id, entity_id, op: dict, rooms: dict, conversations: dict) -> dict:
+    """The new entity's row, with the rules of create_entity."""
+    entity_type = _batch_type(op.get('type'))
+    if op.get('room_id') and op.get('container_id'):
+        raise ValueError("Entity cannot be placed in a room and a container simultaneously")
+    if op.get('conversation_id') and entity_type != EntityType.NPC:
+        raise ValueError("Conversations can only be linked to NPCs")
+    pickup_message = _batch_optional_text(op.get('pickup_message'), 'pickup_message')
+    return {
+        'id': entity_id,
+        'game_id': game_id,
+        'room_id': _batch_reference(op['room_id'], 'room_id', rooms, game_id, 'room') if op.get('room_id') else None,
+        'container_id': _batch_uuid(op['container_id'], 'container_id') if op.get('container_id') else None,
+        'type': entity_type,
+        'name': _batch_text(op.get('name', 'Unnamed Entity'), 'name') or 'Unnamed Entity',
+        'description': _batch_text(op.get('description', ''), 'description'),
+        'is_takable': bool(op.get('is_takable', False)),
+        'is_container': bool(op.get('is_container', False)),
+        'conversation_id': _batch_reference(op['conversation_id'], 'conversation_id', conversations, game_id,
+                                            'conversation') if op.get('conversation_id') else None,
+        'image_path': _batch_optional_text(op.get('image_path'), 'image_path'),
+        'is_mobile': bool(op.get('is_mobile', False)) and entity_type == EntityType.NPC,
+        'pickup_message': pickup_message if entity_type == EntityType.ITEM and pickup_message else None,
+    }
+
+def _batch_update_row(row: dict, op: dict, rooms: dict, conversations: dict) -> dict:
+    """A copy of row with op applied, with the rules of update_entity."""
+    row = dict(row)
+    op = dict(op)
+    game_id = row['game_id']
+    if 'name' in op:
+        row['name'] = _batch_text(op['name'], 'name') or 'Unnamed Entity'
+    if 'description' in op:
+        row['description'] = _batch_text(op['description'], 'description')
+    if 'pickup_message' in op:
+        pickup_message = _batch_optional_text(op['pickup_message'], 'pickup_message')
+        row['pickup_message'] = pickup_message if pickup_message and row['type'] == EntityType.ITEM else None
+    if 'type' in op:
+        row['type'] = _batch_type(op['type'])
+        if row['type'] != EntityType.ITEM:
+            op['is_takable'] = False
+            op['is_container'] = False
+            row['pickup_message'] = None
+            row['is_mobile'] = False
+    if 'room_id' in op:
+        row['room_id'] = _batch_reference(op['room_id'], 'room_id', rooms, game_id, 'room') if op['room_id'] else None
+        row['container_id'] = None
+    if 'container_id' in op:
+        row['container_id'] = _batch_uuid(op['container_id'], 'container_id') if op['container_id'] else None
+        if row['container_id']:
+            row['room_id'] = None
+    if 'conversation_id' in op:
+        if row['type'] != EntityType.NPC or not op['conversation_id']:
+            row['conversation_id'] = None
+        else:
+            row['conversation_id'] = _batch_reference(op['conversation_id'], 'conversation_id', conversations,
+                                                      game_id, 'conversation')
+    if 'image_path' in op:
+        row['image_path'] = _batch_optional_text(op['image_path'], 'image_path')
+    if 'is_mobile' in op:
+        row['is_mobile'] = bool(op['is_mobile']) and row['type'] == EntityType.NPC
+    if 'is_takable' in op:
+        row['is_takable'] = bool(op['is_takable']) and row['type'] == EntityType.ITEM
+        if not row['is_takable']:
+            row['pickup_message'] = None
+    if 'is_container' in op:
+        row['is_container'] = bool(op['is_container']) and row['type'] == EntityType.ITEM
+    return row
+
+def _load_entity_rows(entity_ids) -> dict:
+    """{id: row} for the given ids, in one IN query."""
+    if not entity_ids:
+        return {}
+    return {entity.id: _entity_row(entity) for entity in db.session.scalars(
+        select(Entity).where(Entity.id.in_(list(entity_ids))))}
+
+def _container_error(entity_id, row: dict, state, removed) -> str | None:
+    """Checks the container of a created or updated entity against the state after the batch."""
+    container = state(row['container_id'])
+    if container is None:
+        return "Target container entity not found"
+    if container['game_id'] != row['game_id']:
+        return "Cannot place entity in a container from a different game"
+    if row['container_id'] in removed:
+        return "Target container is deleted in this batch"
+    if not container['is_container']:
+        return "Target entity is not a container"
+    seen = set()
+    current = row['container_id']
+    while current is not None and current not in seen:
+        if current == entity_id:
+            return "Entity cannot be placed inside itself or one of its contents"
+        seen.add(current)
+        current = state(current)['container_id'] if state(current) else None
+    return None
+
+@entities_bp.route('/games/<uuid:game_id>/entities/batch', methods=['POST'])
+@admin_required # Only admins can edit entities
+def batch_entities(game_id):
+    """
+    Creates, updates and deletes many entities of a game in one request. The body is a list
+    of operations (or {"operations": [...]}):
+        {"op": "create", "id"?: uuid, ...fields}    an id chosen by the client may be used
+                                                    as container_id by other operations
+        {"op": "update", "id": uuid, ...fields}
+        {"op": "delete", "id": uuid}                contents of a deleted container go too
+    Fields and rules are those of create_entity and update_entity. Every operation is
+    validated first; if any fails, nothing is written and the per-item results say why.
+    Otherwise everything is written in one transaction.
+    """
+    game = db.session.get(Game, game_id)
+    if not game:
+        return jsonify({"error": "Game not found"}), 404
+
+    data = request.get_json(silent=True)
+    operations = data.get('operations') if isinstance(data, dict) else data
+    if not isinstance(operations, list) or not all(isinstance(op, dict) for op in operations):
+        return jsonify({"error": "Request body must be a list of entity operations"}), 400
+    if len(operations) > MAX_BATCH_OPERATIONS:
+        return jsonify({"error": f"At most {MAX_BATCH_OPERATIONS} operations can be sent at once"}), 400
+
+    # Target ids, and every room, container and conversation id referenced
+    errors, targets, seen_ids = {}, {}, set()
+    referenced = {'room_id': set(), 'container_id': set(), 'conversation_id': set()}
+    for index, op in enumerate(operations):
+        try:
+            if op.get('op') not in ('create', 'update', 'delete'):
+                raise ValueError("'op' must be 'create', 'update' or 'delete'")
+            if op['op'] != 'create' and not op.get('id'):
+                raise ValueError("'id' is required")
+            entity_id = _batch_uuid(op['id'], 'id') if op.get('id') else uuid.uuid4()
+            if entity_id in seen_ids:
+                raise ValueError(f"Entity {entity_id} appears more than once")
+            seen_ids.add(entity_id)
+            targets[index] = entity_id
+        except ValueError as e:
+            errors[index] = str(e)
+        for field, ids in referenced.items():
+            try:
+                if op.get(field):
+                    ids.add(uuid.UUID(str(op[field])))
+            except ValueError:
+                pass # Reported when the operation is applied
+
+    rooms = dict(db.session.execute(select(Room.id, Room.game_id).where(
+        Room.id.in_(list(referenced['room_id'])))).all()) if referenced['room_id'] else {}
+    conversations = dict(db.session.execute(select(Conversation.id, Conversation.game_id).where(
+        Conversation.id.in_(list(referenced['conversation_id'])))).all()) if referenced['conversation_id'] else {}
+    known = _load_entity_rows(seen_ids | referenced['container_id'])
+
+    # The state after the batch: created and updated rows, and the deleted ids
+    final, deleted = {}, set()
+    for index, op in enumerate(operations):
+        if index in errors:
+            continue
+        entity_id = targets[index]
+        existing = known.get(entity_id)
+        try:
+            if op['op'] == 'create':
+                if existing is not None:
+                    raise ValueError(f"Entity {entity_id} already exists")
+                final[entity_id] = _batch_create_row(game_id, entity_id, op, rooms, conversations)
+            elif existing is None or existing['game_id'] != game_id:
+                raise ValueError("Entity not found in this game")
+            elif op['op'] == 'update':
+                final[entity_id] = _batch_update_row(existing, op, rooms, conversations)
+            else:
+                deleted.add(entity_id)
+        except ValueError as e:
+            errors[index] = str(e)
+
+    def state(entity_id):
+        return final.get(entity_id) or known.get(entity_id)
+
+    # Load the container chains above the batch's entities, one level per query
+    while True:
+        missing = {row['container_id'] for row in list(final.values()) + list(known.values())
+                   if row['container_id'] and state(row['container_id']) is None and row['container_id'] not in deleted}
+        loaded = _load_entity_rows(missing - known.keys())
+        if not loaded:
+            break
+        known.update(loaded)
+
+    # Contents of deleted containers are deleted with them, unless the batch moves them out
+    cascaded, frontier = {}, set(deleted)
+    while frontier:
+        children = db.session.scalars(select(Entity).where(
+            Entity.container_id.in_(list(frontier)), Entity.id.notin_(list(deleted | cascaded.keys()))))
+        frontier = set()
+        for child in children:
+            if child.id not in final:
+                cascaded[child.id] = _entity_row(child)
+                frontier.add(child.id)
+    removed = {entity_id: known[entity_id] for entity_id in deleted} | cascaded
+
+    for index, entity_id in targets.items():
+        if index not in errors and entity_id in final and final[entity_id]['container_id']:
+            error = _container_error(entity_id, final[entity_id], state, removed.keys())
+            if error:
+                errors[index] = error
+
+    if errors:
+        results = [{'index': index, 'op': op.get('op'), 'status': 'error' if index in errors else 'valid',
+                    **({'error': errors[index]} if index in errors else {})} for index, op in enumerate(operations)]
+        return jsonify({"error": f"No changes were made: {len(errors)} operation(s) failed", "results": results}), 400
+
+    created = {entity_id: row for entity_id, row in final.items() if entity_id not in known}
+    changes = {}
+    for entity_id, row in final.items():
+        if entity_id in known:
+            values = {key: value for key, value in row.items() if value != known[entity_id][key]}
+            if values:
+                changes[entity_id] = values
+
+    def depth(row):
+        # Containers created in the batch are inserted before their contents
+        return 1 + depth(created[row['container_id']]) if row['container_id'] in created else 0
+
+    try:
+        if created:
+            db.session.execute(insert(Entity), sorted(created.values(), key=depth))
+        if changes:
+            db.session.execute(update(Entity), [{'id': entity_id, **values} for entity_id, values in changes.items()])
+        if removed:
+            removed_ids = list(removed)
+            # Locked connections lose their key, as when an entity is deleted on its own
+            key_references = db.session.execute(
+                select(Room.game_id, func.count()).select_from(Connection).join(Room, Connection.from_room_id == Room.id)
+                .where(Connection.required_key_id.in_(removed_ids)).group_by(Room.game_id)).all()
+            db.session.execute(update(Connection).where(Connection.required_key_id.in_(removed_ids))
+                               .values(required_key_id=None), execution_options={'synchronize_session': False})
+            db.session.execute(delete(Entity).where(Entity.id.in_(removed_ids)),
+                               execution_options={'synchronize_session': False})
+            key_delta = len('null') - len(json.dumps(str(uuid.uuid4())))
+            for connection_game_id, count in key_references:
+                apply_storage_deltas(connection_game_id, {TABLE_SIZE_COLUMNS[Connection]: count * key_delta})
+
+        # Bulk statements bypass the storage listeners
+        size_delta = (sum(_row_size(row) for row in created.values())
+                      + sum(_row_size(final[entity_id]) - _row_size(known[entity_id]) for entity_id in changes)
+                      - sum(_row_size(row) for row in removed.values()))
+        apply_storage_deltas(game_id, {TABLE_SIZE_COLUMNS[Entity]: size_delta})
+        if (any(row['image_path'] for row in list(created.values()) + list(removed.values()))
+                or any('image_path' in values for values in changes.values())):
+            refresh_image_storage(game_id, commit=False)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error applying entity batch for game {game_id}: {e}")
+        return jsonify({"error": "Failed to apply entity operations"}), 500
+
+    results = []
+    for index, op in enumerate(operations):
+        entity_id = targets[index]
+        if op['op'] == 'delete':
+            results.append({'index': index, 'op': 'delete', 'id': str(entity_id), 'status': 'deleted'})
+        else:
+            results.append({'index': index, 'op': op['op'], 'id': str(entity_id),
+                            'status': 'created' if op['op'] == 'create' else 'updated',
+                            'entity': serialize_entity(SimpleNamespace(**final[entity_id]))})
+    return jsonify({"results": results, "created": len(created), "updated": len(changes),
+                    "deleted": len(deleted), "cascaded": [str(entity_id) for entity_id in cascaded]}), 200
@@ -1,12 +1,19 @@
 # /server/api/files.py
 import os
 import uuid
+import zipfile
 from flask import Blueprint, request, jsonify, send_from_directory, current_app
 from flask_login import login_required, current_user
 from urllib.parse import unquote
-from pathlib import Path
+from pathlib import Path, PurePosixPath
 from werkzeug.utils import secure_filename, safe_join
 from decorators import admin_required
+from image_utils import image_storage_name, sharded_image_folders
+from storage_stats import adjust_for_file_change
+from image_ingest import INGEST_JOB, ingest_filename, start_ingest, ingest_batch, forget_image_metadata, move_image_metadata
+from upload_storage import get_upload_storage
+from upload_index import index_path, remove_from_index, move_in_index, reconcile_directory, reconcile_tree, query_index
+from jobs import get_job
 import re # Import regular expressions
 
 # Define the path to the uploads folder relative to the client folder
@@ -26,6 +33,8 @@ ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'txt', 'json', 'md', 'pdf', '
 
 IMAGE_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp', 'svg', 'ico', 'bmp'} # Specific image types
 
+MAX_PER_PAGE = 500
+
 files_bp = Blueprint('files_bp', __name__)
 
 def allowed_file(filename):
@@ -85,6 +94,41 @@ def get_safe_path(base_path, requested_path=''):
         current_app.logger.warning(f"Potential directory traversal attempt: Base='{base_path}', Requested='{requested_path}', Resolved='{full_path}'")
         return None
 
+def _relative_upload_path(path: Path) -> str:
+    """Path relative to UPLOAD_FOLDER with forward slashes ('' for the folder itself)."""
+    relative_path = path.relative_to(Path(UPLOAD_FOLDER).resolve()).as_posix()
+    return '' if relative_path == '.' else relative_path
+
+def _upload_dir(relative_dir: str) -> Path | None:
+    """
+    Safe absolute path of an existing upload folder, or None. With uploads in a bucket the
+    folder may only exist there; it is then created in the local cache.
+    """
+    dir_path = get_safe_path(UPLOAD_FOLDER, relative_dir)
+    if dir_path is None:
+        return None
+    if dir_path.is_dir():
+        return dir_path
+    storage = get_upload_storage()
+    if not storage.remote or storage.stat(_relative_upload_path(dir_path)) != ('dir', None):
+        return None
+    dir_path.mkdir(parents=True, exist_ok=True)
+    return dir_path
+
+def _storage_target(target_dir_path: Path, filename: str) -> tuple[Path, str]:
+    """
+    Where a new upload named filename goes in target_dir_path: (absolute path, stored name).
+    In a sharded image folder the name includes the hash-prefix subfolders, which are created.
+    """
+    stored_name = image_storage_name(filename, _relative_upload_path(target_dir_path))
+    filepath = target_dir_path / stored_name
+    if stored_name != filename:
+        filepath.parent.mkdir(parents=True, exist_ok=True)
+        shard_dir = _relative_upload_path(filepath.parent)
+        index_path(shard_dir.rpartition('/')[0], commit=False)
+        index_path(shard_dir, commit=False)
+    return filepath, stored_name
+
 # --- API Endpoints ---
 
 @files_bp.route('/files', methods=['GET'])
@@ -92,48 +136,55 @@ def get_safe_path(base_path, requested_path=''):
 def list_files():
     """
     Lists files and directories within a specified path inside the UPLOAD_FOLDER.
-    Accepts an optional 'path' query parameter for the subdirectory.
+    Accepts an optional 'path' query parameter for the subdirectory, 'recursive=true' to
+    search the whole subtree, and the filter/sort/pagination parameters of _index_listing.
     """
     requested_path = request.args.get('path', '').strip('/') # Get subdirectory path, remove leading/trailing slashes
 
     # Get the safe, absolute path for the requested directory
-    target_dir_path = get_safe_path(UPLOAD_FOLDER, requested_path)
+    target_dir_path = _upload_dir(requested_path)
 
-    if target_dir_path is None or not target_dir_path.is_dir():
+    if target_dir_path is None:
         # Path was unsafe or doesn't exist/isn't a directory
         return jsonify({"error": "Invalid or inaccessible path"}), 400
 
     try:
-        items = []
-        for entry in target_dir_path.iterdir():
-            # Calculate relative path for URL generation
-            relative_path = entry.relative_to(Path(UPLOAD_FOLDER).resolve()) # Path relative to UPLOAD_FOLDER root
-            # Convert to forward slashes for URL consistency
-            url_path = str(relative_path).replace(os.sep, '/')
-
-            if entry.is_dir():
-                items.append({
-                    'name': entry.name,
-                    'type': 'directory',
-                    'path': url_path # Path relative to UPLOAD_FOLDER
-                })
-            elif entry.is_file():
-                # Get file size
-                file_size = entry.stat().st_size
-                items.append({
-                    'name': entry.name,
-                    'type': 'file',
-                    'url': f'/uploads/{url_path}', # URL to access the file
-                    'path': url_path, # Path relative to UPLOAD_FOLDER
-                    'size': file_size # Add file size in bytes
-                })
-        # Sort directories first, then files, alphabetically
-        items.sort(key=lambda x: (x['type'] != 'directory', x['name'].lower()))
-        return jsonify(items), 200
+        # The listing comes from the upload index; an unchanged directory costs one stat to verify
+        relative_dir = _relative_upload_path(target_dir_path)
+        recursive = request.args.get('recursive') == 'true'
+        if recursive:
+            reconcile_tree(relative_dir)
+        else:
+            reconcile_directory(relative_dir)
+        return _index_listing(relative_dir, recursive=recursive)
     except Exception as e:
         current_app.logger.error(f"Error listing files in {target_dir_path}: {e}")
         return jsonify({"error": "Failed to list files"}), 500
 
+def _index_listing(relative_dir: str, files_only: bool = False, extensions=None, recursive: bool = False, as_names: bool = False):
+    """
+    Serves a listing from the upload index. Query parameters: q (name contains), prefix
+    (name starts with), sort (name, size or mtime), order (asc or desc). Without 'page' or
+    'per_page' the full list is returned as before; with them the response is
+    {items, total, page, per_page}.
+    """
+    paginated = 'page' in request.args or 'per_page' in request.args
+    try:
+        page = max(int(request.args.get('page', 1)), 1)
+        per_page = min(max(int(request.args.get('per_page', 100)), 1), MAX_PER_PAGE)
+    except ValueError:
+        return jsonify({"error": "'page' and 'per_page' must be numbers"}), 400
+    entries, total = query_index(relative_dir, recursive=recursive, files_only=files_only, extensions=extensions,
+                                 search=request.args.get('q'), prefix=request.args.get('prefix'),
+                                 sort=request.args.get('sort', 'name'), descending=request.args.get('order') == 'desc',
+                                 page=page if paginated else None, per_page=per_page if paginated else None)
+    if not paginated:
+        if as_names: # Relative to the listed folder ('6c/0f/hal.jpg' in a sharded one)
+            return jsonify([entry.path[len(relative_dir) + 1:] if relative_dir else entry.path for entry in entries]), 200
+        return jsonify([entry.to_dict() for entry in entries]), 200
+    return jsonify({"items": [entry.to_dict() for entry in entries], "total": total,
+                    "page": page, "per_page": per_page}), 200
+
 @files_bp.route('/files/folder', methods=['POST'])
 @admin_required # Only admins can create folders
 def create_folder():
@@ -154,15 +205,16 @@ def create_folder():
     # Use the original folder_name which allows spaces
 
     # Get the safe, absolute path for the parent directory where the new folder will be created
-    parent_dir_path = get_safe_path(UPLOAD_FOLDER, target_subdir)
+    parent_dir_path = _upload_dir(target_subdir)
 
-    if parent_dir_path is None or not parent_dir_path.is_dir():
+    if parent_dir_path is None:
         return jsonify({"error": "Invalid or inaccessible target path"}), 400
 
     new_folder_path = parent_dir_path / folder_name # Use original name
     try:
-        new_folder_path.mkdir(exist_ok=False) # Create directory, error if exists
+        get_upload_storage().make_dir(_relative_upload_path(new_folder_path)) # Error if it exists
         current_app.logger.info(f"Folder '{folder_name}' created successfully in {parent_dir_path}")
+        index_path(_relative_upload_path(new_folder_path))
         return jsonify({"message": "Folder created successfully", "folder_name": folder_name}), 201
     except FileExistsError:
         return jsonify({"error": f"Folder '{folder_name}' already exists"}), 409
@@ -192,19 +244,30 @@ def rename_item():
         return jsonify({"error": "Invalid new name provided"}), 400
 
     # Get the safe, absolute path for the item to be renamed
+    storage = get_upload_storage()
     item_path = get_safe_path(UPLOAD_FOLDER, current_path)
-    if item_path is None or not item_path.exists():
+    found = storage.stat(_relative_upload_path(item_path)) if item_path is not None else None
+    if found is None:
         return jsonify({"error": "Item not found or path is invalid"}), 404
+    current_path = _relative_upload_path(item_path)
 
     # Construct the new path
     new_item_path = item_path.parent / new_name # Use original new name
+    new_relative_path = _relative_upload_path(new_item_path)
 
-    if new_item_path.exists():
+    if storage.stat(new_relative_path) is not None:
         return jsonify({"error": f"An item named '{new_name}' already exists in this location"}), 409
 
     try:
-        item_path.rename(new_item_path)
+        old_size = found[1] if found[0] == 'file' else None
+        storage.move(current_path, new_relative_path)
         current_app.logger.info(f"Renamed '{item_path.name}' to '{new_name}' in {item_path.parent}")
+        move_image_metadata(current_path, new_relative_path, commit=False)
+        move_in_index(current_path, new_relative_path)
+        if old_size is not None:
+            # References to the old name now point at a missing file
+            adjust_for_file_change(current_path, old_size, None)
+            adjust_for_file_change(new_relative_path, None, old_size)
         return jsonify({"message": "Item renamed successfully", "new_name": new_name}), 200
     except Exception as e:
         current_app.logger.error(f"Error renaming item '{current_path}' to '{new_name}': {e}")
@@ -225,34 +288,171 @@ def upload_file():
 
     if file and allowed_file(file.filename):
         # Secure the filename to prevent directory traversal attacks
-        filename = secure_filename(file.filename)
+        # (normalized images are stored under their final extension right away)
+        filename = ingest_filename(secure_filename(file.filename))
         # Optional: Generate a unique filename to avoid overwrites
         # filename = f"{uuid.uuid4()}_{filename}"
 
         # Get the safe target directory path
-        target_dir_path = get_safe_path(UPLOAD_FOLDER, target_subdir)
-        if target_dir_path is None or not target_dir_path.is_dir():
+        target_dir_path = _upload_dir(target_subdir)
+        if target_dir_path is None:
             return jsonify({"error": "Invalid upload path specified"}), 400
 
-        filepath = target_dir_path / filename
+        filepath, filename = _storage_target(target_dir_path, filename)
         # Calculate relative path for URL
         relative_path = filepath.relative_to(Path(UPLOAD_FOLDER).resolve())
         url_path = str(relative_path).replace(os.sep, '/')
 
         try:
+            old_size = get_upload_storage().size(url_path)
             file.save(filepath)
+            get_upload_storage().push(url_path)
             current_app.logger.info(f"File '{filename}' uploaded successfully to {target_dir_path}")
-            return jsonify({
+            # Games already referencing this filename now include the new contents
+            adjust_for_file_change(url_path, old_size, filepath.stat().st_size)
+            response = {
                 "message": "File uploaded successfully",
                 "filename": filename,
                 "url": f'/uploads/{url_path}'
-            }), 201 # Created
+            }
+            index_path(url_path)
+            ingest = start_ingest(filepath, url_path, owner_id=current_user.id)
+            if isinstance(ingest, dict):
+                response["image"] = ingest
+            elif ingest is not None:
+                response["ingest_job_id"] = ingest.id
+                response["ingest_status_url"] = f"/api/files/ingest-jobs/{ingest.id}"
+            return jsonify(response), 201 # Created
         except Exception as e:
             current_app.logger.error(f"Error saving file '{filename}': {e}")
             return jsonify({"error": "Failed to save file"}), 500
     else:
         return jsonify({"error": "File type not allowed"}), 400
 
+def _extract_zip_entry(zip_file: zipfile.ZipFile, info: zipfile.ZipInfo, temp_path: Path, max_bytes: int) -> int:
+    """
+    Streams one entry to temp_path, counting the bytes actually inflated rather than trusting
+    the header (a ZIP bomb can under-report). Raises ValueError past max_bytes.
+    """
+    written = 0
+    with zip_file.open(info) as source, open(temp_path, 'wb') as target:
+        while True:
+            block = source.read(1024 * 1024)
+            if not block:
+                return written
+            written += len(block)
+            if written > max_bytes:
+                raise ValueError(f"Larger than {max_bytes} bytes")
+            target.write(block)
+
+@files_bp.route('/files/upload-zip', methods=['POST'])
+@admin_required
+def upload_zip():
+    """
+    Bulk image upload: extracts the images in a ZIP ('file') into the folder 'path' and runs
+    them through the ingest pipeline in parallel. Entries are stored under their secured base
+    name (folders inside the archive are flattened); entries that are not images, are too
+    large or repeat a name are skipped. Returns a manifest with one row per archive entry.
+    """
+    if 'file' not in request.files or request.files['file'].filename == '':
+        return jsonify({"error": "No ZIP file in the request"}), 400
+    target_subdir = request.form.get('path', '').strip('/')
+    target_dir_path = _upload_dir(target_subdir)
+    if target_dir_path is None:
+        return jsonify({"error": "Invalid upload path specified"}), 400
+
+    config = current_app.config
+    try:
+        zip_file = zipfile.ZipFile(request.files['file'].stream)
+    except zipfile.BadZipFile:
+        return jsonify({"error": "The file is not a valid ZIP archive"}), 400
+
+    manifest, batch, batch_rows, seen_names = [], [], [], set()
+    total_bytes = 0
+    with zip_file:
+        file_infos = [info for info in zip_file.infolist() if not info.is_dir()]
+        if len(file_infos) > config['BULK_UPLOAD_MAX_FILES']:
+            return jsonify({"error": f"The archive holds more than {config['BULK_UPLOAD_MAX_FILES']} files"}), 400
+
+        for info in file_infos:
+            entry_path = PurePosixPath(info.filename.replace('\\', '/'))
+            row = {"entry": info.filename, "status": "skipped"}
+            manifest.append(row)
+            if entry_path.name.startswith('.') or '__MACOSX' in entry_path.parts:
+                row["error"] = "Hidden or metadata file"
+                continue
+            filename = ingest_filename(secure_filename(entry_path.name))
+            if not filename or not allowed_file(filename) or filename.rsplit('.', 1)[1].lower() not in IMAGE_EXTENSIONS:
+                row["error"] = "Not an allowed image type"
+                continue
+            if filename.lower() in seen_names:
+                row["error"] = f"Duplicate name '{filename}' in the archive"
+                continue
+            if info.flag_bits & 0x1:
+                row["error"] = "Encrypted entries are not supported"
+                continue
+            if info.file_size > config['BULK_UPLOAD_MAX_FILE_BYTES']:
+                row["error"] = f"Larger than {config['BULK_UPLOAD_MAX_FILE_BYTES']} bytes"
+                continue
+            if total_bytes + info.file_size > config['BULK_UPLOAD_MAX_TOTAL_BYTES']:
+                row["error"] = f"Archive exceeds {config['BULK_UPLOAD_MAX_TOTAL_BYTES']} bytes in total"
+                continue
+
+            target_path, stored_name = _storage_target(target_dir_path, filename)
+            temp_path = target_path.parent / f'.{filename}.{uuid.uuid4().hex}.tmp' # Hidden from listings until moved
+            try:
+                total_bytes += _extract_zip_entry(zip_file, info, temp_path, config['BULK_UPLOAD_MAX_FILE_BYTES'])
+            except (ValueError, zipfile.BadZipFile, NotImplementedError, OSError) as e:
+                temp_path.unlink(missing_ok=True)
+                row.update({"status": "error", "error": str(e)})
+                continue
+            seen_names.add(filename.lower())
+            relative_path = _relative_upload_path(target_path)
+            row.update({"filename": stored_name, "url": f'/uploads/{relative_path}'})
+            batch.append({"temp_path": temp_path, "target_path": target_path, "relative_path": relative_path,
+                          "old_size": get_upload_storage().size(relative_path)})
+            batch_rows.append(row)
+
+    for row, result in zip(batch_rows, ingest_batch(batch) if batch else []):
+        if 'error' in result:
+            row.pop("url")
+            row.update({"status": "error", "error": result['error']})
+        else:
+            row.update({"status": "ok", "width": result['width'], "height": result['height'],
+                        "byte_size": result['byte_size'], "original_byte_size": result['original_byte_size']})
+
+    counts = {status: sum(1 for row in manifest if row['status'] == status) for status in ('ok', 'error', 'skipped')}
+    current_app.logger.info(f"Bulk upload into '{target_subdir or '/'}': {counts['ok']} stored, "
+                            f"{counts['error']} failed, {counts['skipped']} skipped")
+    response = {"path": target_subdir, "files": manifest,
+                "ok_count": counts['ok'], "error_count": counts['error'], "skipped_count": counts['skipped']}
+    if not counts['ok']:
+        return jsonify({"error": "No images were stored", **response}), 400
+    return jsonify(response), 201
+
+@files_bp.route('/files/ingest-jobs/<job_id>', methods=['GET'])
+@admin_required
+def get_ingest_status(job_id):
+    """Status of an upload's ingest job; the result holds the recorded image metadata."""
+    job = get_job(job_id, kind=INGEST_JOB)
+    if not job:
+        return jsonify({"error": "Ingest job not found"}), 404
+    return jsonify(job.to_dict()), 200
+
+@files_bp.route('/files/index/reconcile', methods=['POST'])
+@admin_required
+def reconcile_upload_index():
+    """
+    Re-syncs the upload index with the whole uploads tree. Unchanged directories cost one
+    stat each; ?force=true re-lists every directory.
+    """
+    try:
+        totals = reconcile_tree(force=request.args.get('force') == 'true')
+    except Exception as e:
+        current_app.logger.error(f"Error reconciling upload index: {e}")
+        return jsonify({"error": "Failed to reconcile upload index"}), 500
+    return jsonify(totals), 200
+
 @files_bp.route('/files/<path:filename>', methods=['DELETE'])
 @admin_required # Only admins can delete files/folders
 def delete_item(filename):
@@ -265,23 +465,31 @@ def delete_item(filename):
     # Only allow deletion for authorized users.
     try:
         # Use get_safe_path to validate the full path to the item to be deleted
+        storage = get_upload_storage()
         item_path = get_safe_path(UPLOAD_FOLDER, filename.strip('/'))
         current_app.logger.info(f"Attempting to delete resolved path: '{item_path}'")
+        relative_path = _relative_upload_path(item_path) if item_path is not None else None
+        found = storage.stat(relative_path) if relative_path else None
 
         # Check if path resolution failed or item doesn't exist
-        if item_path is None or not item_path.exists():
+        if found is None:
             return jsonify({"error": "File or directory not found or path is invalid"}), 404
 
-        if item_path.is_file():
-            item_path.unlink() # Delete file
+        if found[0] == 'file':
+            old_size = found[1]
+            storage.delete(relative_path) # Delete file
             current_app.logger.info(f"File '{item_path.name}' deleted successfully from {item_path.parent}.")
+            forget_image_metadata(relative_path, commit=False)
+            remove_from_index(relative_path)
+            adjust_for_file_change(relative_path, old_size, None)
             return '', 204 # No Content
-        elif item_path.is_dir():
+        elif found[0] == 'dir':
             # Attempt to delete the directory
             try:
                 # Check if directory is empty *before* attempting to delete
-                if not any(item_path.iterdir()):
-                    item_path.rmdir()
+                if not any(storage.scan(relative_path)):
+                    storage.delete(relative_path)
+                    remove_from_index(relative_path)
                     current_app.logger.info(f"Empty directory '{item_path.name}' deleted successfully from {item_path.parent}.")
                     return '', 204 # No Content
                 else:
@@ -318,26 +526,22 @@ def list_images():
     # Get the safe, absolute path for the requested image subdirectory
     # Adjust path for 'adventure' type
     if image_type == 'adventure':
-        target_dir_path = get_safe_path(UPLOAD_FOLDER, 'avonturen')
+        target_dir_path = _upload_dir('avonturen')
     else:
-        target_dir_path = get_safe_path(UPLOAD_FOLDER, f'images/{subdir}')
+        target_dir_path = _upload_dir(f'images/{subdir}')
 
-    if target_dir_path is None or not target_dir_path.is_dir():
+    if target_dir_path is None:
         # Path was unsafe or doesn't exist/isn't a directory
         # Return empty list instead of error, as the folder might just not exist yet
         return jsonify([]), 200
 
     try:
-        image_files = []
-        for entry in target_dir_path.iterdir():
-            # Check if it's a file and has an image extension
-            # For 'adventure' type, we might allow more general image types if needed,
-            # but using IMAGE_EXTENSIONS is a safe default.
-            if entry.is_file() and entry.suffix.lower().lstrip('.') in IMAGE_EXTENSIONS:
-                image_files.append(entry.name) # Return only the filename
-        
-        image_files.sort() # Sort alphabetically
-        return jsonify(image_files), 200
+        relative_dir = 'avonturen' if image_type == 'adventure' else f'images/{subdir}'
+        reconcile_directory(relative_dir)
+        # Plain list of filenames, or entries with size and dimensions when paginated. Sharded folders
+        # are listed recursively; their shard subfolders are kept up to date by the upload endpoints
+        sharded = relative_dir in sharded_image_folders()
+        return _index_listing(relative_dir, files_only=True, extensions=IMAGE_EXTENSIONS, recursive=sharded, as_names=True)
     except Exception as e:
         current_app.logger.error(f"Error listing images in {subdir}: {e}")
         return jsonify({"error": "Failed to list images"}), 500
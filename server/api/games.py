@@ -1,22 +1,49 @@
 import os
 import io
 import json
+import hashlib
+import uuid
+import tempfile
 import zipfile
-from flask import Blueprint, jsonify, current_app, send_file, request
+from datetime import datetime
+from flask import Blueprint, jsonify, current_app, send_file, request, Response
 from flask_login import login_required, current_user
 from pathlib import Path
+from sqlalchemy import select, insert, update, delete, func
+from sqlalchemy.sql import sqltypes
 import humanize # For human-readable file sizes
 
 from app import db
-from models import Game, Room, Entity, Connection, Script, Conversation, UserRole
+from decorators import admin_required
+from api.rooms import serialize_room
+from api.entities import serialize_entity
+from api.scripts import serialize_script
+from models import Game, Room, Entity, Connection, Script, Conversation, SavedGame, UserRole
+from zip_utils import open_archive_entry, write_archive_bytes, write_archive_upload
+from upload_storage import get_upload_storage
+from list_query import list_response, search_filter
+from image_utils import SHARD_PATTERN, sharded_image_folders
+from storage_stats import (get_game_storage_stats, estimate_export_bytes, game_table_query, game_image_files,
+                           serialize_row_line, adjust_for_file_change, apply_storage_deltas, refresh_image_storage,
+                           SUBDIR_IMAGE_TYPES, TABLE_SIZE_COLUMNS)
 
 games_bp = Blueprint('games', __name__, url_prefix='/api/games')
 
+# Fields a game list can be projected to (?fields=...)
+GAME_LIST_FIELDS = ('id', 'name', 'created_at', 'updated_at', 'start_image_path', 'description',
+                    'win_image_path', 'loss_image_path', 'version', 'builder_version')
+
 @games_bp.route('/', methods=['GET'])
 @login_required
 def list_games():
-    games = Game.query.all()
-    return jsonify([game.to_dict() for game in games])
+    """
+    Lists the games by name. Filter: q (name contains). Supports the paging and projection
+    parameters of list_query.list_response.
+    """
+    query = select(Game)
+    if request.args.get('q'):
+        query = query.where(search_filter(Game.name, request.args['q']))
+    return list_response(query, Game, Game.name, Game.to_dict, GAME_LIST_FIELDS)
 
 @games_bp.route('/<uuid:game_id>', methods=['GET'])
 @login_required
@@ -26,6 +53,178 @@ def get_game(game_id):
         return jsonify({"error": "Game not found"}), 404
     return jsonify(game.to_dict())
 
+@games_bp.route('/<uuid:game_id>/editor', methods=['GET'])
+@admin_required
+def get_editor_bundle(game_id):
+    """
+    Everything the editor and graph view show for a game in one response: the game, rooms,
+    connections, entities, scripts and conversation summaries (id and name), with one query
+    per table. The ETag is the game's content revision, so an unchanged game answers a
+    conditional request with 304 after a single lookup.
+    """
+    # Read before the rows: an edit landing in between gives newer rows under an older tag, never the reverse
+    revision = db.session.scalar(select(Game.content_revision).where(Game.id == game_id))
+    if revision is None:
+        return jsonify({"error": "Game not found"}), 404
+    etag = f'{game_id}-{revision}'
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        game = db.session.get(Game, game_id)
+        connections = db.session.scalars(
+            select(Connection).join(Room, Connection.from_room_id == Room.id).where(Room.game_id == game_id))
+        response = jsonify({
+            'game': game.to_dict(),
+            'revision': revision,
+            'rooms': [serialize_room(room) for room in db.session.scalars(
+                select(Room).where(Room.game_id == game_id).order_by(Room.sort_index, Room.id))],
+            'connections': [connection.to_dict() for connection in connections],
+            'entities': [serialize_entity(entity) for entity in db.session.scalars(
+                select(Entity).where(Entity.game_id == game_id).order_by(Entity.name, Entity.id))],
+            'scripts': [serialize_script(script) for script in db.session.scalars(
+                select(Script).where(Script.game_id == game_id).order_by(Script.trigger, Script.id))],
+            'conversations': [{'id': str(conversation_id), 'name': name} for conversation_id, name in db.session.execute(
+                select(Conversation.id, Conversation.name).where(Conversation.game_id == game_id)
+                .order_by(Conversation.name, Conversation.id))],
+        })
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True # Revalidate every time; the 304 is cheap
+    return response
+
+# --- Game Archive Format ---
+# Version 2 archives hold one JSON-lines file per table so export and import can stream
+# rows instead of holding the whole game in memory:
+#   manifest.json             format marker, version and per-table row counts
+#   game.json                 the Game row
+#   <table>.jsonl             one to_dict() row per line, for each table in ARCHIVE_TABLES
+#   uploads/<subdir>/<file>   referenced images, at their path relative to the uploads folder
+# Version 1 archives (a single game_data.json plus images/...) can still be imported.
+
+ARCHIVE_FORMAT = 'adventurez-game'
+ARCHIVE_FORMAT_VERSION = 2
+ARCHIVE_IMAGE_PREFIX = 'uploads/'
+# Table name -> model, in foreign-key order for import
+ARCHIVE_TABLES = [
+    ('rooms', Room),
+    ('conversations', Conversation),
+    ('entities', Entity),
+    ('connections', Connection),
+    ('scripts', Script),
+]
+STREAM_BATCH_SIZE = 1000 # Rows fetched per round trip while exporting
+IMPORT_BATCH_SIZE = 1000 # Rows inserted per statement while importing
+
+class GameImportError(ValueError):
+    """Raised when an archive cannot be imported (bad format, invalid data)."""
+    status_code = 400
+
+class GameImportConflict(GameImportError):
+    """Raised when the archive's game already exists in this instance."""
+    status_code = 409
+
+def iter_table_rows(model, game_id):
+    """Yields the to_dict() rows of one of a game's tables from a streaming query."""
+    for obj in game_table_query(model, game_id).yield_per(STREAM_BATCH_SIZE):
+        yield obj.to_dict()
+
+def write_game_archive(zip_file: zipfile.ZipFile, game: Game, prefix: str = '',
+                       image_prefix: str = ARCHIVE_IMAGE_PREFIX, written_images: set = None) -> dict:
+    """
+    Writes a game in archive format v2 into an open ZipFile.
+
+    Args:
+        zip_file: The ZipFile to write to (opened in 'w' mode). Entries are stored or
+                  deflated per file type (see zip_utils).
+        game: The game to export.
+        prefix: Path prefix for the game's data files (e.g. 'games/<id>/' in multi-game archives).
+        image_prefix: Path prefix for image files.
+        written_images: Optional set of image arcnames already in the archive; images listed
+                        there are skipped and newly written ones are added (for deduplication).
+
+    Returns:
+        The manifest dict that was written.
+    """
+    manifest = {
+        "format": ARCHIVE_FORMAT,
+        "format_version": ARCHIVE_FORMAT_VERSION,
+        "builder_version": current_app.config.get('APP_VERSION'),
+        "exported_at": datetime.utcnow().isoformat() + 'Z',
+        "game_id": str(game.id),
+        "tables": {},
+    }
+    write_archive_bytes(zip_file, prefix + 'game.json', json.dumps(game.to_dict(), indent=2).encode('utf-8'))
+
+    for table_name, model in ARCHIVE_TABLES:
+        filename = f'{table_name}.jsonl'
+        row_count = 0
+        with open_archive_entry(zip_file, prefix + filename, force_zip64=True) as table_file:
+            for row in iter_table_rows(model, game.id):
+                table_file.write(serialize_row_line(row).encode('utf-8'))
+                row_count += 1
+        manifest["tables"][table_name] = {"file": filename, "rows": row_count}
+
+    # Add image files (each distinct file once)
+    written_images = written_images if written_images is not None else set()
+    images = []
+    for subdir, image_name in sorted(game_image_files(game.id)):
+        arcname = f'{image_prefix}{subdir}/{image_name}'
+        if arcname in written_images or write_archive_upload(zip_file, f'{subdir}/{image_name}', arcname):
+            written_images.add(arcname)
+            images.append(arcname) # Only files the archive holds, so the manifest matches it
+        else:
+            current_app.logger.warning(f"Export: Image file not found, skipping: {subdir}/{image_name}")
+    manifest["images"] = images
+
+    write_archive_bytes(zip_file, prefix + 'manifest.json', json.dumps(manifest, indent=2).encode('utf-8'))
+    return manifest
+
+CATALOG_FORMAT = 'adventurez-catalog'
+
+def write_catalog_archive(output, game_ids=None, progress=None) -> dict:
+    """
+    Streams several games into one archive. Each game is written in archive format v2 under
+    games/<game_id>/ (so import_game_archive(path, prefix='games/<id>/') restores it), and
+    images shared between games are stored once under uploads/. Games are loaded one at a
+    time, so memory stays bounded by the largest single game's batch, not the catalog.
+
+    Args:
+        output: Path or writable binary file object for the ZIP archive.
+        game_ids: Games to include; None exports every game.
+        progress: Optional callable progress(done, total, game, archive_bytes) after each game.
+
+    Returns:
+        The catalog dict written as catalog.json.
+    """
+    query = db.session.query(Game.id).order_by(Game.name)
+    if game_ids is not None:
+        query = query.filter(Game.id.in_(game_ids))
+    selected_ids = [game_id for (game_id,) in query]
+
+    catalog = {
+        "format": CATALOG_FORMAT,
+        "format_version": ARCHIVE_FORMAT_VERSION,
+        "builder_version": current_app.config.get('APP_VERSION'),
+        "exported_at": datetime.utcnow().isoformat() + 'Z',
+        "games": [],
+    }
+    written_images = set()
+    with zipfile.ZipFile(output, 'w') as zip_file:
+        for index, game_id in enumerate(selected_ids, start=1):
+            game = db.session.get(Game, game_id)
+            if game is None:
+                continue # Deleted while the export was running
+            prefix = f'games/{game_id}/'
+            manifest = write_game_archive(zip_file, game, prefix=prefix, written_images=written_images)
+            catalog["games"].append({"id": str(game_id), "name": game.name, "prefix": prefix,
+                                     "tables": manifest["tables"], "images": len(manifest["images"])})
+            if progress:
+                progress(index, len(selected_ids), game, zip_file.fp.tell() if zip_file.fp.seekable() else None)
+            db.session.expunge_all() # Do not accumulate the exported games in the session
+        catalog["image_files"] = len(written_images)
+        write_archive_bytes(zip_file, 'catalog.json', json.dumps(catalog, indent=2).encode('utf-8'))
+    return catalog
+
 @games_bp.route('/<uuid:game_id>/export', methods=['GET'])
 @login_required
 def export_game(game_id):
@@ -33,186 +232,465 @@ def export_game(game_id):
     if not game:
         return jsonify({"error": "Game not found"}), 404
 
-    # Fetch connections related to the game's rooms
-    connections = db.session.query(Connection)\
-        .join(Room, Connection.from_room_id == Room.id)\
-        .filter(Room.game_id == game_id)\
-        .all()
-
-    # Export game data
-    game_data = {
-        "game": game.to_dict(),
-        "rooms": [room.to_dict() for room in game.rooms],
-        "entities": [entity.to_dict() for entity in game.entities],
-        "connections": [connection.to_dict() for connection in connections],
-        "scripts": [script.to_dict() for script in game.scripts],
-        "conversations": [conversation.to_dict() for conversation in game.conversations]
-    }
+    # Build the archive in a temporary file rather than in memory; send_file streams it
+    # and closes (deletes) it when the response is done.
+    archive_file = tempfile.TemporaryFile()
+    try:
+        with zipfile.ZipFile(archive_file, 'w') as zip_file:
+            write_game_archive(zip_file, game)
+    except Exception as e:
+        archive_file.close()
+        current_app.logger.error(f"Error exporting game {game_id}: {e}", exc_info=True)
+        return jsonify({"error": f"Internal server error during export: {e}"}), 500
 
-    # Create a zip file
-    zip_buffer = io.BytesIO()
-    with zipfile.ZipFile(zip_buffer, 'w') as zip_file:
-        zip_file.writestr('game_data.json', json.dumps(game_data, indent=2))
-
-        # Add image files
-        upload_base_dir = Path(current_app.config['UPLOADS_FOLDER'])
-        if game.start_image_path:
-            zip_file.write(upload_base_dir / 'avonturen' / game.start_image_path, arcname=f'images/start_image.{game.start_image_path.split(".")[-1]}')
-        if game.win_image_path:
-            zip_file.write(upload_base_dir / 'avonturen' / game.win_image_path, arcname=f'images/win_image.{game.win_image_path.split(".")[-1]}')
-        if game.loss_image_path:
-            zip_file.write(upload_base_dir / 'avonturen' / game.loss_image_path, arcname=f'images/loss_image.{game.loss_image_path.split(".")[-1]}')
-
-        for room in game.rooms:
-            if room.image_path:
-                zip_file.write(upload_base_dir / 'images' / 'kamers' / room.image_path, arcname=f'images/rooms/{room.image_path}')
-
-        for entity in game.entities:
-            if entity.image_path:
-                zip_file.write(upload_base_dir / 'images' / 'entiteiten' / entity.image_path, arcname=f'images/entities/{entity.image_path}')
-
-    zip_buffer.seek(0)
+    archive_file.seek(0)
     return send_file(
-        zip_buffer,
+        archive_file,
         mimetype='application/zip',
         as_attachment=True,
         download_name=f'{game.name}.zip'
     )
 
-@games_bp.route('/import', methods=['POST'])
-@login_required
-def import_game():
+def _row_to_columns(model, row: dict) -> dict:
+    """Converts an exported to_dict() row back into column values for an INSERT."""
+    values = {}
+    for column in model.__table__.columns:
+        if column.key not in row:
+            continue
+        value = row[column.key]
+        if value is not None:
+            if isinstance(column.type, sqltypes.Uuid):
+                value = uuid.UUID(str(value))
+            elif isinstance(column.type, sqltypes.Enum) and column.type.enum_class:
+                value = column.type.enum_class(value)
+            elif isinstance(column.type, sqltypes.DateTime):
+                value = datetime.fromisoformat(value.rstrip('Z'))
+        values[column.key] = value
+    return values
+
+def _iter_jsonl_batches(zip_file: zipfile.ZipFile, name: str, batch_size: int = IMPORT_BATCH_SIZE):
+    """Reads a JSON-lines archive member incrementally, yielding lists of row dicts."""
+    if name not in zip_file.NameToInfo:
+        return
+    with zip_file.open(name) as raw_file, io.TextIOWrapper(raw_file, encoding='utf-8') as lines:
+        batch = []
+        for line in lines:
+            if line.strip():
+                batch.append(json.loads(line))
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+def _iter_list_batches(rows: list, batch_size: int = IMPORT_BATCH_SIZE):
+    for start in range(0, len(rows), batch_size):
+        yield rows[start:start + batch_size]
+
+def open_game_archive(zip_file: zipfile.ZipFile, prefix: str = ''):
+    """
+    Detects the archive version and returns (game_row, batches, image_names): batches(table_name)
+    yields lists of row dicts for that table, and image_names lists the archive members holding
+    the game's images (None for legacy archives, whose images are found by scanning).
+
+    Raises:
+        GameImportError: If the archive holds no recognizable game data.
+    """
+    names = zip_file.NameToInfo
+    if prefix + 'manifest.json' in names:
+        with zip_file.open(prefix + 'manifest.json') as manifest_file:
+            manifest = json.load(manifest_file)
+        if manifest.get('format') != ARCHIVE_FORMAT or manifest.get('format_version', 0) > ARCHIVE_FORMAT_VERSION:
+            raise GameImportError(f"Unsupported archive format: {manifest.get('format')} v{manifest.get('format_version')}")
+        with zip_file.open(prefix + 'game.json') as game_file:
+            game_row = json.load(game_file)
+        tables = manifest.get('tables', {})
+
+        def batches(table_name):
+            filename = tables.get(table_name, {}).get('file', f'{table_name}.jsonl')
+            return _iter_jsonl_batches(zip_file, prefix + filename)
+        return game_row, batches, manifest.get('images', [])
+
+    if prefix + 'game_data.json' in names:
+        # Legacy single-file format (version 1, or the store submission layout)
+        with zip_file.open(prefix + 'game_data.json') as game_data_file:
+            game_data = json.load(game_data_file)
+        game_row = game_data.get('game') or game_data.get('game_info')
+        if not game_row:
+            raise GameImportError("game_data.json does not contain game information")
+
+        def batches(table_name):
+            return _iter_list_batches(game_data.get(table_name) or [])
+        return game_row, batches, None
+
+    raise GameImportError("Archive contains neither manifest.json nor game_data.json")
+
+def _image_target_for_entry(arcname: str, game_row: dict, prefix: str = '') -> str | None:
+    """Maps an archive member to its destination path relative to the uploads folder."""
+    if not arcname.startswith(prefix) or arcname.endswith('/'):
+        return None
+    name = arcname[len(prefix):]
+    subdir, _, filename = name.rpartition('/')
+    if not filename or filename in ('.', '..') or '\\' in filename:
+        return None
+    shard = ''
+    if SHARD_PATTERN.match('/'.join(name.split('/')[-3:])):
+        # Sharded layout: the file is referenced as '6c/0f/hal.jpg'
+        subdir, shard = subdir[:-6], subdir[-5:] + '/'
+
+    if (subdir + '/').startswith(ARCHIVE_IMAGE_PREFIX):
+        subdir = subdir[len(ARCHIVE_IMAGE_PREFIX):] # Version 2 layout
+    elif subdir == 'images/rooms':
+        subdir = 'images/kamers' # Version 1 export layout
+    elif subdir == 'images/entities':
+        subdir = 'images/entiteiten'
+    elif subdir == 'images':
+        # Version 1 exports renamed game images to start_image.<ext> etc.
+        image_kind = filename.split('.')[0]
+        original_name = game_row.get(f'{image_kind}_path')
+        if image_kind not in ('start_image', 'win_image', 'loss_image') or not original_name:
+            return None
+        subdir, filename = 'avonturen', original_name
+    if subdir not in SUBDIR_IMAGE_TYPES or '..' in Path(filename).parts or Path(filename).name != filename:
+        return None
+    if shard and subdir not in sharded_image_folders():
+        return None
+    return f'{subdir}/{shard}{filename}'
+
+def _extract_archive_images(zip_file: zipfile.ZipFile, game_row: dict, image_names: list | None, prefix: str = '') -> int:
+    """Copies the archive's images into the uploads folder, streaming each file."""
+    storage = get_upload_storage()
+    if image_names is not None:
+        # Version 2: the manifest lists the images (which may be shared with other games)
+        entries = [(zip_file.NameToInfo[name], _image_target_for_entry(name, game_row))
+                   for name in image_names if name in zip_file.NameToInfo]
+    else:
+        entries = [(info, _image_target_for_entry(info.filename, game_row, prefix)) for info in zip_file.infolist()]
+
+    written = 0
+    for info, relative_path in entries:
+        if not relative_path:
+            continue
+        old_size = storage.size(relative_path)
+        with zip_file.open(info) as image_file:
+            storage.write(relative_path, image_file) # Streamed to the local folder or the bucket
+        adjust_for_file_change(relative_path, old_size, info.file_size)
+        written += 1
+    return written
+
+def _insert_table(model, batches) -> int:
+    """Bulk-inserts batches of exported rows into a table, returning the row count."""
+    count = 0
+    for batch in batches:
+        db.session.execute(insert(model), [_row_to_columns(model, row) for row in batch])
+        count += len(batch)
+    return count
+
+def import_game_archive(source, prefix: str = '') -> Game:
+    """
+    Imports a game archive (version 2 JSON-lines or legacy game_data.json) as a new game.
+    Rows keep their exported ids and are inserted in batches straight from the archive.
+
+    Args:
+        source: A path or seekable binary file object with the ZIP archive.
+        prefix: Path prefix of the game's data files inside the archive.
+
+    Returns:
+        The imported Game.
+
+    Raises:
+        GameImportError: If the archive is invalid.
+        GameImportConflict: If the game (id or name) already exists.
+    """
     try:
-        file = request.files['game_file']
-        if not file:
-            return jsonify({"error": "No game file provided"}), 400
-
-        # Extract game data from the zip file
-        with zipfile.ZipFile(file) as zip_file:
-            with zip_file.open('game_data.json') as game_data_file:
-                game_data = json.load(game_data_file)
-
-        # Create or update the game
-        game = Game.from_dict(game_data['game'])
-        db.session.add(game)
-
-        # Create or update rooms, entities, connections, scripts, and conversations
-        for room_data in game_data['rooms']:
-            room = Room.from_dict(room_data)
-            room.game = game
-            db.session.add(room)
-
-        for entity_data in game_data['entities']:
-            entity = Entity.from_dict(entity_data)
-            entity.game = game
-            db.session.add(entity)
-
-        for connection_data in game_data['connections']:
-            connection = Connection.from_dict(connection_data)
-            connection.game = game
-            db.session.add(connection)
-
-        for script_data in game_data['scripts']:
-            script = Script.from_dict(script_data)
-            script.game = game
-            db.session.add(script)
-
-        for conversation_data in game_data['conversations']:
-            conversation = Conversation.from_dict(conversation_data)
-            conversation.game = game
-            db.session.add(conversation)
-
-        db.session.commit()
-
-        # Save image files
-        upload_base_dir = Path(current_app.config['UPLOADS_FOLDER'])
-        for image_path in zip_file.namelist():
-            if image_path.startswith('images/'):
-                image_name = os.path.basename(image_path)
-                image_type = image_name.split('.')[0]
-                if image_type == 'start_image':
-                    game.start_image_path = image_name
-                elif image_type == 'win_image':
-                    game.win_image_path = image_name
-                elif image_type == 'loss_image':
-                    game.loss_image_path = image_name
-                elif image_path.startswith('images/rooms/'):
-                    room_image_name = os.path.basename(image_path)
-                    room = Room.query.filter_by(game_id=game.id, image_path=room_image_name).first()
-                    if room:
-                        room.image_path = room_image_name
-                elif image_path.startswith('images/entities/'):
-                    entity_image_name = os.path.basename(image_path)
-                    entity = Entity.query.filter_by(game_id=game.id, image_path=entity_image_name).first()
-                    if entity:
-                        entity.image_path = entity_image_name
-
-                with zip_file.open(image_path) as image_file, open(upload_base_dir / image_path[7:], 'wb') as output_file:
-                    output_file.write(image_file.read())
-
-        db.session.add(game)
-        db.session.commit()
+        zip_file = zipfile.ZipFile(source)
+    except zipfile.BadZipFile as e:
+        raise GameImportError(f"Not a valid ZIP archive: {e}") from e
+
+    with zip_file:
+        game_row, batches, image_names = open_game_archive(zip_file, prefix)
+        game_values = _row_to_columns(Game, game_row)
+        if not game_values.get('name'):
+            raise GameImportError("The archive's game has no name")
+        if not game_values.get('id'):
+            game_values['id'] = uuid.uuid4()
+        game_id = game_values['id']
+        if db.session.get(Game, game_id):
+            raise GameImportConflict(f"Game '{game_values['name']}' already exists (id {game_id}). Use merge mode to update it.")
+        if Game.query.filter_by(name=game_values['name']).first():
+            raise GameImportConflict(f"A game named '{game_values['name']}' already exists.")
+
+        try:
+            db.session.execute(insert(Game), [game_values])
+            counts = {}
+            for table_name, model in ARCHIVE_TABLES:
+                if model is Entity:
+                    # Containers may appear after their contents: insert without container
+                    # links first, then restore them in a second streaming pass.
+                    counts[table_name] = _insert_table(model, (
+                        [dict(row, container_id=None) for row in batch] for batch in batches(table_name)))
+                    for batch in batches(table_name):
+                        links = [{'id': uuid.UUID(row['id']), 'container_id': uuid.UUID(row['container_id'])}
+                                 for row in batch if row.get('container_id')]
+                        if links:
+                            db.session.execute(update(Entity), links)
+                else:
+                    counts[table_name] = _insert_table(model, batches(table_name))
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        images_written = _extract_archive_images(zip_file, game_row, image_names, prefix)
+
+    game = db.session.get(Game, game_id)
+    current_app.logger.info(f"Import: Imported game '{game.name}' ({game_id}): {counts}, {images_written} images.")
+    return game
+
+def _row_fingerprint(row: dict) -> tuple[bytes, int]:
+    """Returns (hash, size) of a row's JSON-lines record, used to detect changed rows."""
+    line = serialize_row_line(row).encode('utf-8')
+    return hashlib.blake2b(line, digest_size=16).digest(), len(line)
+
+def _id_list(row_ids, limit: int = 5) -> str:
+    """A few of the ids for an error message."""
+    row_ids = [str(row_id) for row_id in row_ids]
+    return ', '.join(row_ids[:limit]) + (f" and {len(row_ids) - limit} more" if len(row_ids) > limit else '')
+
+def _check_new_ids(model, row_ids: list):
+    """Rejects rows the merge would insert under an id that is already taken (by another game)."""
+    taken = db.session.scalars(select(model.id).where(model.id.in_(row_ids))).all()
+    if taken:
+        raise GameImportConflict(f"{len(taken)} {model.__tablename__} row(s) in the archive use ids that belong "
+                                 f"to another game: {_id_list(taken)}")
+
+def _check_removed_rooms(room_ids: list):
+    """Rejects removing rooms that saved games still have players in (saved_games.current_room_id)."""
+    occupied = {}
+    for start in range(0, len(room_ids), IMPORT_BATCH_SIZE):
+        occupied.update(db.session.execute(
+            select(SavedGame.current_room_id, func.count())
+            .where(SavedGame.current_room_id.in_(room_ids[start:start + IMPORT_BATCH_SIZE]))
+            .group_by(SavedGame.current_room_id)).all())
+    if occupied:
+        raise GameImportConflict(f"The archive removes {len(occupied)} room(s) that {sum(occupied.values())} saved "
+                                 f"game(s) are still in: {_id_list(occupied)}")
+
+def _merge_table(model, game_id, batches, summary: dict, size_deltas: dict) -> dict:
+    """
+    Diffs one table of an archive against the game's current rows (by id and row hash) and
+    applies the inserts and updates in bulk. Rows missing from the archive are not deleted
+    here; their ids are returned so deletes can run in reverse foreign-key order.
+
+    Raises:
+        GameImportError: If a row has no id or appears twice.
+        GameImportConflict: If a new row's id is taken by another game.
 
+    Returns:
+        {id: size} of existing rows the archive no longer contains.
+    """
+    # Only ids, hashes and sizes of the current rows are held in memory
+    existing = {obj.id: _row_fingerprint(obj.to_dict())
+                for obj in game_table_query(model, game_id).yield_per(STREAM_BATCH_SIZE)}
+    counts = {'inserted': 0, 'updated': 0, 'deleted': 0, 'unchanged': 0}
+    seen = set()
+    container_links = []
+    size_delta = 0
+
+    for batch in batches:
+        inserts, updates = [], []
+        for row in batch:
+            if not row.get('id'):
+                raise GameImportError(f"Merge import requires row ids ({model.__tablename__} row without 'id')")
+            row_id = uuid.UUID(row['id'])
+            if row_id in seen:
+                raise GameImportError(f"Duplicate {model.__tablename__} row in the archive: {row_id}")
+            seen.add(row_id)
+            row_hash, row_size = _row_fingerprint(row)
+            current = existing.pop(row_id, None)
+            if current is not None and current[0] == row_hash:
+                counts['unchanged'] += 1
+                continue
+            values = _row_to_columns(model, row)
+            if 'game_id' in values:
+                values['game_id'] = game_id
+            if model is Entity and values.get('container_id'):
+                # Container links are set after all entities exist (containers may come later);
+                # clearing first also keeps room/container moves within the location constraint
+                container_links.append({'id': row_id, 'container_id': values['container_id']})
+                values['container_id'] = None
+            if current is None:
+                inserts.append(values)
+            else:
+                updates.append(values)
+                size_delta -= current[1]
+            size_delta += row_size
+        if inserts:
+            _check_new_ids(model, [values['id'] for values in inserts])
+            db.session.execute(insert(model), inserts)
+            counts['inserted'] += len(inserts)
+        if updates:
+            db.session.execute(update(model), updates)
+            counts['updated'] += len(updates)
+
+    for start in range(0, len(container_links), IMPORT_BATCH_SIZE):
+        db.session.execute(update(Entity), container_links[start:start + IMPORT_BATCH_SIZE])
+
+    summary[model.__tablename__] = counts
+    size_deltas[TABLE_SIZE_COLUMNS[model]] = size_delta
+    return {row_id: fingerprint[1] for row_id, fingerprint in existing.items()}
+
+def merge_game_archive(source, prefix: str = '') -> tuple[Game, dict]:
+    """
+    Updates an existing game from an archive of a newer version of it. Rows are matched by
+    their exported ids; only new, changed and removed rows are written, each kind in bulk.
+    If the game does not exist yet, the archive is imported as a new game.
+
+    Args:
+        source: A path or seekable binary file object with the ZIP archive.
+        prefix: Path prefix of the game's data files inside the archive.
+
+    Returns:
+        A tuple (game, summary) where summary maps table names to
+        {'inserted', 'updated', 'deleted', 'unchanged'} counts.
+
+    Raises:
+        GameImportError: If the archive is invalid.
+        GameImportConflict: If the game's new name is taken by another game, a new row's id
+                            belongs to another game, or a removed room still has saved games in it.
+    """
+    try:
+        zip_file = zipfile.ZipFile(source)
+    except zipfile.BadZipFile as e:
+        raise GameImportError(f"Not a valid ZIP archive: {e}") from e
+
+    with zip_file:
+        game_row, batches, image_names = open_game_archive(zip_file, prefix)
+        game_values = _row_to_columns(Game, game_row)
+        game = db.session.get(Game, game_values['id']) if game_values.get('id') else None
+        if game is None:
+            return import_game_archive(source, prefix), {'games': {'inserted': 1}}
+        game_id = game.id
+        name_taken = Game.query.filter(Game.name == game_values.get('name'), Game.id != game_id).first()
+        if name_taken:
+            raise GameImportConflict(f"Another game is already named '{game_values['name']}'.")
+
+        summary = {}
+        size_deltas = {}
+        try:
+            game_hash, game_size = _row_fingerprint(game_row)
+            current_hash, current_size = _row_fingerprint(game.to_dict())
+            game_changed = game_hash != current_hash
+            if game_changed:
+                db.session.execute(update(Game), [game_values])
+                size_deltas[TABLE_SIZE_COLUMNS[Game]] = game_size - current_size
+            summary['games'] = {'updated': int(game_changed), 'unchanged': int(not game_changed)}
+            db.session.expire(game)
+
+            removed = {}
+            for table_name, model in ARCHIVE_TABLES:
+                removed[model] = _merge_table(model, game_id, batches(table_name), summary, size_deltas)
+
+            _check_removed_rooms(list(removed[Room]))
+            # Children before parents, so foreign keys never point at removed rows
+            for _, model in reversed(ARCHIVE_TABLES):
+                row_ids = list(removed[model])
+                for start in range(0, len(row_ids), IMPORT_BATCH_SIZE):
+                    db.session.execute(delete(model).where(model.id.in_(row_ids[start:start + IMPORT_BATCH_SIZE])),
+                                       execution_options={'synchronize_session': False})
+                summary[model.__tablename__]['deleted'] = len(row_ids)
+                size_deltas[TABLE_SIZE_COLUMNS[model]] -= sum(removed[model].values())
+
+            # Bulk statements bypass the flush listeners, so account for them here
+            apply_storage_deltas(game_id, size_deltas)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        _extract_archive_images(zip_file, game_row, image_names, prefix)
+        refresh_image_storage(game_id)
+
+    db.session.expire_all()
+    game = db.session.get(Game, game_id)
+    current_app.logger.info(f"Import: Merged archive into game '{game.name}' ({game_id}): {summary}")
+    return game, summary
+
+def import_game_from_zip_path(zip_path) -> Game:
+    """Imports a game archive from a file on disk (used by db_init.py)."""
+    if not os.path.isfile(zip_path):
+        raise FileNotFoundError(zip_path)
+    return import_game_archive(zip_path)
+
+# 'create' imports a new game; 'merge' applies the archive to the existing game
+IMPORT_MODES = ('create', 'merge')
+
+def import_response(source, mode: str = 'create'):
+    """Runs an import in the given mode and builds the API response (shared by the import routes)."""
+    try:
+        if mode == 'merge':
+            game, summary = merge_game_archive(source)
+            return jsonify({**game.to_dict(), "import_summary": summary}), 200
+        game = import_game_archive(source)
         return jsonify(game.to_dict()), 201
+    except GameImportError as e:
+        return jsonify({"error": str(e)}), e.status_code
     except Exception as e:
         current_app.logger.error(f"Error importing game: {e}", exc_info=True)
         return jsonify({"error": f"Internal server error during import: {e}"}), 500
 
+@games_bp.route('/import', methods=['POST'])
+@login_required
+def import_game():
+    file = request.files.get('game_file') or request.files.get('file')
+    if not file:
+        return jsonify({"error": "No game file provided"}), 400
+
+    mode = request.args.get('mode') or request.form.get('mode') or 'create'
+    if mode not in IMPORT_MODES:
+        return jsonify({"error": "Invalid import mode. Use 'create' or 'merge'."}), 400
+
+    # Werkzeug spools large uploads to a temporary file, so the archive is read from disk.
+    # Large archives should use the resumable upload endpoints (api/import_uploads.py).
+    return import_response(file.stream, mode)
+
 @games_bp.route('/<uuid:game_id>/estimate-size', methods=['GET'])
 @login_required # Or @admin_required if only admins should see this
 def estimate_game_size(game_id):
     """
-    Estimates the total disk size of a game's assets (JSON data and images).
+    Returns the storage footprint of a game's assets (JSON data and images) and the
+    expected size of its compressed export. Served from the incrementally maintained
+    GameStorageStats; pass ?refresh=1 to force a full recomputation.
     """
     game = db.session.get(Game, game_id)
     if not game:
         return jsonify({"error": "Game not found"}), 404
 
-    total_size_bytes = 0
-    upload_base_dir = Path(current_app.config['UPLOADS_FOLDER'])
-    files_to_check = set()
-
-    # 1. Estimate size of game_data.json (by serializing current data)
+    refresh = request.args.get('refresh', '').lower() in ('1', 'true', 'yes')
     try:
-        # This is a simplified export_data structure for size estimation
-        # A more accurate one would involve querying all related objects like in export_game
-        game_data_dict = game.to_dict() # Basic game info
-        # Add rooms, entities etc. if a more precise JSON size is needed.
-        # For now, this is a rough estimate of the JSON part.
-        json_data_bytes = json.dumps(game_data_dict).encode('utf-8')
-        total_size_bytes += len(json_data_bytes)
+        stats = get_game_storage_stats(game_id, refresh=refresh)
     except Exception as e:
-        current_app.logger.warning(f"Could not estimate game_data.json size for game {game_id}: {e}")
-
-    # 2. Collect image paths
-    if game.start_image_path:
-        files_to_check.add(upload_base_dir / 'avonturen' / game.start_image_path)
-    if game.win_image_path:
-        files_to_check.add(upload_base_dir / 'avonturen' / game.win_image_path)
-    if game.loss_image_path:
-        files_to_check.add(upload_base_dir / 'avonturen' / game.loss_image_path)
-
-    rooms = Room.query.filter_by(game_id=game_id).all()
-    for room in rooms:
-        if room.image_path:
-            files_to_check.add(upload_base_dir / 'images' / 'kamers' / room.image_path)
-
-    entities = Entity.query.filter_by(game_id=game_id).all()
-    for entity in entities:
-        if entity.image_path:
-            files_to_check.add(upload_base_dir / 'images' / 'entiteiten' / entity.image_path)
-
-    # 3. Sum file sizes
-    for file_path in files_to_check:
-        try:
-            if file_path.is_file():
-                total_size_bytes += file_path.stat().st_size
-        except FileNotFoundError:
-            current_app.logger.warning(f"Estimate size: File not found, skipping: {file_path}")
-        except Exception as e:
-            current_app.logger.error(f"Estimate size: Error accessing file {file_path}: {e}")
+        db.session.rollback()
+        current_app.logger.error(f"Estimate size: Could not compute storage stats for game {game_id}: {e}", exc_info=True)
+        return jsonify({"error": "Failed to estimate game size"}), 500
 
+    total_size_bytes = stats.total_bytes
+    export_size_bytes = estimate_export_bytes(stats)
     return jsonify({
         "size_bytes": total_size_bytes,
-        "size_readable": humanize.naturalsize(total_size_bytes, binary=True) # e.g., "1.2 MiB"
+        "size_readable": humanize.naturalsize(total_size_bytes, binary=True), # e.g., "1.2 MiB"
+        "json_bytes": stats.json_bytes,
+        "table_bytes": {
+            "game": stats.game_bytes,
+            "rooms": stats.rooms_bytes,
+            "entities": stats.entities_bytes,
+            "connections": stats.connections_bytes,
+            "scripts": stats.scripts_bytes,
+            "conversations": stats.conversations_bytes,
+        },
+        "image_bytes": stats.image_bytes,
+        "image_count": stats.image_count,
+        "export_size_bytes": export_size_bytes,
+        "export_size_readable": humanize.naturalsize(export_size_bytes, binary=True),
+        "updated_at": stats.updated_at.isoformat() + 'Z' if stats.updated_at else None,
     }), 200
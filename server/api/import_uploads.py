@@ -0,0 +1,248 @@
+import os
+import json
+import time
+import uuid
+import shutil
+import hashlib
+from datetime import datetime
+from pathlib import Path
+from flask import Blueprint, jsonify, current_app, request
+from flask_login import login_required, current_user
+from api.games import import_response, IMPORT_MODES
+
+import_uploads_bp = Blueprint('import_uploads_bp', __name__)
+
+# --- Resumable Chunked Import Uploads ---
+# Large game archives are uploaded in numbered chunks instead of one multipart request:
+#   POST   /api/games/import/uploads                      initiate (size, chunk size, checksum)
+#   GET    /api/games/import/uploads/<id>                 which chunks the server already has
+#   PUT    /api/games/import/uploads/<id>/chunks/<index>  upload one chunk (raw body)
+#   POST   /api/games/import/uploads/<id>/complete        assemble, verify and import
+#   DELETE /api/games/import/uploads/<id>                 abort
+# Each upload is a directory in the instance folder holding upload.json (immutable metadata)
+# and one file per received chunk, so several workers can accept chunks of the same upload
+# and an interrupted client resumes by asking which chunks are missing.
+
+UPLOAD_METADATA_FILE = 'upload.json'
+ASSEMBLED_ARCHIVE_FILE = 'archive.zip'
+STREAM_BUFFER_SIZE = 1024 * 1024
+
+def _uploads_root() -> Path:
+    root = Path(current_app.config['INSTANCE_FOLDER_PATH']) / 'import_uploads'
+    root.mkdir(parents=True, exist_ok=True)
+    return root
+
+def _chunk_path(upload_dir: Path, index: int) -> Path:
+    return upload_dir / f'chunk-{index:06d}'
+
+def _received_chunks(upload_dir: Path) -> list[int]:
+    return sorted(int(path.name[len('chunk-'):]) for path in upload_dir.glob('chunk-[0-9]*'))
+
+def _expected_chunk_size(upload: dict, index: int) -> int:
+    if index < upload['total_chunks'] - 1:
+        return upload['chunk_size']
+    return upload['size'] - upload['chunk_size'] * (upload['total_chunks'] - 1)
+
+def _prune_expired_uploads():
+    """Removes uploads that were abandoned longer than IMPORT_UPLOAD_EXPIRY_SECONDS ago."""
+    expiry = current_app.config['IMPORT_UPLOAD_EXPIRY_SECONDS']
+    now = time.time()
+    for upload_dir in _uploads_root().iterdir():
+        try:
+            if upload_dir.is_dir() and now - upload_dir.stat().st_mtime > expiry:
+                shutil.rmtree(upload_dir, ignore_errors=True)
+                current_app.logger.info(f"Import upload: Removed expired upload {upload_dir.name}")
+        except OSError:
+            continue
+
+def _load_upload(upload_id):
+    """Returns (upload_dir, metadata) for an upload owned by the current user, or an error response."""
+    try:
+        upload_id = str(uuid.UUID(str(upload_id)))
+    except ValueError:
+        return None, (jsonify({"error": "Upload not found"}), 404)
+    upload_dir = _uploads_root() / upload_id
+    try:
+        with open(upload_dir / UPLOAD_METADATA_FILE, encoding='utf-8') as metadata_file:
+            upload = json.load(metadata_file)
+    except (OSError, ValueError):
+        return None, (jsonify({"error": "Upload not found"}), 404)
+    if upload['owner_id'] != str(current_user.id):
+        return None, (jsonify({"error": "Upload not found"}), 404)
+    return (upload_dir, upload), None
+
+def _status(upload_dir: Path, upload: dict) -> dict:
+    received = _received_chunks(upload_dir)
+    return {
+        "upload_id": upload['id'],
+        "filename": upload['filename'],
+        "size": upload['size'],
+        "chunk_size": upload['chunk_size'],
+        "total_chunks": upload['total_chunks'],
+        "received_chunks": received,
+        "missing_chunks": sorted(set(range(upload['total_chunks'])) - set(received)),
+        "mode": upload['mode'],
+    }
+
+@import_uploads_bp.route('', methods=['POST'])
+@login_required
+def initiate_upload():
+    """Starts a chunked upload. Body: {filename, size, chunk_size?, sha256?, mode?}."""
+    data = request.get_json() or {}
+    try:
+        size = int(data.get('size'))
+    except (TypeError, ValueError):
+        return jsonify({"error": "'size' (archive size in bytes) is required"}), 400
+    max_bytes = current_app.config['IMPORT_UPLOAD_MAX_BYTES']
+    if size <= 0 or size > max_bytes:
+        return jsonify({"error": f"Archive size must be between 1 and {max_bytes} bytes"}), 400
+
+    max_chunk_size = current_app.config['IMPORT_UPLOAD_CHUNK_SIZE']
+    try:
+        chunk_size = min(int(data.get('chunk_size') or max_chunk_size), max_chunk_size)
+    except (TypeError, ValueError):
+        return jsonify({"error": "Invalid 'chunk_size'"}), 400
+    if chunk_size <= 0:
+        return jsonify({"error": "Invalid 'chunk_size'"}), 400
+
+    mode = data.get('mode') or 'create'
+    if mode not in IMPORT_MODES:
+        return jsonify({"error": "Invalid import mode. Use 'create' or 'merge'."}), 400
+    sha256 = (data.get('sha256') or '').lower() or None
+    if sha256 and (len(sha256) != 64 or any(c not in '0123456789abcdef' for c in sha256)):
+        return jsonify({"error": "Invalid 'sha256' checksum"}), 400
+
+    _prune_expired_uploads()
+    upload = {
+        "id": str(uuid.uuid4()),
+        "owner_id": str(current_user.id),
+        "filename": os.path.basename(str(data.get('filename') or 'game.zip')),
+        "size": size,
+        "chunk_size": chunk_size,
+        "total_chunks": -(-size // chunk_size),
+        "sha256": sha256,
+        "mode": mode,
+        "created_at": datetime.utcnow().isoformat() + 'Z',
+    }
+    upload_dir = _uploads_root() / upload['id']
+    upload_dir.mkdir()
+    with open(upload_dir / UPLOAD_METADATA_FILE, 'w', encoding='utf-8') as metadata_file:
+        json.dump(upload, metadata_file)
+    current_app.logger.info(f"Import upload: Started upload {upload['id']} ('{upload['filename']}', {size} bytes, "
+                            f"{upload['total_chunks']} chunks) for user {current_user.id}")
+    return jsonify(_status(upload_dir, upload)), 201
+
+@import_uploads_bp.route('/<upload_id>', methods=['GET'])
+@login_required
+def get_upload_status(upload_id):
+    """Reports received and missing chunks, so an interrupted client can resume."""
+    loaded, error = _load_upload(upload_id)
+    if error:
+        return error
+    return jsonify(_status(*loaded))
+
+@import_uploads_bp.route('/<upload_id>/chunks/<int:index>', methods=['PUT'])
+@login_required
+def put_chunk(upload_id, index):
+    """
+    Stores one chunk (the raw request body). An optional X-Chunk-SHA256 header is verified.
+    Re-sending a chunk replaces it, so retries are safe.
+    """
+    loaded, error = _load_upload(upload_id)
+    if error:
+        return error
+    upload_dir, upload = loaded
+    if not 0 <= index < upload['total_chunks']:
+        return jsonify({"error": f"Chunk index must be between 0 and {upload['total_chunks'] - 1}"}), 400
+
+    expected_size = _expected_chunk_size(upload, index)
+    if request.content_length is not None and request.content_length != expected_size:
+        return jsonify({"error": f"Chunk {index} must be {expected_size} bytes, got {request.content_length}"}), 400
+
+    # Stream the body to a temporary file, then move it into place: a chunk file only
+    # exists once it is complete and verified.
+    digest = hashlib.sha256()
+    written = 0
+    temp_path = upload_dir / f'.chunk-{index:06d}.{uuid.uuid4().hex}.tmp'
+    try:
+        with open(temp_path, 'wb') as chunk_file:
+            while True:
+                buffer = request.stream.read(min(STREAM_BUFFER_SIZE, expected_size + 1 - written))
+                if not buffer:
+                    break
+                written += len(buffer)
+                if written > expected_size:
+                    break
+                digest.update(buffer)
+                chunk_file.write(buffer)
+        if written != expected_size:
+            return jsonify({"error": f"Chunk {index} must be {expected_size} bytes, got {written}"}), 400
+        expected_sha256 = (request.headers.get('X-Chunk-SHA256') or '').lower()
+        if expected_sha256 and expected_sha256 != digest.hexdigest():
+            return jsonify({"error": f"Checksum mismatch for chunk {index}"}), 422
+        os.replace(temp_path, _chunk_path(upload_dir, index))
+    finally:
+        if temp_path.exists():
+            temp_path.unlink()
+
+    received = _received_chunks(upload_dir)
+    return jsonify({"index": index, "sha256": digest.hexdigest(),
+                    "received": len(received), "total_chunks": upload['total_chunks']})
+
+@import_uploads_bp.route('/<upload_id>/complete', methods=['POST'])
+@login_required
+def complete_upload(upload_id):
+    """
+    Assembles the chunks into one file on disk, verifies size and checksum, and imports it.
+    Body (optional): {mode} to override the import mode, e.g. 'merge' after a 409 conflict.
+    The upload is kept when the import fails, so it can be retried without re-uploading.
+    """
+    loaded, error = _load_upload(upload_id)
+    if error:
+        return error
+    upload_dir, upload = loaded
+    data = request.get_json(silent=True) or {}
+    mode = data.get('mode') or upload['mode']
+    if mode not in IMPORT_MODES:
+        return jsonify({"error": "Invalid import mode. Use 'create' or 'merge'."}), 400
+
+    status = _status(upload_dir, upload)
+    if status['missing_chunks']:
+        return jsonify({"error": "Upload is incomplete", **status}), 409
+
+    archive_path = upload_dir / ASSEMBLED_ARCHIVE_FILE
+    digest = hashlib.sha256()
+    with open(archive_path, 'wb') as archive_file:
+        for index in range(upload['total_chunks']):
+            with open(_chunk_path(upload_dir, index), 'rb') as chunk_file:
+                while True:
+                    buffer = chunk_file.read(STREAM_BUFFER_SIZE)
+                    if not buffer:
+                        break
+                    digest.update(buffer)
+                    archive_file.write(buffer)
+
+    if archive_path.stat().st_size != upload['size']:
+        archive_path.unlink()
+        return jsonify({"error": "Assembled archive has the wrong size"}), 422
+    if upload['sha256'] and digest.hexdigest() != upload['sha256']:
+        archive_path.unlink()
+        return jsonify({"error": "Checksum mismatch for the assembled archive"}), 422
+
+    current_app.logger.info(f"Import upload: Upload {upload['id']} complete, importing ({mode}).")
+    response, status_code = import_response(str(archive_path), mode)
+    if status_code < 400:
+        shutil.rmtree(upload_dir, ignore_errors=True)
+    else:
+        archive_path.unlink(missing_ok=True) # Chunks are kept for a retry
+    return response, status_code
+
+@import_uploads_bp.route('/<upload_id>', methods=['DELETE'])
+@login_required
+def abort_upload(upload_id):
+    loaded, error = _load_upload(upload_id)
+    if error:
+        return error
+    upload_dir, upload = loaded
+    shutil.rmtree(upload_dir, ignore_errors=True)
+    return '', 204
@@ -9,7 +9,7 @@ from app import db
 from models import Room, Game
 from . import state
 from .helpers import (
-    find_and_execute_scripts
+    find_and_execute_scripts, add_image_previews
 )
 from .movement import (
     handle_player_movement, handle_npc_movement, get_arrival_direction, direction_map, NpcMovementDetail
@@ -218,7 +218,7 @@ def process_command(user_id: uuid.UUID, game_id: uuid.UUID, current_room_id: uui
 
     current_score = current_game_vars.get('player_score', 0)
 
-    return {
+    return add_image_previews({
         "message": final_message,
         "in_conversation": in_conversation,
         "node_type": node_type,
@@ -232,4 +232,4 @@ def process_command(user_id: uuid.UUID, game_id: uuid.UUID, current_room_id: uui
         "game_loss": game_loss, # NEW: Include loss status
         "loss_reason": loss_reason, # NEW: Include loss reason if lost
         "loss_image_path": loss_image_path # NEW: Include loss image path if lost
-    }
+    })
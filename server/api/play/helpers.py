@@ -5,8 +5,18 @@ from typing import Optional, Dict, Any, Set, List, Union, Tuple, TypedDict
 from flask_login import current_user
 from app import db
 from models import Room, Connection, Entity, Script, EntityType, HighScore, User, Game, Conversation
+from image_utils import IMAGE_SUBDIRS
+from image_ingest import image_previews
 from . import state
 
+# Image fields of play responses and the uploads folder their file names live in
+PREVIEW_IMAGE_FIELDS = {
+    'image_path': IMAGE_SUBDIRS['room'],
+    'entity_image_path': IMAGE_SUBDIRS['entity'],
+    'win_image_path': IMAGE_SUBDIRS['game_win'],
+    'loss_image_path': IMAGE_SUBDIRS['game_loss'],
+}
+
 # --- Helper Functions ---
 
 def get_current_entity_location(user_id: uuid.UUID, game_id: uuid.UUID, entity_id: uuid.UUID) -> Optional[Union[str, Dict[str, uuid.UUID]]]:
@@ -316,6 +326,20 @@ def find_target_in_room(user_id: uuid.UUID, game_id: uuid.UUID, room_id: uuid.UU
 
     return None, target_connection
 
+def add_image_previews(response: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Adds '<name>_preview' ({width, height, placeholder} or None) next to every image path in a
+    play response ('image_path' -> 'image_preview'), so the client can lay out and show a
+    placeholder before the image arrives. All images are looked up in one query.
+    """
+    fields = {field: f"{folder}/{response[field]}" for field, folder in PREVIEW_IMAGE_FIELDS.items()
+              if response.get(field)}
+    previews = image_previews(fields.values())
+    for field in PREVIEW_IMAGE_FIELDS:
+        if field in response:
+            response[field.replace('_path', '_preview')] = previews.get(fields.get(field))
+    return response
+
 # Define a type for the return value of find_and_execute_scripts
 class ScriptExecutionResult(TypedDict):
     messages: str
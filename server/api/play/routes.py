@@ -8,7 +8,7 @@ from models import Game, Room, SavedGame, Conversation
 from . import state
 from .commands import process_command
 from .conversation import handle_conversation_input, end_conversation
-from .helpers import format_room_description, find_and_execute_scripts, evaluate_condition
+from .helpers import format_room_description, find_and_execute_scripts, evaluate_condition, add_image_previews
 
 # Create a Blueprint for play mode routes
 play_bp = Blueprint('play_bp', __name__, url_prefix='/api')
@@ -42,7 +42,7 @@ def handle_play_command_route(game_id):
         conv_result["current_room_id"] = str(current_room_id) # Keep current room ID
         # Ensure score info is included from conversation handler
         conv_result.setdefault("current_score", state.game_states.get(current_user.id, {}).get(game_id, {}).get('player_score', 0))
-        return jsonify(conv_result), 200
+        return jsonify(add_image_previews(conv_result)), 200
     else:
         # --- Process regular command ---
         result = process_command(current_user.id, game_id, current_room_id, command_text)
@@ -130,7 +130,7 @@ def load_game_state_route(game_id):
 
     current_score = state.game_states.get(current_user.id, {}).get(game_id, {}).get('player_score', 0)
 
-    return jsonify({
+    return jsonify(add_image_previews({
         "message": "Spel geladen!\n\n" + initial_description,
         "current_room_id": str(saved_game.current_room_id),
         "image_path": loaded_room_image,
@@ -139,7 +139,7 @@ def load_game_state_route(game_id):
         # Optionally send initial state if needed by client, but usually managed server-side
         # "inventory": saved_game.inventory,
         # "game_variables": saved_game.game_variables
-    }), 200
+    })), 200
 
 
 @play_bp.route('/games/<uuid:game_id>/play/reset', methods=['POST'])
@@ -172,10 +172,10 @@ def reset_game_session_route(game_id):
          initial_description += "Kon startlocatie niet vinden."
 
 
-    return jsonify({
+    return jsonify(add_image_previews({
         "current_score": 0, # Score is always 0 after reset
         "message": initial_description,
         "current_room_id": start_room_id,
         "image_path": start_room_image,
         "in_conversation": False,
-        }), 200
+        })), 200
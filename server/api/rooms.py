@@ -1,4 +1,5 @@
 from flask import Blueprint, request, jsonify
+from sqlalchemy import select, update
 from sqlalchemy.exc import IntegrityError
 from flask_login import login_required, current_user
 import uuid
@@ -6,10 +7,16 @@ import uuid
 from decorators import admin_required
 from app import db
 from models import Game, Room, Connection, Entity
+from list_query import list_response, request_flag, search_filter, presence_filter
+from storage_stats import serialized_row_size, apply_storage_deltas, refresh_image_storage, TABLE_SIZE_COLUMNS
 
 # Create a Blueprint for room routes
 rooms_bp = Blueprint('rooms_bp', __name__)
 
+# Fields a room list can be projected to (?fields=...)
+ROOM_LIST_FIELDS = ('id', 'game_id', 'title', 'description', 'pos_x', 'pos_y', 'sort_index', 'image_path')
+MAX_BULK_ROOMS = 5000 # Rooms per bulk patch request
+
 # --- Helper Functions ---
 
 def serialize_room(room, include_connections=False):
@@ -36,6 +43,56 @@ def serialize_room(room, include_connections=False):
         ]
     return data
 
+def _room_patch_values(patch: dict) -> dict:
+    """Validates the fields of one bulk patch entry; raises ValueError with a message."""
+    values = {}
+    for key, value in patch.items():
+        if key == 'id':
+            continue
+        if key in ('pos_x', 'pos_y', 'sort_index'):
+            if isinstance(value, bool) or not (isinstance(value, int) or (value is None and key != 'sort_index')):
+                raise ValueError(f"'{key}' must be an integer" + (" or null" if key != 'sort_index' else ''))
+            values[key] = value
+        elif key in ('title', 'description'):
+            if not isinstance(value, str):
+                raise ValueError(f"'{key}' must be a string")
+            values[key] = value.strip() or ('Untitled Room' if key == 'title' else '')
+        elif key == 'image_path':
+            if value is not None and not isinstance(value, str):
+                raise ValueError("'image_path' must be a string or null")
+            values[key] = value or None
+        else:
+            raise ValueError(f"Unknown field '{key}'")
+    return values
+
+def _bulk_update_rooms(game_id, rooms: dict, changes: dict) -> int:
+    """
+    Writes {room id: {column: value}} for already loaded rooms of a game with one bulk
+    UPDATE, in the current transaction. Bulk statements bypass the storage listeners,
+    so the game's stats (and content revision) are updated here.
+
+    Returns:
+        The number of rooms that actually changed.
+    """
+    rows, size_delta, images_changed = [], 0, False
+    for room_id, values in changes.items():
+        room = rooms[room_id]
+        old_row = room.to_dict()
+        values = {key: value for key, value in values.items() if getattr(room, key) != value}
+        if not values:
+            continue
+        new_row = {**old_row, **values}
+        size_delta += serialized_row_size(new_row) - serialized_row_size(old_row)
+        images_changed = images_changed or 'image_path' in values
+        rows.append({'id': room_id, **values})
+    if not rows:
+        return 0
+    db.session.execute(update(Room), rows) # Grouped by primary key into executemany batches
+    apply_storage_deltas(game_id, {TABLE_SIZE_COLUMNS[Room]: size_delta})
+    if images_changed:
+        refresh_image_storage(game_id, commit=False)
+    return len(rows)
+
 # --- API Endpoints ---
 
 @rooms_bp.route('/games/<uuid:game_id>/rooms', methods=['POST'])
@@ -83,16 +140,22 @@ def create_room(game_id):
 @rooms_bp.route('/games/<uuid:game_id>/rooms', methods=['GET'])
 @login_required 
 def list_rooms(game_id):
-    """Lists all rooms for a specific game."""
+    """
+    Lists the rooms of a game in sort_index order. Filters: q (title contains), has_image.
+    Supports the paging and projection parameters of list_query.list_response.
+    """
     game = db.session.get(Game, game_id)
     if not game:
         return jsonify({"error": "Game not found"}), 404
 
     try:
-        # Consider adding pagination later if room lists become very large
-        rooms = Room.query.filter_by(game_id=game_id).order_by(Room.sort_index).all() # Order by sort_index
-        # Optionally include connections summary here if needed by the list view
-        return jsonify([serialize_room(room, include_connections=False) for room in rooms]), 200
+        query = select(Room).where(Room.game_id == game_id)
+        if request.args.get('q'):
+            query = query.where(search_filter(Room.title, request.args['q']))
+        has_image = request_flag('has_image')
+        if has_image is not None:
+            query = query.where(presence_filter(Room.image_path, has_image))
+        return list_response(query, Room, Room.sort_index, serialize_room, ROOM_LIST_FIELDS)
     except Exception as e:
         print(f"Error fetching rooms for game {game_id}: {e}")
         return jsonify({"error": "Failed to retrieve rooms"}), 500
@@ -183,7 +246,9 @@ def delete_room(room_id):
         # Connections associated via cascade='all, delete-orphan' on Room.connections_from
         # Need to manually delete connections *to* this room if not handled by cascade/DB constraints
         # Let's explicitly delete connections pointing *to* the room first
-        Connection.query.filter_by(to_room_id=room_id).delete()
+        # (through the session, so the game's storage stats see the deletes)
+        for connection in Connection.query.filter_by(to_room_id=room_id).all():
+            db.session.delete(connection)
         # Now delete the room itself (which cascades to connections *from* it)
         db.session.delete(room)
         db.session.commit()
@@ -213,13 +278,62 @@ def update_room_order(game_id):
         return jsonify({"error": "Invalid room ID format in the list"}), 400
 
     try:
-        for index, room_id in enumerate(room_ids_ordered):
-            room = db.session.get(Room, room_id)
-            if room and room.game_id == game_id:
-                room.sort_index = index
+        # Rooms of other games (or unknown ids) are ignored, as before
+        rooms = {room.id: room for room in db.session.scalars(
+            select(Room).where(Room.game_id == game_id, Room.id.in_(room_ids_ordered)))}
+        _bulk_update_rooms(game_id, rooms, {room_id: {'sort_index': index}
+                                            for index, room_id in enumerate(room_ids_ordered) if room_id in rooms})
         db.session.commit()
         return jsonify({"message": "Room order updated successfully"}), 200
     except Exception as e:
         db.session.rollback()
         print(f"Error updating room order for game {game_id}: {e}")
         return jsonify({"error": "Failed to update room order"}), 500
+
+
+@rooms_bp.route('/games/<uuid:game_id>/rooms', methods=['PATCH'])
+@admin_required # Only admins can edit rooms
+def bulk_update_rooms(game_id):
+    """
+    Updates many rooms of a game at once, e.g. the positions after a graph layout.
+    The body is a list of {id, ...fields} with any of pos_x, pos_y, sort_index, title,
+    description and image_path. Everything is validated first and applied in one
+    transaction: either all rooms are updated or none.
+    """
+    game = db.session.get(Game, game_id)
+    if not game:
+        return jsonify({"error": "Game not found"}), 404
+
+    data = request.get_json(silent=True)
+    if not isinstance(data, list) or not all(isinstance(patch, dict) for patch in data):
+        return jsonify({"error": "Request body must be a list of room objects"}), 400
+    if len(data) > MAX_BULK_ROOMS:
+        return jsonify({"error": f"At most {MAX_BULK_ROOMS} rooms can be updated at once"}), 400
+
+    changes = {}
+    for index, patch in enumerate(data):
+        try:
+            room_id = uuid.UUID(str(patch.get('id')))
+        except ValueError:
+            return jsonify({"error": f"Invalid room ID format at index {index}"}), 400
+        if room_id in changes:
+            return jsonify({"error": f"Room {room_id} appears more than once"}), 400
+        try:
+            changes[room_id] = _room_patch_values(patch)
+        except ValueError as e:
+            return jsonify({"error": f"Room {room_id}: {e}"}), 400
+
+    rooms = {room.id: room for room in db.session.scalars(
+        select(Room).where(Room.game_id == game_id, Room.id.in_(list(changes))))}
+    missing = [str(room_id) for room_id in changes if room_id not in rooms]
+    if missing:
+        return jsonify({"error": "Rooms not found in this game", "room_ids": missing}), 404
+
+    try:
+        updated = _bulk_update_rooms(game_id, rooms, changes)
+        db.session.commit()
+        return jsonify({"message": "Rooms updated successfully", "updated": updated}), 200
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error bulk updating rooms for game {game_id}: {e}")
+        return jsonify({"error": "Failed to update rooms"}), 500
@@ -1,4 +1,5 @@
 from flask import Blueprint, request, jsonify
+from sqlalchemy import select
 from sqlalchemy.exc import IntegrityError
 from flask_login import login_required, current_user
 import uuid
@@ -6,10 +7,14 @@ import uuid
 from decorators import admin_required
 from app import db
 from models import Game, Script # Import Script model
+from list_query import list_response, search_filter, prefix_filter
 
 # Create a Blueprint for script routes
 scripts_bp = Blueprint('scripts_bp', __name__)
 
+# Fields a script list can be projected to (?fields=...)
+SCRIPT_LIST_FIELDS = ('id', 'game_id', 'trigger', 'condition', 'action')
+
 # --- Helper Functions ---
 
 def serialize_script(script):
@@ -66,15 +71,22 @@ def create_script(game_id):
 @scripts_bp.route('/games/<uuid:game_id>/scripts', methods=['GET'])
 @admin_required # Only admins need the script list for editing
 def list_scripts_for_game(game_id):
-    """Lists all scripts for a specific game."""
+    """
+    Lists the scripts of a game by trigger. Filters: trigger_prefix (e.g. 'ON_ENTER'),
+    q (trigger contains). Supports the paging and projection parameters of
+    list_query.list_response.
+    """
     game = db.session.get(Game, game_id)
     if not game:
         return jsonify({"error": "Game not found"}), 404
 
     try:
-        # Add filtering/sorting later if needed
-        scripts = Script.query.filter_by(game_id=game_id).order_by(Script.trigger).all() # Example sort
-        return jsonify([serialize_script(script) for script in scripts]), 200
+        query = select(Script).where(Script.game_id == game_id)
+        if request.args.get('trigger_prefix'):
+            query = query.where(prefix_filter(Script.trigger, request.args['trigger_prefix']))
+        if request.args.get('q'):
+            query = query.where(search_filter(Script.trigger, request.args['q']))
+        return list_response(query, Script, Script.trigger, serialize_script, SCRIPT_LIST_FIELDS)
     except Exception as e:
         print(f"Error fetching scripts for game {game_id}: {e}")
         return jsonify({"error": "Failed to retrieve scripts"}), 500
@@ -1,15 +1,19 @@
 import os
-import io
 import json
+import time
+import uuid
+import tempfile
 import zipfile
 import requests # For making HTTP requests OUT to the store API
 from flask import Blueprint, jsonify, current_app
-from flask_login import login_required
+from flask_login import login_required, current_user
 from pathlib import Path
 from app import db # Assuming db is initialized in app.py or similar
 from models import Game, Room, Entity, Connection, Script, Conversation, SystemSetting
 from decorators import admin_required
-from api.games import export_game # Reuse the export logic if possible, or duplicate needed parts
+from jobs import submit_job, get_job
+from store_client import get_store_client, StoreAPIError
+from zip_utils import write_archive_bytes, write_archive_upload
 from flask import request # Import Flask's request object for handling INCOMING requests
 
 store_bp = Blueprint('store_bp', __name__, url_prefix='/api/store')
@@ -26,39 +30,257 @@ def get_store_api_key():
 def get_available_tags():
     """
     Acts as a proxy to fetch available tags from the external Adventure Store API.
-    This keeps the store API key secure on the server.
+    This keeps the store API key secure on the server. Tags are served from the
+    store client's cache; the X-Cache header reports HIT, STALE or MISS.
     """
     api_key = get_store_api_key()
     if not api_key:
         current_app.logger.error("Store API: Attempted to fetch tags, but API key is not configured.")
         return jsonify({"error": "Adventure Store API Key is not configured in Admin Settings."}), 500
 
-    store_tags_url = "https://adventurezstore.pleasewaitloading.com/api/tags"
-    headers = {'X-API-Key': api_key}
-
     try:
-        current_app.logger.info(f"Store API: Fetching tags from {store_tags_url}")
-        response = requests.get(store_tags_url, headers=headers, timeout=10)
-        response.raise_for_status() # Raise HTTPError for bad responses (4xx or 5xx)
-
-        tags_data = response.json()
-        current_app.logger.info(f"Store API: Successfully fetched {len(tags_data)} tags.")
-        return jsonify(tags_data), 200
+        tags_data, cache_state = get_store_client().get_tags(api_key)
+        if cache_state == 'MISS':
+            current_app.logger.info(f"Store API: Successfully fetched {len(tags_data)} tags.")
+        response = jsonify(tags_data)
+        response.headers['X-Cache'] = cache_state
+        return response, 200
 
-    except requests.exceptions.RequestException as e:
-        current_app.logger.error(f"Store API: Error fetching tags from {store_tags_url}: {e}", exc_info=True)
-        return jsonify({"error": f"Could not connect to the store to fetch tags: {e}"}), 503 # Service Unavailable
+    except StoreAPIError as e:
+        current_app.logger.error(f"Store API: Error fetching tags: {e}")
+        return jsonify({"error": str(e)}), 503 # Service Unavailable
     except Exception as e:
         current_app.logger.error(f"Store API: Unexpected error fetching tags: {e}", exc_info=True)
         return jsonify({"error": f"An unexpected error occurred while fetching tags: {e}"}), 500
 
+# --- Store Submission Jobs ---
+
+STORE_SUBMISSION_JOB = 'store_submission'
+# Upstream statuses worth retrying; other 4xx responses mean the submission itself was rejected
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+class StoreSubmissionError(Exception):
+    """Raised when the store rejects a submission or cannot be reached after all retries."""
+    pass
+
+def _quote_header_param(value: str) -> str:
+    """Escapes a Content-Disposition parameter value the way browsers (and urllib3) do."""
+    return value.replace('"', '%22').replace('\r', '%0D').replace('\n', '%0A')
+
+class _MultipartFileStream:
+    """
+    A file-like multipart/form-data request body that streams the archive from disk.
+    Exposes 'len' so requests sends a Content-Length instead of chunked encoding.
+    """
+
+    def __init__(self, fields: dict, file_field: str, filename: str, file_path: Path,
+                 content_type: str = 'application/zip', on_progress=None):
+        self.boundary = uuid.uuid4().hex
+        preamble = b''
+        for name, value in fields.items():
+            preamble += (f'--{self.boundary}\r\n'
+                         f'Content-Disposition: form-data; name="{_quote_header_param(name)}"\r\n\r\n'
+                         f'{value}\r\n').encode('utf-8')
+        preamble += (f'--{self.boundary}\r\n'
+                     f'Content-Disposition: form-data; name="{_quote_header_param(file_field)}"; '
+                     f'filename="{_quote_header_param(filename)}"\r\n'
+                     f'Content-Type: {content_type}\r\n\r\n').encode('utf-8')
+        epilogue = f'\r\n--{self.boundary}--\r\n'.encode('utf-8')
+
+        self._file = open(file_path, 'rb')
+        self._segments = [preamble, self._file, epilogue]
+        self.len = len(preamble) + os.path.getsize(file_path) + len(epilogue)
+        self.bytes_read = 0
+        self._on_progress = on_progress
+
+    @property
+    def content_type(self) -> str:
+        return f'multipart/form-data; boundary={self.boundary}'
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0:
+            size = self.len
+        chunks = []
+        while size > 0 and self._segments:
+            segment = self._segments[0]
+            if isinstance(segment, bytes):
+                chunk, rest = segment[:size], segment[size:]
+                if rest:
+                    self._segments[0] = rest
+                else:
+                    self._segments.pop(0)
+            else:
+                chunk = segment.read(size)
+                if len(chunk) < size:
+                    self._segments.pop(0)
+            chunks.append(chunk)
+            size -= len(chunk)
+        data = b''.join(chunks)
+        self.bytes_read += len(data)
+        if self._on_progress:
+            self._on_progress(self.bytes_read, self.len)
+        return data
+
+    def __iter__(self):
+        while True:
+            chunk = self.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+
+    def close(self):
+        self._file.close()
+
+def _build_submission_archive(game: Game, archive_path: Path):
+    """Writes the store submission ZIP (game_data.json plus images) to archive_path."""
+    game_id = game.id
+    rooms = Room.query.filter_by(game_id=game_id).order_by(Room.sort_index).all()
+    entities = Entity.query.filter_by(game_id=game_id).all()
+    connections = db.session.query(Connection)\
+        .join(Room, Connection.from_room_id == Room.id)\
+        .filter(Room.game_id == game_id)\
+        .all()
+    scripts = Script.query.filter_by(game_id=game_id).all()
+    conversations = Conversation.query.filter_by(game_id=game_id).all()
+
+    # Serialize data to JSON
+    export_data = {
+        "game_info": game.to_dict(), # Includes version needed by store API
+        "rooms": [room.to_dict() for room in rooms],
+        "entities": [entity.to_dict() for entity in entities],
+        "connections": [connection.to_dict() for connection in connections],
+        "scripts": [script.to_dict() for script in scripts],
+        "conversations": [conversation.to_dict() for conversation in conversations]
+    }
+    # Ensure game_data.json includes the version key required by the store API
+    if 'version' not in export_data['game_info']:
+         export_data['game_info']['version'] = game.version or '1.0.0' # Add default if missing
+
+    json_data_bytes = json.dumps(export_data, indent=2).encode('utf-8')
+
+    # Collect image paths
+    image_paths_to_include = set()
+    if game.start_image_path: image_paths_to_include.add(('avonturen', game.start_image_path))
+    if game.win_image_path: image_paths_to_include.add(('avonturen', game.win_image_path))
+    for room in rooms:
+        if room.image_path: image_paths_to_include.add(('images/kamers', room.image_path))
+    for entity in entities:
+        if entity.image_path: image_paths_to_include.add(('images/entiteiten', entity.image_path))
+
+    # Write the ZIP to disk so the upload can stream it (and re-read it on retries)
+    with zipfile.ZipFile(archive_path, 'w') as zip_file:
+        write_archive_bytes(zip_file, 'game_data.json', json_data_bytes)
+        for subdir, filename in image_paths_to_include:
+            zip_path = Path(subdir) / filename
+            if not write_archive_upload(zip_file, zip_path.as_posix(), zip_path.as_posix()):
+                current_app.logger.warning(f"Submit: Image file not found, skipping: {zip_path.as_posix()}")
+
+def _describe_store_http_error(response) -> str:
+    """Builds a readable error message from an unsuccessful store API response."""
+    status_code = response.status_code
+    try:
+        # Check if the response is HTML
+        if 'text/html' in response.headers.get('Content-Type', '').lower():
+            return f"Store API returned an unexpected HTML error page (Status {status_code}). Check server logs for details."
+        # Try to get error details from the response body if it's JSON or plain text
+        error_detail = response.json().get('error', response.text[:200])
+        return f"Store API returned error (Status {status_code}): {error_detail}"
+    except (ValueError, AttributeError):
+        return f"Store API returned error (Status {status_code}): {response.text[:200]}"
+
+def _parse_store_response(response) -> dict:
+    """Converts a final (non-retryable) store API response into a result dict or raises."""
+    if not response.ok:
+        current_app.logger.error(f"Store API rejected submission (Status: {response.status_code}): {response.text[:500]}")
+        raise StoreSubmissionError(_describe_store_http_error(response))
+    # Check content type before parsing JSON
+    if 'application/json' in response.headers.get('Content-Type', ''):
+        return response.json()
+    if response.status_code == 204: # No Content
+        return {"success": True, "message": "Game submitted successfully"}
+    # Handle unexpected content type (e.g., HTML error page)
+    current_app.logger.error(f"Store API returned non-JSON response (Status: {response.status_code}): {response.text[:500]}")
+    raise StoreSubmissionError("Received unexpected response format from the store API.")
+
+def _upload_with_retries(job, game: Game, tags: str, api_key: str, archive_path: Path) -> dict:
+    """Streams the archive to the store API, retrying transient failures with exponential backoff."""
+    store_client = get_store_client()
+    store_api_url = store_client.url('/api/submit')
+    max_attempts = max(1, current_app.config['STORE_SUBMIT_MAX_ATTEMPTS'])
+    backoff_seconds = current_app.config['STORE_SUBMIT_BACKOFF_SECONDS']
+    timeout = current_app.config['STORE_SUBMIT_TIMEOUT']
+    payload = {
+        'name': game.name,
+        'description': game.description or 'No description provided.', # Ensure description is not None
+        'tags': tags
+    }
+    filename = f"{game.name.replace(' ', '_')}.zip"
+    last_error = None
+
+    def report_progress(bytes_sent, bytes_total):
+        # Throttle updates: every chunk boundary is far too chatty for the status endpoint
+        if bytes_sent == bytes_total or bytes_sent % (1024 * 1024) < UPLOAD_CHUNK_SIZE:
+            job.update(bytes_sent=bytes_sent, bytes_total=bytes_total)
+
+    for attempt in range(1, max_attempts + 1):
+        job.update(message=f"Uploading (attempt {attempt}/{max_attempts})", attempt=attempt, bytes_sent=0)
+        body = _MultipartFileStream(payload, 'adventure_file', filename, archive_path, on_progress=report_progress)
+        try:
+            current_app.logger.info(f"Submitting game '{game.name}' to store API at {store_api_url} (attempt {attempt}/{max_attempts})")
+            response = store_client.request('POST', '/api/submit', api_key,
+                                            headers={'Content-Type': body.content_type},
+                                            data=body, timeout=(store_client.timeout[0], timeout))
+            if response.status_code not in RETRYABLE_STATUS_CODES:
+                result = _parse_store_response(response)
+                current_app.logger.info(f"Store API Response (Game ID: {game.id}): {response.status_code} - {result}")
+                return result
+            last_error = _describe_store_http_error(response)
+        except requests.exceptions.ConnectionError:
+            last_error = "Could not connect to the store API. Please check the URL or network."
+        except requests.exceptions.Timeout:
+            last_error = "The request to the store API timed out."
+        except requests.exceptions.RequestException as e:
+            last_error = f"Network error communicating with the store API: {e}"
+        finally:
+            body.close()
+
+        current_app.logger.warning(f"Store submission attempt {attempt}/{max_attempts} for game '{game.name}' failed: {last_error}")
+        if attempt < max_attempts:
+            delay = backoff_seconds * (2 ** (attempt - 1))
+            job.update(message=f"Retrying in {delay:g}s: {last_error}")
+            time.sleep(delay)
+
+    raise StoreSubmissionError(last_error)
+
+def _run_store_submission(job, game_id, tags: str, api_key: str) -> dict:
+    """Job body: builds the submission archive on disk and uploads it to the store."""
+    game = db.session.get(Game, game_id)
+    if not game:
+        raise StoreSubmissionError("Game not found")
+
+    fd, archive_name = tempfile.mkstemp(prefix='store_submit_', suffix='.zip')
+    os.close(fd)
+    archive_path = Path(archive_name)
+    try:
+        job.update(message="Building archive")
+        _build_submission_archive(game, archive_path)
+        job.update(archive_bytes=archive_path.stat().st_size)
+        return _upload_with_retries(job, game, tags, api_key, archive_path)
+    finally:
+        try:
+            archive_path.unlink()
+        except OSError as e:
+            current_app.logger.warning(f"Submit: Could not remove temporary archive '{archive_path}': {e}")
+
 # --- API Endpoint: Submit Game ---
 @store_bp.route('/submit/<uuid:game_id>', methods=['POST'])
 @admin_required
 def submit_game_to_store(game_id):
     """
-    Exports a game as ZIP, collects metadata, and submits it to the Adventure Store API.
+    Queues a background job that exports the game as ZIP and submits it to the Adventure Store API.
     Expects JSON body with 'tags' (comma-separated numeric IDs).
+    Returns 202 with the job; poll /api/store/jobs/<job_id> for progress and the store's response.
     """
     game = db.session.get(Game, game_id)
     if not game:
@@ -82,143 +304,21 @@ def submit_game_to_store(game_id):
     # --- Log submission details for debugging ---
     current_app.logger.info("=" * 80)
     current_app.logger.info(f"STORE SUBMISSION REQUEST - Game: {game.name} (ID: {game_id})")
-    current_app.logger.info(f"Request data:")
     current_app.logger.info(f"  - Tags: {tags}")
     current_app.logger.info(f"  - API Key: {'*' * 8}{api_key[-4:] if api_key and len(api_key) > 4 else 'Not set'}")
-    current_app.logger.info(f"Game metadata:")
-    current_app.logger.info(f"  - Name: {game.name}")
-    current_app.logger.info(f"  - Description: {game.description[:50]}{'...' if game.description and len(game.description) > 50 else ''}")
-    current_app.logger.info(f"  - Version: {game.version}")
-    current_app.logger.info(f"  - Builder Version: {game.builder_version}")
-    current_app.logger.info(f"  - Start Image: {game.start_image_path}")
-    current_app.logger.info(f"  - Win Image: {game.win_image_path}")
-    current_app.logger.info(f"  - Loss Image: {game.loss_image_path}")
-    current_app.logger.info("-" * 80)
-
-    try:
-        # Fetch all related data
-        rooms = Room.query.filter_by(game_id=game_id).order_by(Room.sort_index).all()
-        entities = Entity.query.filter_by(game_id=game_id).all()
-        connections = db.session.query(Connection)\
-            .join(Room, Connection.from_room_id == Room.id)\
-            .filter(Room.game_id == game_id)\
-            .all()
-        scripts = Script.query.filter_by(game_id=game_id).all()
-        conversations = Conversation.query.filter_by(game_id=game_id).all()
-
-        # Serialize data to JSON
-        export_data = {
-            "game_info": game.to_dict(), # Includes version needed by store API
-            "rooms": [room.to_dict() for room in rooms],
-            "entities": [entity.to_dict() for entity in entities],
-            "connections": [connection.to_dict() for connection in connections],
-            "scripts": [script.to_dict() for script in scripts],
-            "conversations": [conversation.to_dict() for conversation in conversations]
-        }
-        # Ensure game_data.json includes the version key required by the store API
-        if 'version' not in export_data['game_info']:
-             export_data['game_info']['version'] = game.version or '1.0.0' # Add default if missing
-
-        json_data_bytes = json.dumps(export_data, indent=2).encode('utf-8')
-
-        # Collect image paths
-        upload_base_dir = Path(current_app.root_path).parent / 'client' / 'uploads'
-        image_paths_to_include = set()
-        if game.start_image_path: image_paths_to_include.add(('avonturen', game.start_image_path))
-        if game.win_image_path: image_paths_to_include.add(('avonturen', game.win_image_path))
-        for room in rooms:
-            if room.image_path: image_paths_to_include.add(('images/kamers', room.image_path))
-        for entity in entities:
-            if entity.image_path: image_paths_to_include.add(('images/entiteiten', entity.image_path))
-
-        # Create ZIP file in memory
-        zip_buffer = io.BytesIO()
-        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-            # Add game_data.json
-            zip_file.writestr('game_data.json', json_data_bytes)
-            # Add images
-            for subdir, filename in image_paths_to_include:
-                source_path = upload_base_dir / subdir / filename
-                zip_path = Path(subdir) / filename
-                if source_path.is_file():
-                    zip_file.write(source_path, arcname=str(zip_path))
-                else:
-                    current_app.logger.warning(f"Submit: Image file not found, skipping: {source_path}")
-
-        zip_buffer.seek(0) # Rewind buffer
+    current_app.logger.info(f"  - Version: {game.version} (Builder Version: {game.builder_version})")
+    current_app.logger.info("=" * 80)
 
-    except Exception as e:
-        current_app.logger.error(f"Error preparing game data/ZIP for store submission (Game ID: {game_id}): {e}", exc_info=True)
-        return jsonify({"error": f"Internal error preparing game data: {e}"}), 500
+    job = submit_job(STORE_SUBMISSION_JOB, _run_store_submission, game_id, tags, api_key, owner_id=current_user.id)
+    response = job.to_dict()
+    response['status_url'] = f"/api/store/jobs/{job.id}"
+    return jsonify(response), 202
 
-    # --- Submit to Store API ---
-    store_api_url = "https://adventurezstore.pleasewaitloading.com/api/submit"
-    headers = {
-        'X-API-Key': api_key
-    }
-    files = {
-        'adventure_file': (f"{game.name.replace(' ', '_')}.zip", zip_buffer, 'application/zip')
-    }
-    payload = {
-        'name': game.name,
-        'description': game.description or 'No description provided.', # Ensure description is not None
-        'tags': tags
-    }
-
-    try:
-        # Log the complete request details before sending
-        current_app.logger.info("STORE API REQUEST DETAILS:")
-        current_app.logger.info(f"URL: {store_api_url}")
-        current_app.logger.info(f"Headers: {json.dumps({k: ('*' * 8 + v[-4:] if k == 'X-API-Key' and len(v) > 4 else v) for k, v in headers.items()})}")
-        current_app.logger.info(f"Payload: {json.dumps(payload)}")
-        current_app.logger.info(f"Files: {{'adventure_file': (filename, <ZIP buffer>, 'application/zip')}}")
-        current_app.logger.info("-" * 80)
-
-        current_app.logger.info(f"Submitting game '{game.name}' to store API at {store_api_url}")
-        response = requests.post(store_api_url, headers=headers, data=payload, files=files, timeout=60) # Added timeout
-        response.raise_for_status() # Raise HTTPError for bad responses (4xx or 5xx)
-
-        # Check content type before parsing JSON
-        if 'application/json' in response.headers.get('Content-Type', ''):
-            response_data = response.json()
-            current_app.logger.info(f"Store API Response (Game ID: {game_id}): {response.status_code} - {response_data}")
-            # Return the success response from the store API directly to the frontend
-            return jsonify(response_data), response.status_code # Should be 201
-        elif response.status_code == 204:  # No Content
-            return jsonify({"success": True, "message": "Game submitted successfully"}), 200
-        else:
-            # Handle unexpected content type (e.g., HTML error page)
-            current_app.logger.error(f"Store API returned non-JSON response (Status: {response.status_code}): {response.text[:500]}")
-            return jsonify({"error": "Received unexpected response format from the store API."}), 502 # Bad Gateway
-
-    except requests.exceptions.RequestException as e:
-        current_app.logger.error(f"Error submitting game '{game.name}' to store API: {e}", exc_info=True)
-        # Provide more specific error messages based on the exception type if possible
-        error_message = f"Network error communicating with the store API: {e}"
-        status_code = 503 # Default to Service Unavailable for network issues
-        if isinstance(e, requests.exceptions.HTTPError):
-            status_code = e.response.status_code
-            try:
-                # Check if the response is HTML
-                if 'text/html' in e.response.headers.get('Content-Type', '').lower():
-                    error_message = f"Store API returned an unexpected HTML error page (Status {status_code}). Check server logs for details."
-                else:
-                    # Try to get error details from the response body if it's JSON or plain text
-                    error_detail = e.response.json().get('error', e.response.text[:200])
-                    error_message = f"Store API returned error (Status {status_code}): {error_detail}"
-            except (json.JSONDecodeError, AttributeError):
-                error_message = f"Store API returned error (Status {e.response.status_code}): {e.response.text[:200]}"
-        elif isinstance(e, requests.exceptions.ConnectionError):
-            error_message = "Could not connect to the store API. Please check the URL or network."
-        elif isinstance(e, requests.exceptions.Timeout):
-            error_message = "The request to the store API timed out."
-
-        return jsonify({"error": error_message}), status_code # Return specific status code if available
-    except Exception as e:
-        status_code = 500
-        # Catch any other unexpected errors during the request
-        current_app.logger.error(f"Unexpected error during store API submission (Game ID: {game_id}): {e}", exc_info=True)
-        return jsonify({"error": f"An unexpected error occurred: {e}"}), 500
-    finally:
-        current_app.logger.info("=" * 80 + "\n")
-        zip_buffer.close() # Ensure the buffer is closed
+@store_bp.route('/jobs/<job_id>', methods=['GET'])
+@admin_required
+def get_submission_status(job_id):
+    """Returns the status, progress and (when finished) the result of a store submission job."""
+    job = get_job(job_id, kind=STORE_SUBMISSION_JOB)
+    if not job:
+        return jsonify({"error": "Submission job not found"}), 404
+    return jsonify(job.to_dict()), 200
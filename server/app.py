@@ -1,5 +1,7 @@
 import os, uuid
-from flask import Flask, jsonify, send_from_directory, render_template
+from flask import Flask, jsonify, send_from_directory, render_template, request, redirect, url_for
+from werkzeug.utils import safe_join
+from PIL import Image
 import datetime
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy import inspect
@@ -7,6 +9,7 @@ from flask_login import LoginManager
 from flask_migrate import Migrate
 from flask_cors import CORS
 from config import config
+from file_delivery import send_protected_file
 
 db = SQLAlchemy()
 login_manager = LoginManager()
@@ -38,10 +41,17 @@ def create_app(config_name='default'):
 
     from models import User, AnonymousUser, metadata as models_metadata
     migrate.init_app(app, db, metadata=models_metadata)
+    from storage_stats import register_storage_listeners
+    register_storage_listeners() # Keeps per-game storage stats current on every flush
     from flask_login import login_required
     cors.init_app(app, resources={r"/api/*": {"origins": "*"}})
     login_manager.anonymous_user = AnonymousUser
 
+    from upload_storage import init_upload_storage, get_upload_storage
+    init_upload_storage(app) # Local folder or S3-compatible bucket (UPLOAD_STORAGE)
+    from static_assets import init_static_assets, send_static_asset
+    init_static_assets(app, client_folder) # Fingerprints client/js and client/css for asset_url()
+
     # Context processor to inject 'now' function into templates
     @app.context_processor
     def inject_now():
@@ -60,15 +70,65 @@ def create_app(config_name='default'):
 
     @app.route('/<path:filename>')
     def serve_static(filename):
-        return send_from_directory(client_folder, filename)
+        return send_static_asset(app, filename) or send_from_directory(client_folder, filename)
 
-    @login_required
     @app.route('/uploads/<path:filename>')
+    @login_required # Must wrap the view itself: above @app.route it was never applied
     def serve_upload(filename):
         if '..' in filename or filename.startswith('/'):
             return jsonify({"error": "Invalid file path"}), 400
-        
-        return send_from_directory(uploads_folder, filename)
+
+        if any(key in request.args for key in ('w', 'fmt', 'q')):
+            return serve_upload_variant(filename)
+        storage = get_upload_storage()
+        if storage.remote:
+            # Access is checked; the browser downloads the file straight from the bucket
+            response = redirect(storage.url(filename))
+            response.cache_control.private = True
+            response.cache_control.max_age = 60 # Well within the pre-signed URL's lifetime
+            return response
+        if not os.path.isfile(safe_join(uploads_folder, filename) or ''):
+            return jsonify({"error": "File not found"}), 404
+        return send_protected_file(uploads_folder, filename, app.config['UPLOAD_ACCEL_PREFIX'])
+
+    def serve_upload_variant(filename):
+        """Resized copy of an upload (?w=&fmt=&q=); see image_variants.py."""
+        from pathlib import Path
+        from image_variants import VariantRequestError, parse_variant_args, variant_version, get_image_variant
+        source_path = Path(safe_join(uploads_folder, filename) or '')
+        storage = get_upload_storage()
+        if storage.remote and filename and safe_join(uploads_folder, filename):
+            source_path = storage.fetch(filename) or source_path # Rendered from the cached copy
+        if not filename or not source_path.is_file():
+            return jsonify({"error": "File not found"}), 404
+        try:
+            variant = parse_variant_args(request.args)
+        except VariantRequestError as e:
+            return jsonify({"error": str(e)}), 400
+
+        # Variant URLs carry the original's version (v=), so they can be cached for good;
+        # unversioned URLs redirect to the current version.
+        version = variant_version(source_path)
+        if request.args.get('v') != version:
+            query = {'w': variant['width'], 'fmt': variant['format'], 'q': variant['quality'], 'v': version}
+            response = redirect(url_for('serve_upload', filename=filename,
+                                        **{key: value for key, value in query.items() if value is not None}))
+            response.cache_control.private = True # Behind the login check, like the file itself
+            response.cache_control.max_age = 60
+            return response
+
+        try:
+            variant_path = get_image_variant(source_path, filename, variant)
+        except (OSError, Image.DecompressionBombError) as e:
+            app.logger.warning(f"Image variant: Could not render '{filename}': {e}")
+            return jsonify({"error": "Could not render image variant"}), 422
+        response = send_protected_file(variant_path.parent, variant_path.name, app.config['IMAGE_VARIANT_ACCEL_PREFIX'],
+                                       max_age=app.config['IMAGE_VARIANT_MAX_AGE'])
+        # Browser cache only: a shared cache would hand protected images to anyone
+        response.cache_control.public = False # send_file marks responses with a max_age public
+        response.cache_control.private = True
+        response.cache_control.immutable = True
+        return response
 
     @app.route('/api/status')
     def api_status():
@@ -76,6 +136,8 @@ def create_app(config_name='default'):
 
     from api.games import games_bp
     app.register_blueprint(games_bp, url_prefix='/api/games')
+    from api.import_uploads import import_uploads_bp
+    app.register_blueprint(import_uploads_bp, url_prefix='/api/games/import/uploads')
     from api.rooms import rooms_bp
     app.register_blueprint(rooms_bp, url_prefix='/api')
     from api.connections import connections_bp
@@ -0,0 +1,457 @@
+# /server/backup.py
+"""
+Incremental, deduplicated backup and restore of a whole instance (all database tables and
+the client/uploads tree).
+
+Usage (from the server directory):
+    python backup.py backup  <repository>                 # create a snapshot
+    python backup.py list    <repository>                 # list snapshots
+    python backup.py restore <repository> [--snapshot ID] [--workers N] [--yes]
+    python backup.py prune   <repository> --keep N        # drop old snapshots and unused chunks
+
+Repository layout:
+    config.json             repository version and chunking parameters
+    chunks/ab/<sha256>      content chunks ('Z' + zlib data, or 'R' + raw data)
+    snapshots/<id>.json     one manifest per backup: tables and files as lists of chunk hashes
+
+Data is cut into content-defined chunks, so a changed row or file only produces new chunks
+around the change; everything else is referenced from chunks stored by earlier runs.
+Unchanged upload files (same size and mtime as in the previous snapshot) are not even read.
+"""
+import os
+import sys
+import json
+import uuid
+import zlib
+import base64
+import random
+import hashlib
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, date
+from enum import Enum as PyEnum
+from pathlib import Path
+from sqlalchemy import select, update, bindparam
+from sqlalchemy.sql import sqltypes
+
+REPOSITORY_VERSION = 1
+
+# Upload files up to this size are stored as a single chunk (most images)
+WHOLE_FILE_MAX_BYTES = 1024 * 1024
+# Content-defined chunking of larger files (gear rolling hash, FastCDC-style)
+FILE_CHUNK_MIN_BYTES = 256 * 1024
+FILE_CHUNK_AVG_BITS = 20 # Average chunk size of 2**20 bytes beyond the minimum
+FILE_CHUNK_MAX_BYTES = 4 * 1024 * 1024
+# Table dumps are JSON lines; chunks end after a line whose hash matches, so they follow rows
+TABLE_CHUNK_MIN_BYTES = 16 * 1024
+TABLE_CHUNK_LINE_MASK = 0x3F # ~1 in 64 lines ends a chunk (once past the minimum)
+TABLE_CHUNK_MAX_BYTES = 1024 * 1024
+
+READ_BUFFER_SIZE = 8 * 1024 * 1024
+ROW_BATCH_SIZE = 1000
+
+_MASK_64 = (1 << 64) - 1
+# Fixed-seed gear table: chunk boundaries must be identical across runs and machines
+_GEAR = [random.Random(0x61647665 + i).getrandbits(64) for i in range(256)]
+
+def _gear_cut(data, start: int, end: int) -> int:
+    """Returns the end offset of the chunk starting at start (data[start:end] is available)."""
+    position = start + FILE_CHUNK_MIN_BYTES
+    if position >= end:
+        return end
+    mask = ((1 << FILE_CHUNK_AVG_BITS) - 1) << (64 - FILE_CHUNK_AVG_BITS) # Use the well-mixed high bits
+    fingerprint = 0
+    gear = _GEAR
+    for byte in data[position:end]:
+        fingerprint = ((fingerprint << 1) + gear[byte]) & _MASK_64
+        position += 1
+        if not fingerprint & mask:
+            return position
+    return end
+
+class ChunkRepository:
+    """A directory of content-addressed, compressed chunks plus snapshot manifests."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.chunks_dir = self.path / 'chunks'
+        self.snapshots_dir = self.path / 'snapshots'
+        self._known = None
+        self._lock = threading.Lock()
+        self.stats = {'chunks_new': 0, 'chunks_reused': 0, 'bytes_new': 0, 'bytes_stored': 0, 'bytes_reused': 0}
+
+    @classmethod
+    def open(cls, path, create: bool = False) -> 'ChunkRepository':
+        repository = cls(path)
+        config_path = repository.path / 'config.json'
+        if not config_path.is_file():
+            if not create:
+                raise FileNotFoundError(f"No backup repository at {repository.path}")
+            repository.chunks_dir.mkdir(parents=True, exist_ok=True)
+            repository.snapshots_dir.mkdir(parents=True, exist_ok=True)
+            config = {'version': REPOSITORY_VERSION, 'created_at': datetime.utcnow().isoformat() + 'Z',
+                      'chunking': {'file_min': FILE_CHUNK_MIN_BYTES, 'file_avg_bits': FILE_CHUNK_AVG_BITS,
+                                   'file_max': FILE_CHUNK_MAX_BYTES, 'whole_file_max': WHOLE_FILE_MAX_BYTES}}
+            _write_atomic(config_path, json.dumps(config, indent=2).encode('utf-8'))
+        else:
+            with open(config_path, encoding='utf-8') as config_file:
+                config = json.load(config_file)
+            if config.get('version') != REPOSITORY_VERSION:
+                raise ValueError(f"Unsupported repository version {config.get('version')}")
+        return repository
+
+    def _chunk_path(self, digest: str) -> Path:
+        return self.chunks_dir / digest[:2] / digest
+
+    def _known_chunks(self) -> set:
+        if self._known is None:
+            self._known = {path.name for path in self.chunks_dir.glob('*/*') if not path.name.endswith('.tmp')}
+        return self._known
+
+    def put(self, data: bytes) -> str:
+        """Stores a chunk unless an identical one exists; returns its hash."""
+        digest = hashlib.sha256(data).hexdigest()
+        with self._lock:
+            if digest in self._known_chunks():
+                self.stats['chunks_reused'] += 1
+                self.stats['bytes_reused'] += len(data)
+                return digest
+        compressed = zlib.compress(data, 6)
+        payload = b'Z' + compressed if len(compressed) < len(data) else b'R' + data
+        path = self._chunk_path(digest)
+        path.parent.mkdir(exist_ok=True)
+        _write_atomic(path, payload)
+        with self._lock:
+            self._known_chunks().add(digest)
+            self.stats['chunks_new'] += 1
+            self.stats['bytes_new'] += len(data)
+            self.stats['bytes_stored'] += len(payload)
+        return digest
+
+    def get(self, digest: str) -> bytes:
+        with open(self._chunk_path(digest), 'rb') as chunk_file:
+            payload = chunk_file.read()
+        data = zlib.decompress(payload[1:]) if payload[:1] == b'Z' else payload[1:]
+        if hashlib.sha256(data).hexdigest() != digest:
+            raise ValueError(f"Chunk {digest} is corrupt")
+        return data
+
+    def snapshots(self) -> list[dict]:
+        """Returns all snapshot manifests, oldest first."""
+        manifests = []
+        for path in sorted(self.snapshots_dir.glob('*.json')):
+            with open(path, encoding='utf-8') as manifest_file:
+                manifests.append(json.load(manifest_file))
+        return sorted(manifests, key=lambda manifest: manifest['created_at'])
+
+    def load_snapshot(self, snapshot_id: str = None) -> dict:
+        manifests = self.snapshots()
+        if not manifests:
+            raise FileNotFoundError("The repository contains no snapshots")
+        if snapshot_id is None:
+            return manifests[-1]
+        for manifest in manifests:
+            if manifest['id'] == snapshot_id or manifest['id'].startswith(snapshot_id):
+                return manifest
+        raise FileNotFoundError(f"Snapshot '{snapshot_id}' not found")
+
+    def save_snapshot(self, manifest: dict):
+        # Written last: a backup that fails halfway leaves only unreferenced chunks behind
+        _write_atomic(self.snapshots_dir / f"{manifest['id']}.json", json.dumps(manifest).encode('utf-8'))
+
+def _write_atomic(path: Path, data: bytes):
+    temp_path = path.with_name(f'{path.name}.{uuid.uuid4().hex}.tmp')
+    with open(temp_path, 'wb') as output_file:
+        output_file.write(data)
+    os.replace(temp_path, path)
+
+# --- Row Encoding ---
+
+def _encode_value(value):
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if isinstance(value, PyEnum):
+        return value.name # SQLAlchemy stores enum names
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return base64.b64encode(bytes(value)).decode('ascii')
+    return value
+
+def _decode_value(column, value):
+    if value is None:
+        return None
+    column_type = column.type
+    if isinstance(column_type, sqltypes.Uuid):
+        return uuid.UUID(value)
+    if isinstance(column_type, sqltypes.Enum) and column_type.enum_class:
+        return column_type.enum_class[value]
+    if isinstance(column_type, sqltypes.DateTime):
+        return datetime.fromisoformat(value)
+    if isinstance(column_type, sqltypes.Date):
+        return date.fromisoformat(value)
+    if isinstance(column_type, sqltypes.LargeBinary):
+        return base64.b64decode(value)
+    return value
+
+# --- Backup ---
+
+def _backup_table(repository: ChunkRepository, connection, table) -> dict:
+    """Streams a table as JSON lines into record-aligned, content-defined chunks."""
+    columns = [column.name for column in table.columns]
+    order_by = list(table.primary_key.columns) or list(table.columns)
+    result = connection.execution_options(yield_per=ROW_BATCH_SIZE).execute(select(table).order_by(*order_by))
+    chunks, buffer, rows, total = [], [], 0, 0
+    buffered = 0
+    for row in result:
+        line = json.dumps([_encode_value(value) for value in row], separators=(',', ':')).encode('utf-8') + b'\n'
+        buffer.append(line)
+        buffered += len(line)
+        rows += 1
+        if buffered >= TABLE_CHUNK_MAX_BYTES or (
+                buffered >= TABLE_CHUNK_MIN_BYTES and not zlib.crc32(line) & TABLE_CHUNK_LINE_MASK):
+            chunks.append(repository.put(b''.join(buffer)))
+            total += buffered
+            buffer, buffered = [], 0
+    if buffer:
+        chunks.append(repository.put(b''.join(buffer)))
+        total += buffered
+    return {'columns': columns, 'rows': rows, 'bytes': total, 'chunks': chunks}
+
+def _backup_file(repository: ChunkRepository, path: Path) -> list[str]:
+    """Stores a file as chunks (one chunk for small files, content-defined chunks otherwise)."""
+    with open(path, 'rb') as source_file:
+        if path.stat().st_size <= WHOLE_FILE_MAX_BYTES:
+            return [repository.put(source_file.read())]
+        chunks = []
+        buffer = b''
+        eof = False
+        while buffer or not eof:
+            if not eof and len(buffer) < FILE_CHUNK_MAX_BYTES:
+                data = source_file.read(READ_BUFFER_SIZE)
+                eof = not data
+                buffer += data
+                continue
+            cut = _gear_cut(buffer, 0, min(len(buffer), FILE_CHUNK_MAX_BYTES))
+            chunks.append(repository.put(buffer[:cut]))
+            buffer = buffer[cut:]
+        return chunks
+
+def run_backup(app, repository_path, workers: int = None, log=print) -> dict:
+    """Creates a snapshot of all tables and the uploads folder. Returns the manifest."""
+    from app import db
+
+    repository = ChunkRepository.open(repository_path, create=True)
+    previous = repository.snapshots()
+    previous_files = previous[-1]['files'] if previous else {}
+    started = datetime.utcnow()
+    manifest = {'id': started.strftime('%Y%m%dT%H%M%SZ') + '-' + uuid.uuid4().hex[:8],
+                'created_at': started.isoformat() + 'Z', 'app_version': app.config.get('APP_VERSION'),
+                'tables': {}, 'files': {}}
+
+    with app.app_context():
+        connection = db.session.connection()
+        if connection.dialect.name == 'postgresql':
+            # One consistent view of all tables while they are read
+            connection.exec_driver_sql('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY')
+        for table in db.metadata.sorted_tables:
+            manifest['tables'][table.name] = _backup_table(repository, connection, table)
+            log(f"INFO: Table {table.name}: {manifest['tables'][table.name]['rows']} rows")
+        db.session.rollback()
+        uploads_dir = Path(app.config['UPLOADS_FOLDER'])
+
+    files = sorted(path for path in uploads_dir.rglob('*') if path.is_file())
+
+    def backup_one(path: Path):
+        relative_path = path.relative_to(uploads_dir).as_posix()
+        stat = path.stat()
+        entry = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'mode': stat.st_mode & 0o777}
+        known = previous_files.get(relative_path)
+        if known and known['size'] == stat.st_size and known['mtime_ns'] == stat.st_mtime_ns:
+            entry['chunks'] = known['chunks'] # Unchanged since the last snapshot: not read
+            with repository._lock:
+                repository.stats['bytes_reused'] += stat.st_size
+        else:
+            entry['chunks'] = _backup_file(repository, path)
+        return relative_path, entry
+
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1) as executor:
+        for relative_path, entry in executor.map(backup_one, files):
+            manifest['files'][relative_path] = entry
+
+    manifest['stats'] = dict(repository.stats, duration_seconds=round((datetime.utcnow() - started).total_seconds(), 2))
+    repository.save_snapshot(manifest)
+    stats = manifest['stats']
+    log(f"SUCCESS: Snapshot {manifest['id']}: {len(manifest['tables'])} tables, {len(files)} files, "
+        f"{stats['chunks_new']} new chunks ({stats['bytes_new']} bytes, {stats['bytes_stored']} stored), "
+        f"{stats['bytes_reused']} bytes deduplicated, {stats['duration_seconds']}s")
+    return manifest
+
+# --- Restore ---
+
+def _restore_file(repository: ChunkRepository, uploads_dir: Path, relative_path: str, entry: dict):
+    target_path = (uploads_dir / relative_path).resolve()
+    if uploads_dir.resolve() not in target_path.parents:
+        raise ValueError(f"Refusing to restore outside the uploads folder: {relative_path}")
+    stat = target_path.stat() if target_path.is_file() else None
+    if stat and stat.st_size == entry['size']:
+        # Skip files that are already identical: same mtime as in the snapshot (restore sets
+        # it, and the backup trusts it the same way), else the same chunk hashes
+        if stat.st_mtime_ns == entry['mtime_ns']:
+            return False
+        if _backup_file_digests(target_path) == entry['chunks']:
+            os.utime(target_path, ns=(entry['mtime_ns'], entry['mtime_ns'])) # Next time size and mtime suffice
+            return False
+    target_path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = target_path.with_name(f'{target_path.name}.{uuid.uuid4().hex}.tmp')
+    with open(temp_path, 'wb') as output_file:
+        for digest in entry['chunks']:
+            output_file.write(repository.get(digest))
+    os.chmod(temp_path, entry.get('mode', 0o644))
+    os.replace(temp_path, target_path)
+    os.utime(target_path, ns=(entry['mtime_ns'], entry['mtime_ns']))
+    return True
+
+def _backup_file_digests(path: Path) -> list[str]:
+    """Computes the chunk hashes a file would have, without storing anything."""
+    class _DigestOnly:
+        stats = {}
+        def put(self, data):
+            return hashlib.sha256(data).hexdigest()
+    return _backup_file(_DigestOnly(), path)
+
+def _restore_table(repository: ChunkRepository, connection, table, table_manifest: dict) -> int:
+    columns = [table.c[name] for name in table_manifest['columns'] if name in table.c]
+    indexes = [table_manifest['columns'].index(column.name) for column in columns]
+    # Self-references (e.g. entities.container_id) are filled in after all rows exist
+    deferred = [column for column in columns
+                if any(foreign_key.column.table is table for foreign_key in column.foreign_keys)]
+    primary_key = list(table.primary_key.columns)
+    rows = 0
+    deferred_values = []
+    for digest in table_manifest['chunks']:
+        batch = []
+        for line in repository.get(digest).splitlines():
+            values = json.loads(line)
+            row = {column.name: _decode_value(column, values[index]) for column, index in zip(columns, indexes)}
+            if deferred:
+                link = {column.name: row[column.name] for column in deferred}
+                if any(value is not None for value in link.values()):
+                    deferred_values.append({**{f'pk_{key.name}': row[key.name] for key in primary_key},
+                                            **{f'new_{name}': value for name, value in link.items()}})
+                    for column in deferred:
+                        row[column.name] = None
+            batch.append(row)
+        if batch:
+            connection.execute(table.insert(), batch)
+            rows += len(batch)
+    if deferred_values:
+        statement = update(table).where(*[key == bindparam(f'pk_{key.name}') for key in primary_key])\
+            .values({column.name: bindparam(f'new_{column.name}') for column in deferred})
+        for start in range(0, len(deferred_values), ROW_BATCH_SIZE):
+            connection.execute(statement, deferred_values[start:start + ROW_BATCH_SIZE])
+    return rows
+
+def run_restore(app, repository_path, snapshot_id: str = None, workers: int = None, log=print) -> dict:
+    """
+    Rebuilds the database and uploads folder from a snapshot. All tables are dropped and
+    recreated first. Upload files are restored on a thread pool while the tables load.
+    """
+    from app import db
+
+    repository = ChunkRepository.open(repository_path)
+    manifest = repository.load_snapshot(snapshot_id)
+    log(f"INFO: Restoring snapshot {manifest['id']} ({manifest['created_at']})")
+
+    with app.app_context():
+        uploads_dir = Path(app.config['UPLOADS_FOLDER'])
+        uploads_dir.mkdir(parents=True, exist_ok=True)
+        executor = ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1)
+        futures = [executor.submit(_restore_file, repository, uploads_dir, relative_path, entry)
+                   for relative_path, entry in manifest['files'].items()]
+
+        db.drop_all()
+        db.create_all()
+        try:
+            with db.engine.begin() as connection:
+                for table in db.metadata.sorted_tables:
+                    table_manifest = manifest['tables'].get(table.name)
+                    if table_manifest:
+                        rows = _restore_table(repository, connection, table, table_manifest)
+                        log(f"INFO: Table {table.name}: {rows} rows restored")
+        finally:
+            written = sum(1 for future in futures if future.result())
+            executor.shutdown()
+
+    log(f"SUCCESS: Restored {len(manifest['tables'])} tables and {len(futures)} files "
+        f"({written} written, {len(futures) - written} already up to date).")
+    return manifest
+
+# --- Prune ---
+
+def run_prune(repository_path, keep: int, log=print):
+    """Deletes all but the newest `keep` snapshots, then every chunk no snapshot references."""
+    repository = ChunkRepository.open(repository_path)
+    manifests = repository.snapshots()
+    removed = manifests[:-keep] if keep > 0 else manifests
+    for manifest in removed:
+        (repository.snapshots_dir / f"{manifest['id']}.json").unlink()
+    referenced = set()
+    for manifest in repository.snapshots():
+        for table_manifest in manifest['tables'].values():
+            referenced.update(table_manifest['chunks'])
+        for entry in manifest['files'].values():
+            referenced.update(entry['chunks'])
+    freed = 0
+    deleted = 0
+    for path in repository.chunks_dir.glob('*/*'):
+        if path.name not in referenced:
+            freed += path.stat().st_size
+            path.unlink()
+            deleted += 1
+    log(f"SUCCESS: Removed {len(removed)} snapshots and {deleted} chunks ({freed} bytes freed).")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Backup and restore of the whole AdventureZ instance.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    backup_parser = subparsers.add_parser('backup', help="Create a new snapshot")
+    backup_parser.add_argument('repository')
+    backup_parser.add_argument('--workers', type=int, default=None)
+    list_parser = subparsers.add_parser('list', help="List snapshots")
+    list_parser.add_argument('repository')
+    restore_parser = subparsers.add_parser('restore', help="Replace the database and uploads with a snapshot")
+    restore_parser.add_argument('repository')
+    restore_parser.add_argument('--snapshot', default=None, help="Snapshot id (or prefix); defaults to the newest")
+    restore_parser.add_argument('--workers', type=int, default=None)
+    restore_parser.add_argument('--yes', action='store_true', help="Do not ask for confirmation")
+    prune_parser = subparsers.add_parser('prune', help="Remove old snapshots and unreferenced chunks")
+    prune_parser.add_argument('repository')
+    prune_parser.add_argument('--keep', type=int, required=True)
+    args = parser.parse_args(argv)
+
+    if args.command == 'list':
+        for manifest in ChunkRepository.open(args.repository).snapshots():
+            stats = manifest.get('stats', {})
+            print(f"{manifest['id']}  {manifest['created_at']}  {len(manifest['files'])} files  "
+                  f"{stats.get('bytes_new', 0)} new bytes")
+        return 0
+    if args.command == 'prune':
+        run_prune(args.repository, args.keep)
+        return 0
+
+    from app import create_app
+    app = create_app(os.getenv('FLASK_CONFIG') or 'development')
+    if args.command == 'backup':
+        run_backup(app, args.repository, workers=args.workers)
+    elif args.command == 'restore':
+        if not args.yes:
+            confirm = input("All tables and upload files will be replaced by the snapshot. Are you sure? (yes/no): ")
+            if confirm.lower() not in ('yes', 'y', 'ja', 'j'):
+                print("INFO: Restore cancelled.")
+                return 1
+        run_restore(app, args.repository, snapshot_id=args.snapshot, workers=args.workers)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
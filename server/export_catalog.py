@@ -0,0 +1,42 @@
+# /server/export_catalog.py
+"""
+Exports several games (or the whole catalog) into one archive.
+
+Usage (from the server directory):
+    python export_catalog.py catalog.zip                     # all games
+    python export_catalog.py catalog.zip --game ID --game ID # selected games
+
+Each game is stored under games/<game_id>/ in the regular export format; images shared
+between games are stored once. Same writer as the admin endpoint /api/admin/catalog-exports.
+"""
+import os
+import sys
+import uuid
+import argparse
+from app import create_app
+from api.games import write_catalog_archive
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export several games into one archive.")
+    parser.add_argument('output', help="Path of the ZIP file to write")
+    parser.add_argument('--game', action='append', dest='game_ids', metavar='GAME_ID',
+                        help="Game to include (repeatable); defaults to all games")
+    args = parser.parse_args(argv)
+
+    try:
+        game_ids = [uuid.UUID(game_id) for game_id in args.game_ids] if args.game_ids else None
+    except ValueError as e:
+        print(f"ERROR: Invalid game ID: {e}")
+        return 1
+
+    app = create_app(os.getenv('FLASK_CONFIG') or 'development')
+    with app.app_context():
+        def report_progress(done, total, game, archive_bytes):
+            print(f"INFO: [{done}/{total}] {game.name} ({archive_bytes} bytes written)")
+
+        catalog = write_catalog_archive(args.output, game_ids, progress=report_progress)
+    print(f"SUCCESS: Exported {len(catalog['games'])} games and {catalog['image_files']} image files to {args.output}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,50 @@
+import mimetypes
+from pathlib import Path
+from urllib.parse import quote
+from flask import current_app, request, Response
+from werkzeug.utils import send_file
+
+# --- Protected File Delivery ---
+# Files behind an access check (uploads, image variants) are either streamed by the worker
+# or, with UPLOAD_DELIVERY set, handed to the front proxy once the check has passed:
+#   'x-accel-redirect'  nginx: the response only names an internal location, e.g.
+#                           location /_protected/uploads/ { internal; alias /srv/adventurez/client/uploads/; }
+#   'x-sendfile'        Apache mod_xsendfile / lighttpd: the response names the absolute path
+# The proxy then sends the bytes itself (including ranges), so large audio files no longer
+# hold a worker for the whole download.
+
+DELIVERY_MODES = ('python', 'x-accel-redirect', 'x-sendfile')
+
+def send_protected_file(root, relative_path: str, accel_prefix: str | None = None, max_age: int | None = None) -> Response:
+    """
+    Sends root/relative_path using the configured UPLOAD_DELIVERY mode.
+    The caller has validated relative_path and checked access.
+
+    Args:
+        root: Folder the file lives in.
+        relative_path: '/'-separated path inside root.
+        accel_prefix: Internal nginx location mapped to root; without it X-Accel-Redirect
+                      delivery falls back to Python.
+        max_age: Cache-Control max-age for the response (None: revalidate every time).
+    """
+    path = Path(root) / relative_path
+    mode = current_app.config.get('UPLOAD_DELIVERY', 'python')
+
+    if mode == 'x-accel-redirect' and accel_prefix:
+        response = Response(mimetype=mimetypes.guess_type(path.name)[0] or 'application/octet-stream')
+        response.headers['X-Accel-Redirect'] = accel_prefix.rstrip('/') + '/' + quote(relative_path)
+        if max_age is not None:
+            response.cache_control.max_age = max_age
+        return response
+
+    if mode == 'x-sendfile':
+        # Werkzeug adds the validators and headers; the proxy streams the file
+        return send_file(path, request.environ, max_age=max_age, use_x_sendfile=True)
+
+    if request.range and len(request.range.ranges) > 1:
+        # Werkzeug only serves single ranges; ignoring the header (full 200) is valid HTTP,
+        # answering 416 to a satisfiable request is not
+        request.environ.pop('HTTP_RANGE', None)
+    response = send_file(path, request.environ, max_age=max_age)
+    response.headers.setdefault('Accept-Ranges', 'bytes')
+    return response
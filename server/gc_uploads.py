@@ -0,0 +1,43 @@
+# /server/gc_uploads.py
+"""
+Reports and deletes uploaded images that no game, room or entity references.
+
+Usage (from the server directory):
+    python gc_uploads.py                     # dry run: list orphans and their total size
+    python gc_uploads.py --delete            # delete orphans older than UPLOAD_GC_GRACE_SECONDS
+    python gc_uploads.py --delete --grace-days 1
+
+Same collector as the admin endpoint /api/admin/uploads/gc; suitable for a cron job.
+"""
+import os
+import sys
+import argparse
+from app import create_app
+from upload_gc import collect_orphaned_uploads
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Report and delete orphaned uploads.")
+    parser.add_argument('--delete', action='store_true', help="Delete expired orphans (default is a dry run)")
+    parser.add_argument('--grace-days', type=float, default=None,
+                        help="Only delete orphans older than this (default: UPLOAD_GC_GRACE_SECONDS)")
+    parser.add_argument('--quiet', action='store_true', help="Do not list the individual orphans")
+    args = parser.parse_args(argv)
+
+    app = create_app(os.getenv('FLASK_CONFIG') or 'development')
+    with app.app_context():
+        grace_seconds = int(args.grace_days * 86400) if args.grace_days is not None else None
+        summary = collect_orphaned_uploads(dry_run=not args.delete, grace_seconds=grace_seconds)
+
+    if not args.quiet:
+        for orphan in summary['orphans']:
+            print(f"INFO: Orphan {orphan['path']} ({orphan['size']} bytes)")
+    print(f"INFO: {summary['orphan_count']} orphans ({summary['orphan_bytes']} bytes), "
+          f"{summary['expired_count']} past the grace period ({summary['expired_bytes']} bytes)")
+    if args.delete:
+        print(f"SUCCESS: Deleted {summary['deleted_count']} files ({summary['deleted_bytes']} bytes)")
+    else:
+        print("INFO: Dry run, nothing deleted (use --delete)")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
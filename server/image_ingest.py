@@ -0,0 +1,191 @@
+from concurrent.futures import as_completed
+from pathlib import Path
+from flask import current_app
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from app import db
+from models import ImageMetadata
+from image_utils import VARIANT_FORMATS, normalize_image_file
+from storage_stats import adjust_for_file_change
+from jobs import submit_job, get_process_pool
+from upload_index import index_path
+from upload_storage import get_upload_storage
+
+# --- Upload Ingest Pipeline ---
+# Every uploaded raster image is measured and hashed into image_metadata. With
+# UPLOAD_INGEST_NORMALIZE on it is first EXIF-oriented, fitted into UPLOAD_INGEST_MAX_SIZE and
+# re-encoded as UPLOAD_INGEST_FORMAT. The upload is stored under its final name right away
+# (see ingest_filename), so the name returned to the client stays valid while the work runs
+# on the process pool; the file is replaced atomically when it is done.
+
+INGEST_JOB = 'image_ingest'
+NORMALIZED_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.bmp', '.webp'} # GIFs are left alone (animations)
+METADATA_EXTENSIONS = NORMALIZED_EXTENSIONS | {'.gif'}
+
+def ingest_filename(filename: str) -> str:
+    """The name an upload is stored under: normalized images get the extension of UPLOAD_INGEST_FORMAT."""
+    path = Path(filename)
+    if not current_app.config['UPLOAD_INGEST_NORMALIZE'] or path.suffix.lower() not in NORMALIZED_EXTENSIONS:
+        return filename
+    extension = VARIANT_FORMATS[current_app.config['UPLOAD_INGEST_FORMAT']][1]
+    if path.suffix.lower() == extension or (extension == '.jpg' and path.suffix.lower() == '.jpeg'):
+        return filename
+    return path.stem + extension
+
+def record_image_metadata(relative_path: str, info: dict, commit: bool = True) -> ImageMetadata:
+    """Inserts or updates the image_metadata row of an upload from a normalize_image_file result."""
+    metadata = db.session.get(ImageMetadata, relative_path) or ImageMetadata(path=relative_path)
+    metadata.width = info['width']
+    metadata.height = info['height']
+    metadata.format = info['format']
+    metadata.byte_size = info['byte_size']
+    metadata.content_hash = info['content_hash']
+    metadata.original_byte_size = info['original_byte_size']
+    metadata.placeholder = info.get('placeholder')
+    db.session.add(metadata)
+    if commit:
+        db.session.commit()
+    return metadata
+
+def forget_image_metadata(relative_path: str, commit: bool = True):
+    """Drops the metadata of a deleted or renamed upload (or of everything below a deleted folder)."""
+    relative_path = relative_path.strip('/')
+    db.session.execute(db.delete(ImageMetadata).where(
+        (ImageMetadata.path == relative_path) | ImageMetadata.path.startswith(relative_path + '/', autoescape=True)))
+    if commit:
+        db.session.commit()
+
+def move_image_metadata(old_path: str, new_path: str, commit: bool = True):
+    """Follows a renamed upload (or folder) in image_metadata."""
+    old_path, new_path = old_path.strip('/'), new_path.strip('/')
+    db.session.execute(db.update(ImageMetadata).where(
+        (ImageMetadata.path == old_path) | ImageMetadata.path.startswith(old_path + '/', autoescape=True)
+    ).values(path=db.literal(new_path) + db.func.substr(ImageMetadata.path, len(old_path) + 1)))
+    if commit:
+        db.session.commit()
+
+def _ingest(file_path: Path, relative_path: str, run) -> dict:
+    """Normalizes (if enabled) and records one upload; run executes normalize_image_file."""
+    config = current_app.config
+    normalize = config['UPLOAD_INGEST_NORMALIZE'] and file_path.suffix.lower() in NORMALIZED_EXTENSIONS
+    info = run(normalize_image_file, str(file_path), str(file_path),
+               config['UPLOAD_INGEST_MAX_SIZE'] if normalize else None,
+               config['UPLOAD_INGEST_FORMAT'] if normalize else None,
+               config['UPLOAD_INGEST_QUALITY'])
+    if normalize:
+        get_upload_storage().push(relative_path) # Re-encoded in place
+    if info['byte_size'] != info['original_byte_size']:
+        adjust_for_file_change(relative_path, info['original_byte_size'], info['byte_size'], commit=False)
+    metadata = record_image_metadata(relative_path, info, commit=False)
+    index_path(relative_path) # Size and dimensions changed
+    current_app.logger.info(f"Ingest: '{relative_path}' {metadata.width}x{metadata.height} {metadata.format}, "
+                            f"{info['original_byte_size']} -> {info['byte_size']} bytes")
+    return metadata.to_dict()
+
+def _run_ingest_job(job, file_path, relative_path) -> dict:
+    """Job body: the Pillow work runs on the process pool, the bookkeeping in this thread."""
+    pool = get_process_pool()
+    return _ingest(Path(file_path), relative_path, lambda func, *args: pool.submit(func, *args).result())
+
+def start_ingest(file_path: Path, relative_path: str, owner_id=None):
+    """
+    Runs the ingest pipeline for a freshly saved upload: as a background job when
+    UPLOAD_INGEST_BACKGROUND is set, else inline. Files that are not raster images are skipped.
+
+    Returns:
+        The Job when queued, the metadata dict when run inline, or None when skipped.
+    """
+    if file_path.suffix.lower() not in METADATA_EXTENSIONS:
+        return None
+    if current_app.config['UPLOAD_INGEST_BACKGROUND']:
+        return submit_job(INGEST_JOB, _run_ingest_job, str(file_path), relative_path, owner_id=owner_id)
+    try:
+        return _ingest(file_path, relative_path, lambda func, *args: func(*args))
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Ingest: Failed to process '{relative_path}': {e}")
+        return None
+
+def ingest_batch(files: list[dict]) -> list[dict]:
+    """
+    Moves a batch of extracted uploads into place through the ingest pipeline, normalizing
+    them in parallel on the process pool; the database bookkeeping is done here and
+    committed once.
+
+    Args:
+        files: Dicts with 'temp_path' (where the upload was extracted), 'target_path' (final
+               location), 'relative_path' (of the target) and 'old_size' (of a file it replaces).
+
+    Returns:
+        One result per file, in order: the metadata dict, or {'error': ...}.
+    """
+    config = current_app.config
+    pool = get_process_pool()
+    futures = {}
+    for index, item in enumerate(files):
+        normalize = config['UPLOAD_INGEST_NORMALIZE'] and Path(item['target_path']).suffix.lower() in NORMALIZED_EXTENSIONS
+        future = pool.submit(normalize_image_file, str(item['temp_path']), str(item['target_path']),
+                             config['UPLOAD_INGEST_MAX_SIZE'] if normalize else None,
+                             config['UPLOAD_INGEST_FORMAT'] if normalize else None,
+                             config['UPLOAD_INGEST_QUALITY'])
+        futures[future] = index
+
+    results = [None] * len(files)
+    for future in as_completed(futures):
+        index = futures[future]
+        item = files[index]
+        try:
+            info = future.result()
+        except Exception as e:
+            Path(item['temp_path']).unlink(missing_ok=True)
+            current_app.logger.warning(f"Ingest: Failed to process '{item['relative_path']}': {e}")
+            results[index] = {'error': "Not a readable image"}
+            continue
+        get_upload_storage().push(item['relative_path'])
+        adjust_for_file_change(item['relative_path'], item['old_size'], info['byte_size'], commit=False)
+        results[index] = record_image_metadata(item['relative_path'], info, commit=False).to_dict()
+        index_path(item['relative_path'], commit=False)
+    db.session.commit()
+    return results
+
+def image_previews(relative_paths) -> dict[str, dict]:
+    """
+    Width, height and placeholder of uploaded images, so a client can reserve the space and
+    show something while an image loads. Images without current metadata (uploaded before the
+    ingest pipeline, copied in by hand or compressed since) are measured once here and recorded.
+
+    Returns:
+        relative path -> {'width', 'height', 'placeholder'}; unknown or unreadable files are left out.
+    """
+    paths = {path for path in relative_paths if path}
+    if not paths:
+        return {}
+    storage = get_upload_storage()
+    known = {metadata.path: metadata for metadata in db.session.scalars(
+        select(ImageMetadata).where(ImageMetadata.path.in_(paths)))}
+    previews, recorded = {}, False
+    for path in paths:
+        metadata = known.get(path)
+        # With uploads in a bucket the recorded metadata is trusted (the upload API keeps it
+        # current), rather than paying a request per image per move
+        current = metadata is not None and metadata.placeholder is not None and (
+            storage.remote or metadata.byte_size == storage.size(path))
+        if not current:
+            if Path(path).suffix.lower() not in METADATA_EXTENSIONS:
+                continue
+            try:
+                file_path = storage.fetch(path)
+                if file_path is None:
+                    continue
+                metadata = record_image_metadata(path, normalize_image_file(str(file_path)), commit=False)
+            except Exception as e:
+                current_app.logger.warning(f"Ingest: Could not measure '{path}': {e}")
+                continue
+            recorded = True
+        previews[path] = {'width': metadata.width, 'height': metadata.height, 'placeholder': metadata.placeholder}
+    if recorded:
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback() # Another request recorded the same image first
+    return previews
@@ -1,16 +1,53 @@
+import io
 import os
+import re
+import uuid
+import base64
+import hashlib
+import logging
 from pathlib import Path
 from PIL import Image, ExifTags
-from flask import current_app
+from flask import current_app, has_app_context
 
 # Define image subdirectories relative to the main uploads folder
 IMAGE_SUBDIRS = {
     'game_start': 'avonturen',
     'game_win': 'avonturen',
+    'game_loss': 'avonturen',
     'room': 'images/kamers',
     'entity': 'images/entiteiten',
 }
 
+# Folders that grow with the content; with UPLOAD_SHARDED_LAYOUT new files go into two levels of
+# hash-prefix subfolders ('ab/cd/hal.jpg'), and the database stores that path. Game images stay flat.
+SHARDED_IMAGE_TYPES = ('room', 'entity')
+SHARD_PATTERN = re.compile(r'^[0-9a-f]{2}/[0-9a-f]{2}/[^/]+$')
+
+def sharded_image_folders() -> set[str]:
+    return {IMAGE_SUBDIRS[image_type] for image_type in SHARDED_IMAGE_TYPES}
+
+def shard_prefix(filename: str) -> str:
+    """The two-level subfolder a file name belongs in, e.g. 'hal.jpg' -> '6c/0f'."""
+    digest = hashlib.md5(filename.encode('utf-8'), usedforsecurity=False).hexdigest()
+    return f'{digest[0:2]}/{digest[2:4]}'
+
+def image_storage_name(filename: str, folder: str) -> str:
+    """The path (relative to its image folder) a new file in folder is stored and referenced under."""
+    if current_app.config.get('UPLOAD_SHARDED_LAYOUT') and folder in sharded_image_folders():
+        return f'{shard_prefix(filename)}/{filename}'
+    return filename
+
+def split_image_path(relative_path: str) -> tuple[str, str]:
+    """
+    Splits an uploads path into its image folder and the name the database stores:
+    'images/kamers/6c/0f/hal.jpg' -> ('images/kamers', '6c/0f/hal.jpg'); other paths split at the last '/'.
+    """
+    parts = relative_path.split('/')
+    if len(parts) > 3 and '/'.join(parts[:-3]) in sharded_image_folders() and SHARD_PATTERN.match('/'.join(parts[-3:])):
+        return '/'.join(parts[:-3]), '/'.join(parts[-3:])
+    subdir, _, filename = relative_path.rpartition('/')
+    return subdir, filename
+
 # Helper to get orientation from EXIF data
 for orientation_key in ExifTags.TAGS.keys():
     if ExifTags.TAGS[orientation_key] == 'Orientation':
@@ -22,7 +59,8 @@ def get_absolute_image_path(relative_path: str, image_type: str) -> Path | None:
     Constructs the absolute path for an image file given its relative path and type.
 
     Args:
-        relative_path: The filename stored in the database (e.g., 'my_image.png').
+        relative_path: The filename stored in the database (e.g., 'my_image.png', or
+                       '6c/0f/my_image.png' in the sharded layout).
         image_type: The type of image ('game_start', 'game_win', 'room', 'entity').
 
     Returns:
@@ -51,33 +89,80 @@ def get_absolute_image_path(relative_path: str, image_type: str) -> Path | None:
              current_app.logger.warning(f"Potential path traversal attempt blocked for: {relative_path}")
              return None
         full_path = base_uploads_dir / subdir / relative_path
+        from upload_storage import get_upload_storage # Not needed by the pool workers importing this module
+        storage = get_upload_storage()
+        if storage.remote:
+            # Uploads live in a bucket: work on a current local copy
+            return storage.fetch(f'{subdir}/{relative_path}') or full_path
+        if image_type in SHARDED_IMAGE_TYPES and '/' not in relative_path and not full_path.exists():
+            # Moved by migrate_upload_layout, database not rewritten yet
+            sharded_path = base_uploads_dir / subdir / shard_prefix(relative_path) / relative_path
+            if sharded_path.exists():
+                return sharded_path
         return full_path
     except Exception as e:
         current_app.logger.error(f"Error constructing path for '{relative_path}' in '{subdir}': {e}")
         return None
 
-def _apply_exif_orientation(image: Image.Image) -> Image.Image:
-    """Applies EXIF orientation tag to the image."""
+def _logger() -> logging.Logger:
+    """The app logger, or a module logger when running outside the app (e.g. in a worker process)."""
+    return current_app.logger if has_app_context() else logging.getLogger(__name__)
+
+# Transpose for each EXIF orientation (2-8; 1 means upright)
+ORIENTATION_TRANSPOSE = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90,
+}
+
+def _exif_orientation(image: Image.Image) -> int:
+    """The EXIF orientation tag (1 when absent or unreadable); reading it does not decode pixels."""
     try:
-        exif = image._getexif()
-        if exif is None:
-            return image
-
-        orientation = exif.get(ORIENTATION_TAG)
-
-        if orientation == 3:
-            image = image.rotate(180, expand=True)
-        elif orientation == 6:
-            image = image.rotate(270, expand=True)
-        elif orientation == 8:
-            image = image.rotate(90, expand=True)
-        # Other orientations (like flips) are less common and ignored for simplicity
-        # Reset orientation tag after applying
-        # exif[ORIENTATION_TAG] = 1 # Doesn't work directly on PIL exif data
-    except (AttributeError, KeyError, IndexError, TypeError):
-        # cases: image doesn't have getexif, exif tag not present, etc.
-        pass # Ignore errors related to EXIF processing
-    return image
+        return int(image.getexif().get(ORIENTATION_TAG, 1))
+    except (AttributeError, KeyError, IndexError, TypeError, ValueError, OSError):
+        return 1
+
+def _apply_exif_orientation(image: Image.Image) -> Image.Image:
+    """Applies the EXIF orientation (all eight values) with a lossless transpose; returns the image itself when upright."""
+    method = ORIENTATION_TRANSPOSE.get(_exif_orientation(image))
+    if method is None:
+        return image
+    return image.transpose(method)
+
+def _draft_for_size(image: Image.Image, size: tuple[int, int] | None):
+    """
+    Lets the JPEG decoder scale down by 1/2, 1/4 or 1/8 while decoding, as far as the result
+    still covers size (given in display orientation). Must be called before the pixels are
+    loaded; a no-op for other formats, which Pillow can only decode at full size.
+    """
+    if not size or image.format != 'JPEG':
+        return
+    width, height = size
+    if _exif_orientation(image) in (5, 6, 7, 8):
+        width, height = height, width # Stored sideways: the display width is the stored height
+    image.draft('RGB', (width, height))
+
+def _flatten_to_rgb(img: Image.Image) -> Image.Image:
+    """Returns the image in RGB mode for JPG saving; transparency is flattened onto white."""
+    if img.mode in ('RGBA', 'LA', 'P'):
+        # Create a white background image if alpha channel exists
+        background = Image.new('RGB', img.size, (255, 255, 255))
+        # Paste the image onto the background using the alpha channel as mask
+        try:
+            # This works for RGBA and LA
+            background.paste(img, (0, 0), img.split()[-1])
+            return background
+        except (IndexError, ValueError):
+            # Handle Palette mode (P) by converting directly to RGB
+            return img.convert('RGB')
+    if img.mode != 'RGB':
+        # Convert other modes like L (grayscale) to RGB
+        return img.convert('RGB')
+    return img # Already RGB
 
 def compress_and_convert_image(source_path: Path, quality: int = 80, max_size: tuple[int, int] = (800, 800)) -> tuple[Path | None, bool]:
     """
@@ -95,7 +180,7 @@ def compress_and_convert_image(source_path: Path, quality: int = 80, max_size: t
         - extension_changed: True if the original file extension was not '.jpg', False otherwise.
     """
     if not source_path or not source_path.is_file():
-        current_app.logger.warning(f"Compress: Source image not found or not a file: {source_path}")
+        _logger().warning(f"Compress: Source image not found or not a file: {source_path}")
         return None, False
 
     original_extension = source_path.suffix.lower()
@@ -106,7 +191,8 @@ def compress_and_convert_image(source_path: Path, quality: int = 80, max_size: t
 
     try:
         with Image.open(source_path) as img:
-            # Apply EXIF orientation before resizing/saving
+            # Decode large JPEGs at reduced scale, then apply EXIF orientation before resizing/saving
+            _draft_for_size(img, max_size)
             img = _apply_exif_orientation(img)
 
             # --- NEW: Resizing Logic ---
@@ -114,45 +200,175 @@ def compress_and_convert_image(source_path: Path, quality: int = 80, max_size: t
                 original_width, original_height = img.size
                 if original_width > max_size[0] or original_height > max_size[1]:
                     img.thumbnail(max_size, Image.Resampling.LANCZOS) # Resize in place, maintains aspect ratio
-                    current_app.logger.info(f"Resize: Resized '{source_path.name}' to fit within {max_size[0]}x{max_size[1]}. New size: {img.size}")
+                    _logger().info(f"Resize: Resized '{source_path.name}' to fit within {max_size[0]}x{max_size[1]}. New size: {img.size}")
             # --- End Resizing Logic ---
-            # Ensure image is in RGB mode for JPG saving (handles PNGs with alpha)
-            if img.mode in ('RGBA', 'LA', 'P'):
-                # Create a white background image if alpha channel exists
-                background = Image.new('RGB', img.size, (255, 255, 255))
-                # Paste the image onto the background using the alpha channel as mask
-                try:
-                    # This works for RGBA and LA
-                    background.paste(img, (0, 0), img.split()[-1])
-                    img_to_save = background
-                except IndexError:
-                    # Handle Palette mode (P) by converting directly to RGB
-                    img_to_save = img.convert('RGB')
-
-            elif img.mode != 'RGB':
-                 # Convert other modes like L (grayscale) to RGB
-                 img_to_save = img.convert('RGB')
-            else:
-                 img_to_save = img # Already RGB
+            img_to_save = _flatten_to_rgb(img)
 
             # Save as JPG with specified quality
             img_to_save.save(target_path, format='JPEG', quality=quality, optimize=True)
-            current_app.logger.info(f"Compress: Successfully converted '{source_path.name}' to '{target_path.name}' with quality {quality}.")
+            _logger().info(f"Compress: Successfully converted '{source_path.name}' to '{target_path.name}' with quality {quality}.")
             return target_path, extension_changed
 
     except FileNotFoundError:
-        current_app.logger.warning(f"Compress: File disappeared before processing: {source_path}")
+        _logger().warning(f"Compress: File disappeared before processing: {source_path}")
         return None, False
     except Exception as e:
-        current_app.logger.error(f"Compress: Failed to convert image '{source_path.name}': {e}", exc_info=True)
+        _logger().error(f"Compress: Failed to convert image '{source_path.name}': {e}", exc_info=True)
         # Clean up potentially partially created target file
         if target_path.exists():
             try:
                 target_path.unlink()
             except OSError as unlink_err:
-                 current_app.logger.error(f"Compress: Failed to remove partially created file '{target_path}': {unlink_err}")
+                 _logger().error(f"Compress: Failed to remove partially created file '{target_path}': {unlink_err}")
         return None, False
 
+def compress_image_file(source_path: str, quality: int = 80, max_size: tuple[int, int] = (800, 800)) -> dict:
+    """
+    Process-pool entry point for compress_and_convert_image: takes and returns plain,
+    picklable values and needs no app context.
+
+    Returns:
+        A dict with 'source', 'target' (None on failure), 'extension_changed',
+        'original_size' and 'new_size'.
+    """
+    path = Path(source_path)
+    original_size = path.stat().st_size if path.is_file() else None
+    target_path, extension_changed = compress_and_convert_image(path, quality=quality, max_size=max_size)
+    return {
+        'source': source_path,
+        'target': str(target_path) if target_path else None,
+        'extension_changed': extension_changed,
+        'original_size': original_size,
+        'new_size': target_path.stat().st_size if target_path else None,
+    }
+
+# Output formats for resized variants: Pillow format name and file extension
+VARIANT_FORMATS = {
+    'jpeg': ('JPEG', '.jpg'),
+    'webp': ('WEBP', '.webp'),
+    'png': ('PNG', '.png'),
+}
+
+def render_image_variant(source_path: Path, target_path: Path, width: int | None, image_format: str, quality: int = 80,
+                         max_size: tuple[int, int] | None = None) -> tuple[int, int]:
+    """
+    Writes a resized copy of an image, leaving the original untouched.
+    The image is scaled down to the given width (never up) with its aspect ratio kept.
+
+    Args:
+        source_path: The original image.
+        target_path: Where to write the variant.
+        width: Maximum width in pixels, or None to keep the original size.
+        image_format: A key of VARIANT_FORMATS.
+        quality: Encoder quality for JPEG and WebP (ignored for PNG).
+        max_size: Optional (max_width, max_height) box to fit, applied after width.
+
+    Returns:
+        The (width, height) of the written variant.
+    """
+    pil_format, _ = VARIANT_FORMATS[image_format]
+    with Image.open(source_path) as source_image:
+        _draft_for_size(source_image, max_size or ((width, 1) if width else None))
+        img = _apply_exif_orientation(source_image)
+        if width and img.width > width:
+            height = max(1, round(img.height * width / img.width))
+            img = img.resize((width, height), Image.Resampling.LANCZOS)
+        if max_size and (img.width > max_size[0] or img.height > max_size[1]):
+            img.thumbnail(max_size, Image.Resampling.LANCZOS)
+        if pil_format == 'JPEG':
+            img = _flatten_to_rgb(img)
+            img.save(target_path, format='JPEG', quality=quality, optimize=True, progressive=True)
+        elif pil_format == 'WEBP':
+            if img.mode not in ('RGB', 'RGBA'):
+                img = img.convert('RGBA' if 'transparency' in img.info or img.mode in ('LA', 'PA') else 'RGB')
+            img.save(target_path, format='WEBP', quality=quality, method=4)
+        else:
+            img.save(target_path, format='PNG', optimize=True)
+        return img.size
+
+PLACEHOLDER_SIZE = 16 # Longest side of the inline preview, in pixels
+
+def image_placeholder(image: Image.Image) -> str:
+    """
+    A tiny preview of an opened image as a data: URI of a few hundred bytes, which the client
+    scales up (blurred by the browser) while the real image loads. Must be called before the
+    pixels are loaded, so JPEGs are decoded at 1/8 scale.
+    """
+    _draft_for_size(image, (PLACEHOLDER_SIZE, PLACEHOLDER_SIZE))
+    preview = _flatten_to_rgb(_apply_exif_orientation(image))
+    preview.thumbnail((PLACEHOLDER_SIZE, PLACEHOLDER_SIZE), Image.Resampling.BOX)
+    buffer = io.BytesIO()
+    preview.save(buffer, 'WEBP', quality=40)
+    return 'data:image/webp;base64,' + base64.b64encode(buffer.getvalue()).decode('ascii')
+
+def _is_normalized(source: Path, max_size: tuple[int, int] | None, image_format: str) -> bool:
+    """True when re-encoding would change nothing but quality: right format, size and orientation."""
+    with Image.open(source) as img:
+        if (img.format or '').upper() != VARIANT_FORMATS[image_format][0]:
+            return False
+        if max_size and (img.width > max_size[0] or img.height > max_size[1]):
+            return False
+        return _exif_orientation(img) == 1
+
+def normalize_image_file(source_path: str, target_path: str = None, max_size: tuple[int, int] | None = None,
+                         image_format: str | None = None, quality: int = 82) -> dict:
+    """
+    Upload ingest step (process-pool safe): optionally normalizes an image and describes the result.
+    With image_format set, the image is EXIF-oriented, scaled down to fit max_size and re-encoded
+    (see VARIANT_FORMATS) to target_path, replacing the file atomically; target_path may equal
+    source_path. Files that already match are only moved to target_path, and without
+    image_format the file is only moved and inspected.
+
+    Returns:
+        A dict with 'path', 'width', 'height', 'format', 'byte_size', 'content_hash' (sha256),
+        'original_byte_size' and 'placeholder' (see image_placeholder).
+    """
+    source = Path(source_path)
+    target = Path(target_path) if target_path else source
+    original_byte_size = source.stat().st_size
+
+    # The result is read and described before it is moved onto target_path, so an
+    # unreadable upload never replaces the file that is already there
+    if image_format and not _is_normalized(source, max_size, image_format):
+        temp_path = target.with_name(f'.{target.name}.{uuid.uuid4().hex}.tmp')
+        try:
+            render_image_variant(source, temp_path, None, image_format, quality, max_size=max_size)
+            info = _describe_image_file(temp_path)
+            os.replace(temp_path, target)
+        finally:
+            if temp_path.exists():
+                temp_path.unlink()
+        if source != target:
+            source.unlink()
+    else:
+        info = _describe_image_file(source)
+        if source != target:
+            os.replace(source, target)
+
+    info.update(path=str(target), original_byte_size=original_byte_size)
+    return info
+
+def _describe_image_file(path: Path) -> dict:
+    """Dimensions (as displayed), format, size, sha256 and placeholder of an image file."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as image_file:
+        for block in iter(lambda: image_file.read(1024 * 1024), b''):
+            digest.update(block)
+    with Image.open(path) as img:
+        width, height = img.size
+        if _exif_orientation(img) in (5, 6, 7, 8):
+            width, height = height, width # Displayed sideways
+        detected_format = (img.format or '').lower()
+        placeholder = image_placeholder(img)
+    return {
+        'width': width,
+        'height': height,
+        'format': detected_format,
+        'byte_size': path.stat().st_size,
+        'content_hash': digest.hexdigest(),
+        'placeholder': placeholder,
+    }
+
 def delete_file(file_path: Path) -> bool:
     """Safely deletes a file."""
     if not file_path or not file_path.is_file():
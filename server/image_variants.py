@@ -0,0 +1,170 @@
+import os
+import uuid
+import hashlib
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from flask import current_app
+from image_utils import VARIANT_FORMATS, render_image_variant
+
+# --- Resized Image Variants ---
+# /uploads/<file>?w=320&fmt=webp&q=75 serves a scaled-down, re-encoded copy of an upload.
+# Each variant is rendered once and kept in IMAGE_VARIANT_CACHE_FOLDER; the cache is capped
+# at IMAGE_VARIANT_CACHE_MAX_BYTES and evicts the least recently served variants first.
+# Originals are never modified.
+
+class VariantRequestError(ValueError):
+    """Invalid variant parameters (answered with 400)."""
+
+class _VariantCache:
+    """
+    Byte-budgeted LRU index over the variant cache folder. The order is persisted through
+    file mtimes (touched on every hit), so it survives restarts; the in-memory index is
+    rebuilt from the folder on first use. With several worker processes each keeps its own
+    index, so the budget is enforced approximately: evicting a file another process
+    already removed is simply skipped.
+    """
+
+    def __init__(self, folder: Path, max_bytes: int):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict() # file name -> size, least recently used first
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+        self.render_locks = {}
+        self.folder.mkdir(parents=True, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        files = []
+        for entry in os.scandir(self.folder):
+            if entry.is_file() and not entry.name.endswith('.tmp'):
+                stat = entry.stat()
+                files.append((stat.st_mtime, entry.name, stat.st_size))
+        for _, name, size in sorted(files):
+            self.entries[name] = size
+            self.total_bytes += size
+
+    def lookup(self, name: str) -> Path | None:
+        path = self.folder / name
+        with self.lock:
+            if name not in self.entries:
+                return None
+            if not path.is_file():
+                self.total_bytes -= self.entries.pop(name)
+                return None
+            self.entries.move_to_end(name)
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return path
+
+    def render_lock(self, name: str) -> threading.Lock:
+        """One lock per variant, so concurrent requests for it render it only once."""
+        with self.lock:
+            return self.render_locks.setdefault(name, threading.Lock())
+
+    def add(self, name: str, size: int):
+        with self.lock:
+            self.total_bytes -= self.entries.pop(name, 0)
+            self.entries[name] = size
+            self.total_bytes += size
+            self.render_locks.pop(name, None)
+            while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+                evicted, evicted_size = self.entries.popitem(last=False)
+                self.total_bytes -= evicted_size
+                try:
+                    (self.folder / evicted).unlink()
+                except FileNotFoundError:
+                    pass
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+def _get_cache() -> _VariantCache:
+    folder = Path(current_app.config['IMAGE_VARIANT_CACHE_FOLDER'])
+    with _caches_lock:
+        cache = _caches.get(folder)
+        if cache is None:
+            cache = _caches[folder] = _VariantCache(folder, current_app.config['IMAGE_VARIANT_CACHE_MAX_BYTES'])
+        return cache
+
+def parse_variant_args(args) -> dict | None:
+    """
+    Reads the variant parameters (w, fmt, q) from the query string; fmt defaults to
+    IMAGE_VARIANT_DEFAULT_FORMAT (WebP keeps transparency at a fraction of PNG's size).
+    The width is rounded up to the nearest entry of IMAGE_VARIANT_WIDTHS, so the cache holds
+    a bounded number of variants per image.
+
+    Returns:
+        A dict with 'width', 'format' and 'quality', or None when no variant was requested.
+
+    Raises:
+        VariantRequestError: For unknown formats or invalid numbers.
+    """
+    if not any(key in args for key in ('w', 'fmt', 'q')):
+        return None
+    allowed_widths = sorted(current_app.config['IMAGE_VARIANT_WIDTHS'])
+
+    width = None
+    if args.get('w'):
+        try:
+            requested_width = int(args['w'])
+        except ValueError:
+            raise VariantRequestError("Width 'w' must be a number")
+        if requested_width <= 0:
+            raise VariantRequestError("Width 'w' must be positive")
+        width = next((allowed for allowed in allowed_widths if allowed >= requested_width), allowed_widths[-1])
+
+    image_format = (args.get('fmt') or current_app.config['IMAGE_VARIANT_DEFAULT_FORMAT']).lower()
+    if image_format == 'jpg':
+        image_format = 'jpeg'
+    if image_format not in VARIANT_FORMATS:
+        raise VariantRequestError(f"Format must be one of: {', '.join(VARIANT_FORMATS)}")
+
+    quality = current_app.config['IMAGE_VARIANT_DEFAULT_QUALITY']
+    if args.get('q'):
+        try:
+            quality = int(args['q'])
+        except ValueError:
+            raise VariantRequestError("Quality 'q' must be a number")
+        quality = max(30, min(quality, 95))
+
+    return {'width': width, 'format': image_format, 'quality': quality}
+
+def variant_version(source_path: Path) -> str:
+    """Short token that changes whenever the original is replaced (for the 'v' URL parameter)."""
+    stat = source_path.stat()
+    return f'{stat.st_mtime_ns:x}-{stat.st_size:x}'
+
+def get_image_variant(source_path: Path, relative_path: str, variant: dict) -> Path:
+    """
+    Returns the cached variant of an upload, rendering it on a miss.
+    The cache key covers the file's path, version and the variant parameters, so a
+    replaced original gets fresh variants; stale ones age out of the LRU.
+    """
+    cache = _get_cache()
+    key = '|'.join([relative_path, variant_version(source_path), str(variant['width']),
+                    variant['format'], str(variant['quality'])])
+    name = hashlib.sha256(key.encode('utf-8')).hexdigest() + VARIANT_FORMATS[variant['format']][1]
+
+    cached = cache.lookup(name)
+    if cached:
+        return cached
+    with cache.render_lock(name):
+        cached = cache.lookup(name)
+        if cached:
+            return cached
+        target_path = cache.folder / name
+        temp_path = cache.folder / f'{name}.{uuid.uuid4().hex}.tmp'
+        try:
+            size = render_image_variant(source_path, temp_path, variant['width'], variant['format'], variant['quality'])
+            os.replace(temp_path, target_path)
+        finally:
+            if temp_path.exists():
+                temp_path.unlink()
+        current_app.logger.info(f"Image variant: Rendered '{relative_path}' at {size[0]}x{size[1]} "
+                                f"as {variant['format']} (q{variant['quality']})")
+        cache.add(name, target_path.stat().st_size)
+        return target_path
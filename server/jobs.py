@@ -0,0 +1,140 @@
+import os
+import uuid
+import threading
+import multiprocessing
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from flask import current_app
+
+# --- Background Job Registry (Temporary In-Memory Storage) ---
+# Same process-local model as the play session state: jobs live as long as the
+# worker process does, so clients poll the worker that accepted the job.
+
+# Key: job_id (str), Value: Job
+_jobs = {}
+_jobs_lock = threading.Lock()
+
+# Shared executor for long-running, I/O-bound work (store uploads, etc.)
+_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='bg-job')
+
+# Shared process pool for CPU-bound work (image compression), created on first use.
+# Workers are spawned rather than forked: the web process has threads and DB connections.
+_process_pool = None
+_process_pool_lock = threading.Lock()
+
+# Finished jobs are kept around this long so clients can read the final status
+JOB_RETENTION_SECONDS = 3600
+
+class JobStatus:
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+
+class Job:
+    """A unit of background work with pollable status and progress."""
+
+    def __init__(self, kind: str, owner_id=None):
+        self.id = str(uuid.uuid4())
+        self.kind = kind # e.g. 'store_submission'
+        self.owner_id = str(owner_id) if owner_id else None
+        self.status = JobStatus.QUEUED
+        self.message = 'Queued'
+        self.progress = {} # Free-form counters, e.g. {'attempt': 1, 'bytes_sent': 1024}
+        self.result = None
+        self.error = None
+        self.created_at = datetime.utcnow()
+        self.updated_at = self.created_at
+        self._lock = threading.Lock()
+
+    def update(self, message: str = None, **progress):
+        """Updates the status message and/or progress counters of a running job."""
+        with self._lock:
+            if message is not None:
+                self.message = message
+            self.progress.update(progress)
+            self.updated_at = datetime.utcnow()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (JobStatus.SUCCEEDED, JobStatus.FAILED)
+
+    def to_dict(self):
+        """Serializes the Job for the status endpoints."""
+        with self._lock:
+            return {
+                'id': self.id,
+                'kind': self.kind,
+                'status': self.status,
+                'message': self.message,
+                'progress': dict(self.progress),
+                'result': self.result,
+                'error': self.error,
+                'created_at': self.created_at.isoformat() + 'Z',
+                'updated_at': self.updated_at.isoformat() + 'Z',
+            }
+
+def _prune_finished_jobs():
+    """Drops finished jobs older than JOB_RETENTION_SECONDS. Caller holds _jobs_lock."""
+    now = datetime.utcnow()
+    expired = [job_id for job_id, job in _jobs.items()
+               if job.finished and (now - job.updated_at).total_seconds() > JOB_RETENTION_SECONDS]
+    for job_id in expired:
+        del _jobs[job_id]
+
+def _run_job(app, job: Job, func, args, kwargs):
+    """Executes a job function inside an application context and records the outcome."""
+    with app.app_context():
+        job.status = JobStatus.RUNNING
+        job.update(message='Running')
+        try:
+            job.result = func(job, *args, **kwargs)
+            job.status = JobStatus.SUCCEEDED
+            job.update(message='Finished')
+        except Exception as e:
+            app.logger.error(f"Job {job.id} ({job.kind}) failed: {e}", exc_info=True)
+            job.error = str(e)
+            job.status = JobStatus.FAILED
+            job.update(message='Failed')
+        finally:
+            # Background threads must not leak scoped sessions between jobs
+            from app import db
+            db.session.remove()
+
+def submit_job(kind: str, func, *args, owner_id=None, **kwargs) -> Job:
+    """
+    Registers a new job and schedules it on the shared executor.
+
+    Args:
+        kind: A short identifier for the type of job (used by status endpoints).
+        func: Callable invoked as func(job, *args, **kwargs) inside an app context.
+              Its return value becomes job.result and must be JSON-serializable.
+        owner_id: Optional id of the user who started the job.
+
+    Returns:
+        The newly created Job (status 'queued').
+    """
+    app = current_app._get_current_object()
+    job = Job(kind, owner_id=owner_id)
+    with _jobs_lock:
+        _prune_finished_jobs()
+        _jobs[job.id] = job
+    _executor.submit(_run_job, app, job, func, args, kwargs)
+    return job
+
+def get_job(job_id: str, kind: str = None) -> Job | None:
+    """Returns the job with the given id (optionally restricted to a kind), or None."""
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+    if job is None or (kind and job.kind != kind):
+        return None
+    return job
+
+def get_process_pool() -> ProcessPoolExecutor:
+    """Returns the shared process pool (PROCESS_POOL_WORKERS processes, default one per core)."""
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is None or _process_pool._broken: # A crashed worker breaks the whole pool
+            workers = current_app.config.get('PROCESS_POOL_WORKERS') or os.cpu_count() or 1
+            _process_pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+        return _process_pool
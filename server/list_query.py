@@ -0,0 +1,128 @@
+import json
+import uuid
+import base64
+from datetime import datetime
+from enum import Enum
+from flask import request, jsonify
+from sqlalchemy import select, func, tuple_, and_, or_
+from app import db
+
+# --- Editor List Queries ---
+# Shared paging for the editor and admin list endpoints. Without 'limit' or 'cursor' an
+# endpoint returns its full (filtered) list as a JSON array, as before. With them it returns
+# one page in keyset order: {items, next_cursor, total}. The cursor holds the sort key of the
+# last row, so every page is one index range scan however far into the list it is; the total
+# is counted on the first page only and carried along in the cursor (count=false skips it).
+# 'fields=id,title' returns only those fields, selected as plain columns.
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 500
+
+class ListQueryError(ValueError):
+    """Raised for invalid paging or projection parameters."""
+
+def request_flag(name: str) -> bool | None:
+    """A true/false query parameter; None when absent."""
+    value = request.args.get(name)
+    if value is None or value == '':
+        return None
+    return value.lower() in ('1', 'true', 'yes')
+
+def search_filter(column, text: str):
+    """Case-insensitive substring match."""
+    return func.lower(column).contains(text.lower(), autoescape=True)
+
+def prefix_filter(column, text: str):
+    """Case-insensitive prefix match."""
+    return func.lower(column).startswith(text.lower(), autoescape=True)
+
+def presence_filter(column, present: bool):
+    """Column set (not null or empty) or, with present=False, unset."""
+    return and_(column.isnot(None), column != '') if present else or_(column.is_(None), column == '')
+
+def _json_value(value):
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, datetime):
+        return value.isoformat() + 'Z'
+    return value
+
+def _encode_cursor(key: list, total: int | None) -> str:
+    payload = json.dumps({'k': key, 't': total}, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip('=')
+
+def _decode_cursor(cursor: str) -> tuple[list, int | None]:
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        key, total = payload['k'], payload.get('t')
+        if not isinstance(key, list) or len(key) != 2:
+            raise ValueError(key)
+        return [key[0], uuid.UUID(key[1])], total
+    except (ValueError, TypeError, KeyError):
+        raise ListQueryError("Invalid 'cursor'")
+
+def _requested_fields(fields: tuple[str, ...]) -> list[str] | None:
+    requested = request.args.get('fields')
+    if not requested:
+        return None
+    names = [name.strip() for name in requested.split(',') if name.strip()]
+    unknown = [name for name in names if name not in fields]
+    if unknown or not names:
+        raise ListQueryError(f"Unknown field(s): {', '.join(unknown) or requested}. Available: {', '.join(fields)}")
+    return list(dict.fromkeys(names))
+
+def list_response(query, model, sort_column, serialize, fields: tuple[str, ...]):
+    """
+    Runs a filtered list query with the paging and projection parameters of the request.
+
+    Args:
+        query: select(model) with the endpoint's filters applied.
+        sort_column: Non-null column the list is ordered by; the primary key breaks ties.
+        serialize: Full serializer for a model instance (used without 'fields').
+        fields: Field names a client may project; each must be a column of the model.
+
+    Returns:
+        A Flask (response, status) tuple.
+    """
+    try:
+        names = _requested_fields(fields)
+        paginated = 'limit' in request.args or 'cursor' in request.args
+        limit = min(max(int(request.args.get('limit', DEFAULT_LIMIT)), 1), MAX_LIMIT)
+        cursor = request.args.get('cursor')
+        after, total = _decode_cursor(cursor) if cursor else (None, None)
+    except ValueError as e:
+        message = str(e) if isinstance(e, ListQueryError) else "'limit' must be a number"
+        return jsonify({"error": message}), 400
+
+    if paginated and not cursor and request_flag('count') is not False:
+        total = db.session.scalar(select(func.count()).select_from(query.order_by(None).subquery()))
+
+    id_column = model.__table__.c.id
+    query = query.order_by(sort_column, id_column)
+    if after is not None:
+        query = query.where(tuple_(sort_column, id_column) > tuple_(*after))
+    if paginated:
+        query = query.limit(limit + 1) # One extra row tells whether there is a next page
+
+    if names:
+        # Only the requested columns, plus the sort key for the cursor
+        columns = [model.__table__.c[name] for name in names]
+        rows = db.session.execute(query.with_only_columns(
+            *columns, sort_column.label('_sort_key'), id_column.label('_row_id'))).all()
+        items = [{name: _json_value(value) for name, value in zip(names, row)} for row in rows]
+        keys = [(row[-2], row[-1]) for row in rows]
+    else:
+        objects = db.session.scalars(query).all()
+        items = [serialize(obj) for obj in objects]
+        keys = [(getattr(obj, sort_column.key), obj.id) for obj in objects]
+
+    if not paginated:
+        return jsonify(items), 200
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        sort_value, last_id = keys[limit - 1]
+        next_cursor = _encode_cursor([sort_value, str(last_id)], total)
+    return jsonify({"items": items, "next_cursor": next_cursor, "total": total}), 200
@@ -0,0 +1,46 @@
+# /server/migrate_upload_layout.py
+"""
+Moves the room and entity images into (or out of) the sharded upload layout and rewrites
+the database references in bulk.
+
+Usage (from the server directory):
+    python migrate_upload_layout.py --dry-run   # report what would move
+    python migrate_upload_layout.py             # images/kamers/hal.jpg -> images/kamers/6c/0f/hal.jpg
+    python migrate_upload_layout.py --flatten   # back to the flat layout
+
+Set UPLOAD_SHARDED_LAYOUT to match so new uploads use the same layout. An interrupted run
+can be started again.
+"""
+import os
+import sys
+import argparse
+from app import create_app
+from upload_layout import migrate_upload_layout
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Move uploaded room and entity images between the flat and sharded layouts.")
+    parser.add_argument('--flatten', action='store_true', help="Move images back to the flat layout")
+    parser.add_argument('--dry-run', action='store_true', help="Only report what would change")
+    args = parser.parse_args(argv)
+
+    app = create_app(os.getenv('FLASK_CONFIG') or 'development')
+    with app.app_context():
+        if not args.flatten and not app.config['UPLOAD_SHARDED_LAYOUT']:
+            print("INFO: UPLOAD_SHARDED_LAYOUT is off; new uploads will stay flat until it is enabled")
+        try:
+            summary = migrate_upload_layout(sharded=not args.flatten, dry_run=args.dry_run)
+        except Exception as e:
+            print(f"ERROR: Migration failed: {e}")
+            return 1
+
+    for folder, counts in summary.items():
+        for name in counts['conflicts']:
+            print(f"INFO: Skipped '{folder}/{name}': a file with that name exists in both layouts")
+        print(f"{'INFO' if args.dry_run else 'SUCCESS'}: {folder}: {counts['moved']} files moved, "
+              f"{counts['references']} references and {counts['metadata']} metadata rows rewritten")
+    if args.dry_run:
+        print("INFO: Dry run, nothing changed")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
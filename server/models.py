@@ -2,7 +2,7 @@ import uuid
 from datetime import datetime
 from enum import Enum as PyEnum # Import Python's standard Enum
 from sqlalchemy.dialects.postgresql import UUID as PG_UUID # Keep for potential future PG use, renamed to avoid clash
-from sqlalchemy import MetaData, Enum as SQLEnum, Text, TIMESTAMP, Integer, ForeignKey, UniqueConstraint, Boolean, JSON, String
+from sqlalchemy import MetaData, Enum as SQLEnum, Text, TIMESTAMP, Integer, BigInteger, Float, ForeignKey, UniqueConstraint, Boolean, JSON, String
 from app import db # Import db instance from app
 from flask_login import UserMixin, AnonymousUserMixin # Import UserMixin and AnonymousUserMixin for Flask-Login
 from argon2 import PasswordHasher
@@ -82,6 +82,8 @@ class Game(db.Model):
     # NEW: Versioning
     version = db.Column(String(20), nullable=False, default='1.0.0') # Adventure version
     builder_version = db.Column(String(20), nullable=True) # Version of the builder used
+    # Bumped on every change to the game or its rows (see storage_stats.py); not exported
+    content_revision = db.Column(BigInteger, nullable=False, default=0, server_default='0')
 
     # Relationships
     rooms = db.relationship('Room', back_populates='game', lazy=True, cascade='all, delete-orphan')
@@ -90,6 +92,7 @@ class Game(db.Model):
     high_scores = db.relationship('HighScore', back_populates='game', lazy='dynamic', cascade='all, delete-orphan') # One-to-many (one per user)
     scripts = db.relationship('Script', back_populates='game', lazy=True, cascade='all, delete-orphan')
     conversations = db.relationship('Conversation', back_populates='game', lazy=True, cascade='all, delete-orphan') # NEW: Relationship to conversations
+    storage_stats = db.relationship('GameStorageStats', back_populates='game', uselist=False, cascade='all, delete-orphan')
 
     def __repr__(self):
         return f'<Game {self.name}>'
@@ -123,6 +126,9 @@ class Room(db.Model):
     # NEW: Path to the associated image file (relative to uploads/images/kamers/)
     image_path = db.Column(Text, nullable=True)
 
+    # Keyset order of the room list (see list_query.py)
+    __table_args__ = (db.Index('ix_rooms_game_sort', 'game_id', 'sort_index', 'id'),)
+
     # Relationships
     game = db.relationship('Game', back_populates='rooms')
     # Connections originating from this room
@@ -231,6 +237,7 @@ class Entity(db.Model):
     # NEW: Check constraint to ensure an entity is either in a room OR in a container, not both (or neither, like inventory)
     __table_args__ = (
         db.CheckConstraint('NOT(room_id IS NOT NULL AND container_id IS NOT NULL)', name='ck_entity_location'),
+        db.Index('ix_entities_game_name', 'game_id', 'name', 'id'), # Keyset order of the entity list
     )
 
     def __repr__(self):
@@ -271,6 +278,9 @@ class Script(db.Model):
     action = db.Column(Text, nullable=False) # e.g., 'SHOW_MESSAGE("Door unlocked!")', 'MOVE_NPC(guard, room_id)', 'SET_STATE(door, "open")'
     # execution_order = db.Column(Integer, default=0) # If multiple scripts match trigger
 
+    # Keyset order of the script list (see list_query.py)
+    __table_args__ = (db.Index('ix_scripts_game_trigger', 'game_id', 'trigger', 'id'),)
+
     # Relationships
     game = db.relationship('Game', back_populates='scripts')
 
@@ -304,6 +314,9 @@ class Conversation(db.Model):
     # }
     structure = db.Column(JSON, nullable=False, default=dict)
 
+    # Keyset order of the conversation list (see list_query.py)
+    __table_args__ = (db.Index('ix_conversations_game_name', 'game_id', 'name', 'id'),)
+
     game = db.relationship('Game', back_populates='conversations')
 
     def to_dict(self):
@@ -354,6 +367,97 @@ class HighScore(db.Model):
     user = db.relationship('User', back_populates='high_scores')
     game = db.relationship('Game', back_populates='high_scores')
 
+class GameStorageStats(db.Model):
+    """
+    Cached storage footprint of a game, kept up to date incrementally (see storage_stats.py).
+    JSON sizes are the compact JSON-lines payload of each table; image bytes count each
+    distinct referenced image file once.
+    """
+    __tablename__ = 'game_storage_stats'
+    game_id = db.Column(PG_UUID(as_uuid=True), ForeignKey('games.id'), primary_key=True)
+    game_bytes = db.Column(BigInteger, nullable=False, default=0)
+    rooms_bytes = db.Column(BigInteger, nullable=False, default=0)
+    entities_bytes = db.Column(BigInteger, nullable=False, default=0)
+    connections_bytes = db.Column(BigInteger, nullable=False, default=0)
+    scripts_bytes = db.Column(BigInteger, nullable=False, default=0)
+    conversations_bytes = db.Column(BigInteger, nullable=False, default=0)
+    image_bytes = db.Column(BigInteger, nullable=False, default=0)
+    image_count = db.Column(Integer, nullable=False, default=0)
+    # Deflated/raw ratio of the JSON payload, sampled on the last full recompute
+    json_compression_ratio = db.Column(Float, nullable=False, default=1.0)
+    recomputed_at = db.Column(TIMESTAMP, default=datetime.utcnow, nullable=False)
+    updated_at = db.Column(TIMESTAMP, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+    game = db.relationship('Game', back_populates='storage_stats')
+
+    @property
+    def json_bytes(self):
+        return (self.game_bytes + self.rooms_bytes + self.entities_bytes + self.connections_bytes
+                + self.scripts_bytes + self.conversations_bytes)
+
+    @property
+    def total_bytes(self):
+        return self.json_bytes + self.image_bytes
+
+class ImageMetadata(db.Model):
+    """Facts about an uploaded image, recorded when it is ingested (see image_ingest.py)."""
+    __tablename__ = 'image_metadata'
+    path = db.Column(String(512), primary_key=True) # Relative to the uploads folder, e.g. 'images/kamers/hal.jpg'
+    width = db.Column(Integer, nullable=False)
+    height = db.Column(Integer, nullable=False)
+    format = db.Column(String(16), nullable=False) # As detected by Pillow, e.g. 'jpeg'
+    byte_size = db.Column(BigInteger, nullable=False)
+    content_hash = db.Column(String(64), nullable=False, index=True) # sha256 of the stored file
+    original_byte_size = db.Column(BigInteger, nullable=True) # Size as uploaded, before normalization
+    placeholder = db.Column(Text, nullable=True) # Tiny data: URI preview shown while the image loads
+    processed_at = db.Column(TIMESTAMP, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+    def to_dict(self):
+        return {
+            'path': self.path,
+            'width': self.width,
+            'height': self.height,
+            'format': self.format,
+            'byte_size': self.byte_size,
+            'content_hash': self.content_hash,
+            'original_byte_size': self.original_byte_size,
+            'placeholder': self.placeholder,
+            'processed_at': self.processed_at.isoformat() + 'Z' if self.processed_at else None,
+        }
+
+class UploadIndexEntry(db.Model):
+    """
+    One file or directory of the uploads tree, so listings are served from the database
+    instead of walking the filesystem (see upload_index.py). The root directory is path ''.
+    """
+    __tablename__ = 'upload_index'
+    __table_args__ = (
+        db.Index('ix_upload_index_parent_name', 'parent', 'name'),
+    )
+    path = db.Column(String(512), primary_key=True) # Relative to the uploads folder, '/'-separated
+    parent = db.Column(String(512), nullable=True) # Path of the containing directory (None for the root)
+    name = db.Column(String(255), nullable=False)
+    is_dir = db.Column(Boolean, nullable=False, default=False)
+    size = db.Column(BigInteger, nullable=False, default=0)
+    mtime_ns = db.Column(BigInteger, nullable=False, default=0) # For directories: mtime when last reconciled
+    width = db.Column(Integer, nullable=True) # Images only
+    height = db.Column(Integer, nullable=True)
+    indexed_at = db.Column(TIMESTAMP, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+    def to_dict(self):
+        if self.is_dir:
+            return {'name': self.name, 'type': 'directory', 'path': self.path}
+        return {
+            'name': self.name,
+            'type': 'file',
+            'url': f'/uploads/{self.path}',
+            'path': self.path,
+            'size': self.size,
+            'mtime': self.mtime_ns / 1e9,
+            'width': self.width,
+            'height': self.height,
+        }
+
 # --- NEW: System Settings Model ---
 class SystemSetting(db.Model):
     """Stores global system settings as key-value pairs."""
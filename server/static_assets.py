@@ -0,0 +1,191 @@
+import os
+import re
+import gzip
+import json
+import hashlib
+import mimetypes
+import threading
+from pathlib import Path
+from markupsafe import Markup
+from flask import url_for, request, send_file
+
+try:
+    import brotli # Optional: without it only gzip sidecars are written
+except ImportError:
+    brotli = None
+
+# --- Fingerprinted Static Assets ---
+# At startup every file in client/js and client/css gets a content-hashed name
+# (js/main.js -> js/main.3f2a9c1b0d4e.js) plus gzip/brotli sidecars in the instance folder.
+# Templates link assets through asset_url() and the JS modules import each other through
+# the import map from asset_import_map(), so a new deploy changes the URLs and everything
+# else can be cached by browsers forever.
+
+ASSET_DIRS = ('js', 'css')
+COMPRESSIBLE_SUFFIXES = {'.js', '.css', '.map', '.json', '.svg'}
+HASH_LENGTH = 12
+FINGERPRINT_PATTERN = re.compile(r'^(?P<stem>.+)\.(?P<hash>[0-9a-f]{%d})(?P<suffix>\.[A-Za-z0-9]+)$' % HASH_LENGTH)
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+class AssetManifest:
+    """Logical asset path -> fingerprinted file, kept in sync with the client folder."""
+
+    def __init__(self, client_folder: str, cache_folder: str, watch: bool = False):
+        self.client_folder = Path(client_folder)
+        self.cache_folder = Path(cache_folder)
+        self.watch = watch # Re-check source mtimes on every render (development)
+        self.assets = {} # 'js/main.js' -> {'hash', 'url_path', 'mtime_ns', 'gzip', 'br'}
+        self.lock = threading.Lock()
+
+    def build(self):
+        """Fingerprints and precompresses every asset (files that did not change are reused)."""
+        for asset_dir in ASSET_DIRS:
+            for source_path in sorted((self.client_folder / asset_dir).rglob('*')):
+                if source_path.is_file():
+                    self._refresh(source_path.relative_to(self.client_folder).as_posix())
+        self._prune_sidecars()
+
+    def _prune_sidecars(self):
+        """Removes sidecars of asset versions that no longer exist (left behind by earlier deploys)."""
+        current = {sidecar for asset in self.assets.values() for sidecar in (asset['gzip'], asset['br']) if sidecar}
+        for sidecar_path in self.cache_folder.rglob('*'):
+            if sidecar_path.is_file() and sidecar_path not in current and sidecar_path.suffix != '.tmp':
+                sidecar_path.unlink(missing_ok=True)
+
+    def _refresh(self, logical_path: str) -> dict | None:
+        source_path = self.client_folder / logical_path
+        try:
+            mtime_ns = source_path.stat().st_mtime_ns
+        except FileNotFoundError:
+            with self.lock:
+                self.assets.pop(logical_path, None)
+            return None
+        current = self.assets.get(logical_path)
+        if current and current['mtime_ns'] == mtime_ns:
+            return current
+
+        data = source_path.read_bytes()
+        digest = hashlib.sha256(data).hexdigest()[:HASH_LENGTH]
+        stem, dot, suffix = logical_path.rpartition('.')
+        asset = {
+            'hash': digest,
+            'url_path': f'{stem}.{digest}.{suffix}' if dot else f'{logical_path}.{digest}',
+            'mtime_ns': mtime_ns,
+            'gzip': None,
+            'br': None,
+        }
+        if source_path.suffix.lower() in COMPRESSIBLE_SUFFIXES:
+            asset['gzip'] = self._write_sidecar(asset['url_path'] + '.gz', data,
+                                                lambda raw: gzip.compress(raw, compresslevel=9, mtime=0))
+            if brotli is not None:
+                asset['br'] = self._write_sidecar(asset['url_path'] + '.br', data,
+                                                  lambda raw: brotli.compress(raw, quality=11))
+        with self.lock:
+            self.assets[logical_path] = asset
+        return asset
+
+    def _write_sidecar(self, name: str, data: bytes, compress) -> Path | None:
+        """Writes a precompressed copy once (names are content-addressed); skipped if it does not help."""
+        sidecar_path = self.cache_folder / name
+        if not sidecar_path.is_file():
+            compressed = compress(data)
+            if len(compressed) >= len(data):
+                return None
+            sidecar_path.parent.mkdir(parents=True, exist_ok=True)
+            temp_path = sidecar_path.with_name(sidecar_path.name + f'.{os.getpid()}.tmp')
+            temp_path.write_bytes(compressed)
+            os.replace(temp_path, sidecar_path)
+        return sidecar_path
+
+    def get(self, logical_path: str) -> dict | None:
+        if self.watch:
+            return self._refresh(logical_path)
+        return self.assets.get(logical_path)
+
+    def resolve(self, url_path: str) -> tuple[str, dict | None, bool]:
+        """
+        Maps a requested path to its logical asset.
+
+        Returns:
+            (logical_path, asset, current) - current is False for a stale or unknown hash.
+        """
+        match = FINGERPRINT_PATTERN.match(url_path)
+        if not match:
+            return url_path, None, False
+        logical_path = match['stem'] + match['suffix']
+        asset = self.get(logical_path)
+        return logical_path, asset, bool(asset and asset['hash'] == match['hash'])
+
+    def import_map(self) -> dict:
+        if self.watch:
+            for logical_path in list(self.assets):
+                self._refresh(logical_path)
+        with self.lock:
+            imports = {url_for('serve_static', filename=logical_path): url_for('serve_static', filename=asset['url_path'])
+                       for logical_path, asset in self.assets.items() if logical_path.endswith('.js')}
+        return {'imports': imports}
+
+def init_static_assets(app, client_folder: str):
+    """Builds the asset manifest at startup and exposes asset_url()/asset_import_map() to templates."""
+    if not app.config.get('STATIC_ASSET_FINGERPRINTING', True):
+        app.jinja_env.globals['asset_url'] = lambda filename: url_for('serve_static', filename=filename)
+        app.jinja_env.globals['asset_import_map'] = lambda: ''
+        return
+    manifest = AssetManifest(client_folder, app.config['STATIC_ASSET_CACHE_FOLDER'],
+                             watch=app.config.get('STATIC_ASSET_WATCH', False))
+    manifest.build()
+    app.extensions['static_assets'] = manifest
+    app.logger.info(f"Static assets: Fingerprinted {len(manifest.assets)} files"
+                    f"{'' if brotli else ' (brotli not installed, gzip only)'}")
+
+    def asset_url(filename: str) -> str:
+        asset = manifest.get(filename)
+        return url_for('serve_static', filename=asset['url_path'] if asset else filename)
+
+    def asset_import_map() -> Markup:
+        # Escapes '<' so the JSON cannot close the script element
+        payload = json.dumps(manifest.import_map(), separators=(',', ':')).replace('<', '\\u003c')
+        return Markup(f'<script type="importmap">{payload}</script>')
+
+    app.jinja_env.globals['asset_url'] = asset_url
+    app.jinja_env.globals['asset_import_map'] = asset_import_map
+
+def send_static_asset(app, filename: str):
+    """
+    Serves a fingerprinted asset: the best precompressed sidecar the client accepts, with an
+    immutable Cache-Control. Returns None for paths that are not fingerprinted assets.
+    A stale hash (an old page after a deploy) gets the current file without long-term caching.
+    """
+    manifest = app.extensions.get('static_assets')
+    if manifest is None:
+        return None
+    logical_path, asset, current = manifest.resolve(filename)
+    if asset is None:
+        return None
+
+    source_path = manifest.client_folder / logical_path
+    path, encoding = source_path, None
+    accepted = request.accept_encodings
+    if asset['br'] and accepted['br']:
+        path, encoding = asset['br'], 'br'
+    elif asset['gzip'] and accepted['gzip']:
+        path, encoding = asset['gzip'], 'gzip'
+
+    response = send_file(path, mimetype=None if encoding is None else _mimetype_for(logical_path),
+                         download_name=Path(logical_path).name, etag=f"{asset['hash']}-{encoding or 'identity'}",
+                         max_age=IMMUTABLE_MAX_AGE if current else 0, conditional=True)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    response.cache_control.public = True
+    if current:
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.no_cache = True
+    return response
+
+def _mimetype_for(logical_path: str) -> str:
+    mimetype, _ = mimetypes.guess_type(logical_path)
+    if mimetype and (mimetype.startswith('text/') or mimetype in ('application/javascript', 'text/javascript')):
+        return f'{mimetype}; charset=utf-8'
+    return mimetype or 'application/octet-stream'
@@ -0,0 +1,383 @@
+import json
+import uuid
+import zlib
+from collections import defaultdict
+from datetime import datetime
+from enum import Enum as PyEnum
+from flask import current_app
+from sqlalchemy import event, select, update, case, func, inspect as sa_inspect
+from app import db
+from models import Game, Room, Entity, Connection, Script, Conversation, GameStorageStats
+from image_utils import get_absolute_image_path, split_image_path
+from upload_storage import get_upload_storage
+
+# --- Game Storage Accounting ---
+# Keeps GameStorageStats up to date from ORM flushes (editor writes) and explicit
+# file-change notifications (uploads, compression), so size lookups never rescan a game.
+# The same hooks bump Game.content_revision whenever a game's rows change, which the
+# editor bundle uses as its ETag.
+
+# Separators used for one row per line in the JSON-lines payload; sizes are measured the same way
+JSONL_SEPARATORS = (',', ':')
+
+# Model -> GameStorageStats column holding the JSON bytes of that table
+TABLE_SIZE_COLUMNS = {
+    Game: 'game_bytes',
+    Room: 'rooms_bytes',
+    Entity: 'entities_bytes',
+    Connection: 'connections_bytes',
+    Script: 'scripts_bytes',
+    Conversation: 'conversations_bytes',
+}
+
+# Model -> [(attribute, uploads subdirectory)] for columns that reference image files
+IMAGE_ATTRIBUTES = {
+    Game: [('start_image_path', 'avonturen'), ('win_image_path', 'avonturen'), ('loss_image_path', 'avonturen')],
+    Room: [('image_path', 'images/kamers')],
+    Entity: [('image_path', 'images/entiteiten')],
+}
+
+# Uploads subdirectory -> image type understood by get_absolute_image_path
+SUBDIR_IMAGE_TYPES = {
+    'avonturen': 'game_start',
+    'images/kamers': 'room',
+    'images/entiteiten': 'entity',
+}
+
+# Rough per-entry ZIP overhead (local header + central directory record + data descriptor)
+ZIP_ENTRY_OVERHEAD_BYTES = 130
+ZIP_END_RECORD_BYTES = 22
+
+def serialize_row_line(row: dict) -> str:
+    """Serializes one row as a JSON-lines record (compact JSON plus newline)."""
+    return json.dumps(row, separators=JSONL_SEPARATORS) + '\n'
+
+def serialized_row_size(row: dict) -> int:
+    """Returns the size in bytes of a row's JSON-lines record."""
+    return len(serialize_row_line(row).encode('utf-8'))
+
+def game_table_query(model, game_id):
+    """Returns a query selecting all rows of a model that belong to a game."""
+    if model is Game:
+        return Game.query.filter(Game.id == game_id)
+    if model is Connection:
+        # Connections have no game_id; they belong to the game of their origin room
+        return db.session.query(Connection)\
+            .join(Room, Connection.from_room_id == Room.id)\
+            .filter(Room.game_id == game_id)
+    return model.query.filter(model.game_id == game_id)
+
+def game_image_files(game_id) -> set[tuple[str, str]]:
+    """Returns the distinct (uploads subdirectory, filename) pairs a game references."""
+    image_files = set()
+    for model, attributes in IMAGE_ATTRIBUTES.items():
+        for attr, subdir in attributes:
+            column = getattr(model, attr)
+            owner = model.id if model is Game else model.game_id
+            # Plain column selects: no ORM objects needed
+            for (filename,) in db.session.execute(select(column).where(owner == game_id, column.isnot(None)).distinct()):
+                image_files.add((subdir, filename))
+    return image_files
+
+def _file_size(subdir: str, filename: str) -> int | None:
+    """Returns the size of an uploaded image, or None if it does not exist."""
+    if get_upload_storage().remote:
+        return get_upload_storage().size(f'{subdir}/{filename}') # Asks the bucket without downloading
+    path = get_absolute_image_path(filename, SUBDIR_IMAGE_TYPES[subdir])
+    try:
+        return path.stat().st_size if path and path.is_file() else None
+    except OSError:
+        return None
+
+def _json_value(value):
+    """Converts a raw column value the way the models' to_dict() methods do."""
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if isinstance(value, PyEnum):
+        return value.value
+    if isinstance(value, datetime):
+        return value.isoformat() + 'Z'
+    return value
+
+def _previous_value(obj, key):
+    """Returns the value an attribute had before the pending changes."""
+    history = sa_inspect(obj).attrs[key].history
+    if history.deleted:
+        return history.deleted[0]
+    return getattr(obj, key)
+
+def _previous_row(obj) -> dict:
+    """Reconstructs obj.to_dict() as it was before the pending changes."""
+    row = obj.to_dict()
+    state = sa_inspect(obj)
+    for attr in state.mapper.column_attrs:
+        if attr.key in row:
+            history = state.attrs[attr.key].history
+            if history.deleted:
+                row[attr.key] = _json_value(history.deleted[0])
+    return row
+
+def _tracked_model(obj):
+    for model in TABLE_SIZE_COLUMNS:
+        if isinstance(obj, model):
+            return model
+    return None
+
+def _game_id_of(session, obj):
+    if isinstance(obj, Game):
+        return obj.id
+    if isinstance(obj, Connection):
+        room = session.get(Room, obj.from_room_id) if obj.from_room_id else None
+        return room.game_id if room else None
+    return obj.game_id
+
+def _pending(session):
+    """Per-session accumulators for changes not yet written to GameStorageStats."""
+    if 'storage_deltas' not in session.info:
+        # game_id -> {column: byte delta}
+        session.info['storage_deltas'] = defaultdict(lambda: defaultdict(int))
+        # (game_id, subdir, filename) -> net change in the number of references
+        session.info['storage_image_refs'] = defaultdict(int)
+        session.info['storage_deleted_games'] = set()
+        # Games whose rows changed, for the content revision
+        session.info['storage_touched_games'] = set()
+    return session.info['storage_deltas'], session.info['storage_image_refs'], session.info['storage_deleted_games']
+
+def _before_flush(session, flush_context, instances):
+    """Accounts for deleted rows while their game ids are still resolvable."""
+    deltas, image_refs, deleted_games = _pending(session)
+    deleted_games.update(obj.id for obj in session.deleted if isinstance(obj, Game))
+
+    for obj in session.deleted:
+        model = _tracked_model(obj)
+        if model is None:
+            continue
+        game_id = _game_id_of(session, obj)
+        if game_id is None or game_id in deleted_games:
+            continue # The whole game (and its stats row) is going away
+        session.info['storage_touched_games'].add(game_id)
+        deltas[game_id][TABLE_SIZE_COLUMNS[model]] -= serialized_row_size(_previous_row(obj))
+        for attr, subdir in IMAGE_ATTRIBUTES.get(model, []):
+            old_path = _previous_value(obj, attr)
+            if old_path:
+                image_refs[(game_id, subdir, old_path)] -= 1
+
+def _count_image_references(connection, game_id, subdir, filename) -> int:
+    """Counts how many image columns of a game reference a file (after the flush)."""
+    if subdir == 'avonturen':
+        refs = sum(case((column == filename, 1), else_=0) for column in
+                   (Game.start_image_path, Game.win_image_path, Game.loss_image_path))
+        return connection.execute(select(refs).where(Game.id == game_id)).scalar() or 0
+    model = Room if subdir == 'images/kamers' else Entity
+    return connection.execute(
+        select(func.count()).select_from(model).where(model.game_id == game_id, model.image_path == filename)
+    ).scalar() or 0
+
+def _apply_deltas(connection, deltas):
+    """Adds accumulated deltas to the stats rows (rows that do not exist yet are computed lazily)."""
+    table = GameStorageStats.__table__
+    for game_id, columns in deltas.items():
+        values = {name: table.c[name] + delta for name, delta in columns.items() if delta}
+        if values:
+            values['updated_at'] = datetime.utcnow()
+            connection.execute(update(table).where(table.c.game_id == game_id).values(values))
+
+def _bump_content_revisions(connection, game_ids):
+    """Marks the content of games as changed (a new editor bundle ETag)."""
+    if game_ids:
+        table = Game.__table__
+        connection.execute(update(table).where(table.c.id.in_(list(game_ids))).values(
+            content_revision=table.c.content_revision + 1,
+            updated_at=table.c.updated_at)) # Not an edit of the game row itself
+
+def _after_flush(session, flush_context):
+    """
+    Accounts for inserted rows (ids are assigned now) and updated rows, including foreign
+    keys the unit of work nulled out during the flush, then settles image references.
+    Attribute history still holds the pre-flush values at this point.
+    """
+    deltas, image_refs, deleted_games = _pending(session)
+    touched_games = session.info['storage_touched_games']
+
+    for obj in session.dirty:
+        model = _tracked_model(obj)
+        if model is None or not session.is_modified(obj, include_collections=False):
+            continue
+        game_id = _game_id_of(session, obj)
+        if game_id is None:
+            continue
+        touched_games.add(game_id)
+        delta = serialized_row_size(obj.to_dict()) - serialized_row_size(_previous_row(obj))
+        deltas[game_id][TABLE_SIZE_COLUMNS[model]] += delta
+        for attr, subdir in IMAGE_ATTRIBUTES.get(model, []):
+            old_path, new_path = _previous_value(obj, attr), getattr(obj, attr)
+            if old_path != new_path:
+                if old_path:
+                    image_refs[(game_id, subdir, old_path)] -= 1
+                if new_path:
+                    image_refs[(game_id, subdir, new_path)] += 1
+
+    for obj in session.new:
+        model = _tracked_model(obj)
+        if model is None:
+            continue
+        game_id = _game_id_of(session, obj)
+        if game_id is None:
+            continue
+        touched_games.add(game_id)
+        deltas[game_id][TABLE_SIZE_COLUMNS[model]] += serialized_row_size(obj.to_dict())
+        for attr, subdir in IMAGE_ATTRIBUTES.get(model, []):
+            new_path = getattr(obj, attr)
+            if new_path:
+                image_refs[(game_id, subdir, new_path)] += 1
+
+    connection = session.connection()
+    for (game_id, subdir, filename), net_change in image_refs.items():
+        if not net_change or game_id in deleted_games:
+            continue
+        refs_after = _count_image_references(connection, game_id, subdir, filename)
+        refs_before = refs_after - net_change
+        if (refs_before > 0) == (refs_after > 0):
+            continue # File was and still is (or was not and still is not) part of the game
+        size = _file_size(subdir, filename)
+        if size is None:
+            continue # Missing files do not count towards the footprint
+        sign = 1 if refs_after > 0 else -1
+        deltas[game_id]['image_bytes'] += sign * size
+        deltas[game_id]['image_count'] += sign
+
+    _apply_deltas(connection, deltas)
+    _bump_content_revisions(connection, touched_games - deleted_games)
+    _after_rollback(session)
+
+def _after_rollback(session):
+    session.info.pop('storage_deltas', None)
+    session.info.pop('storage_image_refs', None)
+    session.info.pop('storage_deleted_games', None)
+    session.info.pop('storage_touched_games', None)
+
+def register_storage_listeners():
+    """Hooks the accounting into the app's scoped session (idempotent)."""
+    if not event.contains(db.session, 'before_flush', _before_flush):
+        event.listen(db.session, 'before_flush', _before_flush)
+        event.listen(db.session, 'after_flush', _after_flush)
+        event.listen(db.session, 'after_soft_rollback', lambda session, previous_transaction: _after_rollback(session))
+
+def adjust_for_file_change(relative_path: str, old_size: int | None, new_size: int | None, commit: bool = True):
+    """
+    Updates the stats of every game referencing an uploaded file whose contents changed
+    (upload overwrite, in-place compression, deletion or rename).
+
+    Args:
+        relative_path: Path relative to the uploads folder (e.g. 'images/kamers/hal.jpg' or,
+                       sharded, 'images/kamers/6c/0f/hal.jpg').
+        old_size: Size before the change, or None if the file did not exist.
+        new_size: Size after the change, or None if the file no longer exists.
+        commit: Commit right away; pass False to make the update part of the caller's transaction.
+    """
+    subdir, filename = split_image_path(relative_path.replace('\\', '/'))
+    if subdir not in SUBDIR_IMAGE_TYPES or old_size == new_size:
+        return
+
+    if subdir == 'avonturen':
+        game_ids = select(Game.id).where(
+            (Game.start_image_path == filename) | (Game.win_image_path == filename) | (Game.loss_image_path == filename))
+    else:
+        model = Room if subdir == 'images/kamers' else Entity
+        game_ids = select(model.game_id).where(model.image_path == filename).distinct()
+
+    table = GameStorageStats.__table__
+    count_delta = (new_size is not None) - (old_size is not None)
+    try:
+        db.session.execute(
+            update(table)
+            .where(table.c.game_id.in_(game_ids))
+            .values(image_bytes=table.c.image_bytes + ((new_size or 0) - (old_size or 0)),
+                    image_count=table.c.image_count + count_delta,
+                    updated_at=datetime.utcnow())
+        )
+        if commit:
+            db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Storage stats: Failed to account for change of '{relative_path}': {e}")
+
+def apply_storage_deltas(game_id, column_deltas: dict):
+    """
+    Adds byte deltas ({GameStorageStats column: delta}) to a game's stats and bumps its
+    content revision, as part of the current transaction. For bulk statements, which
+    bypass the flush listeners.
+    """
+    _apply_deltas(db.session.connection(), {game_id: column_deltas})
+    _bump_content_revisions(db.session.connection(), [game_id])
+
+def _measure_game_images(game_id) -> tuple[int, int]:
+    """Returns (total bytes, count) of the existing image files a game references."""
+    image_bytes = 0
+    image_count = 0
+    for subdir, filename in game_image_files(game_id):
+        size = _file_size(subdir, filename)
+        if size is not None:
+            image_bytes += size
+            image_count += 1
+    return image_bytes, image_count
+
+def refresh_image_storage(game_id, commit: bool = True):
+    """Recounts only the image part of a game's stats (cheap compared to a full recompute)."""
+    image_bytes, image_count = _measure_game_images(game_id)
+    table = GameStorageStats.__table__
+    db.session.execute(update(table).where(table.c.game_id == game_id)
+                       .values(image_bytes=image_bytes, image_count=image_count, updated_at=datetime.utcnow()))
+    if commit:
+        db.session.commit()
+
+def recompute_game_storage(game_id) -> GameStorageStats | None:
+    """
+    Recomputes a game's storage stats from scratch, streaming every table once.
+    Also samples the JSON compression ratio used for export size estimates.
+    """
+    game = db.session.get(Game, game_id)
+    if not game:
+        return None
+
+    sizes = {}
+    raw_total = 0
+    compressed_total = 0
+    compressor = zlib.compressobj(6, zlib.DEFLATED, -15)
+    for model, column in TABLE_SIZE_COLUMNS.items():
+        table_bytes = 0
+        for obj in game_table_query(model, game_id).yield_per(1000):
+            line = serialize_row_line(obj.to_dict()).encode('utf-8')
+            table_bytes += len(line)
+            compressed_total += len(compressor.compress(line))
+        sizes[column] = table_bytes
+        raw_total += table_bytes
+    compressed_total += len(compressor.flush())
+
+    image_bytes, image_count = _measure_game_images(game_id)
+
+    stats = db.session.get(GameStorageStats, game_id)
+    if not stats:
+        stats = GameStorageStats(game_id=game_id)
+        db.session.add(stats)
+    for column, value in sizes.items():
+        setattr(stats, column, value)
+    stats.image_bytes = image_bytes
+    stats.image_count = image_count
+    stats.json_compression_ratio = (compressed_total / raw_total) if raw_total else 1.0
+    stats.recomputed_at = datetime.utcnow()
+    db.session.commit()
+    return stats
+
+def get_game_storage_stats(game_id, refresh: bool = False) -> GameStorageStats | None:
+    """Returns the cached stats for a game, computing them on first use (or when refresh=True)."""
+    stats = None if refresh else db.session.get(GameStorageStats, game_id)
+    return stats or recompute_game_storage(game_id)
+
+def estimate_export_bytes(stats: GameStorageStats) -> int:
+    """Estimates the compressed export size: deflated JSON, images stored as-is, ZIP overhead."""
+    entry_count = len(TABLE_SIZE_COLUMNS) + stats.image_count
+    return int(stats.json_bytes * stats.json_compression_ratio
+               + stats.image_bytes
+               + entry_count * ZIP_ENTRY_OVERHEAD_BYTES
+               + ZIP_END_RECORD_BYTES)
@@ -0,0 +1,145 @@
+import time
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from flask import current_app
+
+# Statuses the store returns for transient problems (rate limiting, deploys, overload)
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+class StoreAPIError(Exception):
+    """Raised when the Adventure Store API cannot be reached or returns an error."""
+    pass
+
+class _TTLCacheEntry:
+    def __init__(self, value):
+        self.value = value
+        self.fetched_at = time.monotonic()
+
+    @property
+    def age(self) -> float:
+        return time.monotonic() - self.fetched_at
+
+class StoreClient:
+    """
+    Shared client for the external Adventure Store API.
+
+    Keeps one requests.Session (keep-alive connection pool) per app, applies timeouts
+    and idempotent-request retries, and caches the tag list with stale-while-revalidate:
+    fresh entries are served directly, stale ones are served while a background refresh
+    runs, and only expired (or missing) entries block on the remote store.
+    """
+
+    def __init__(self, base_url: str, timeout: float = 10, connect_timeout: float = 5,
+                 max_retries: int = 2, backoff_factor: float = 0.5, pool_size: int = 10,
+                 tags_ttl: float = 300, tags_stale_ttl: float = 3600, logger=None):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = (connect_timeout, timeout)
+        self.tags_ttl = tags_ttl
+        self.tags_stale_ttl = tags_stale_ttl
+        self.logger = logger
+
+        retry = Retry(total=max_retries, backoff_factor=backoff_factor,
+                      status_forcelist=RETRY_STATUS_CODES,
+                      allowed_methods=frozenset(['GET', 'HEAD']), # POSTs are retried by the caller
+                      raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        # Key: api_key (str), Value: _TTLCacheEntry with the tag list
+        self._tags_cache = {}
+        self._tags_lock = threading.Lock()
+        self._tags_refreshing = set() # api keys with a background refresh in flight
+
+    def url(self, path: str) -> str:
+        """Builds an absolute store URL for an API path like '/api/tags'."""
+        return self.base_url + path
+
+    def request(self, method: str, path: str, api_key: str, timeout=None, **kwargs) -> requests.Response:
+        """Sends a request over the pooled session with the API key header and default timeouts."""
+        headers = kwargs.pop('headers', {}) or {}
+        headers['X-API-Key'] = api_key
+        return self.session.request(method, self.url(path), headers=headers,
+                                    timeout=timeout or self.timeout, **kwargs)
+
+    def _fetch_tags(self, api_key: str) -> list:
+        try:
+            response = self.request('GET', '/api/tags', api_key)
+            response.raise_for_status() # Raise HTTPError for bad responses (4xx or 5xx)
+            return response.json()
+        except (requests.exceptions.RequestException, ValueError) as e:
+            raise StoreAPIError(f"Could not connect to the store to fetch tags: {e}") from e
+
+    def _refresh_tags_in_background(self, api_key: str):
+        def refresh():
+            try:
+                tags = self._fetch_tags(api_key)
+                with self._tags_lock:
+                    self._tags_cache[api_key] = _TTLCacheEntry(tags)
+                if self.logger:
+                    self.logger.info(f"Store API: Revalidated tag cache ({len(tags)} tags).")
+            except StoreAPIError as e:
+                if self.logger:
+                    self.logger.warning(f"Store API: Background tag refresh failed, keeping stale copy: {e}")
+            finally:
+                with self._tags_lock:
+                    self._tags_refreshing.discard(api_key)
+
+        with self._tags_lock:
+            if api_key in self._tags_refreshing:
+                return # A refresh is already running
+            self._tags_refreshing.add(api_key)
+        threading.Thread(target=refresh, name='store-tags-refresh', daemon=True).start()
+
+    def get_tags(self, api_key: str) -> tuple[list, str]:
+        """
+        Returns the store's tag list, preferring the cache.
+
+        Returns:
+            A tuple (tags, cache_state) where cache_state is 'HIT', 'STALE' or 'MISS'.
+
+        Raises:
+            StoreAPIError: If the tags are not cached and the store cannot be reached.
+        """
+        with self._tags_lock:
+            entry = self._tags_cache.get(api_key)
+
+        if entry and entry.age < self.tags_ttl:
+            return entry.value, 'HIT'
+        if entry and entry.age < self.tags_ttl + self.tags_stale_ttl:
+            self._refresh_tags_in_background(api_key)
+            return entry.value, 'STALE'
+
+        try:
+            tags = self._fetch_tags(api_key)
+        except StoreAPIError:
+            if entry: # Expired, but still better than an error while the store is down
+                if self.logger:
+                    self.logger.warning("Store API: Tag fetch failed, serving expired cached tags.")
+                return entry.value, 'STALE'
+            raise
+        with self._tags_lock:
+            self._tags_cache[api_key] = _TTLCacheEntry(tags)
+        return tags, 'MISS'
+
+def get_store_client() -> StoreClient:
+    """Returns the app-wide StoreClient, creating it from the app config on first use."""
+    app = current_app._get_current_object()
+    client = app.extensions.get('store_client')
+    if client is None:
+        config = app.config
+        client = StoreClient(
+            base_url=config['ADVENTURE_STORE_URL'],
+            timeout=config['STORE_REQUEST_TIMEOUT'],
+            connect_timeout=config['STORE_CONNECT_TIMEOUT'],
+            max_retries=config['STORE_MAX_RETRIES'],
+            pool_size=config['STORE_POOL_SIZE'],
+            tags_ttl=config['STORE_TAGS_TTL_SECONDS'],
+            tags_stale_ttl=config['STORE_TAGS_STALE_SECONDS'],
+            logger=app.logger,
+        )
+        app.extensions['store_client'] = client
+    return client
@@ -0,0 +1,45 @@
+import os
+import sys
+from pathlib import Path
+
+import pytest
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from image_utils import normalize_image_file
+
+
+def _existing_upload(folder: Path) -> tuple[Path, bytes]:
+    target = folder / 'keep.png'
+    Image.new('RGB', (8, 6), (200, 40, 40)).save(target, 'PNG')
+    return target, target.read_bytes()
+
+
+@pytest.mark.parametrize('image_format', [None, 'jpeg'])
+def test_corrupt_entry_over_existing_file(tmp_path, image_format):
+    """An unreadable upload is rejected without replacing the file already at the target."""
+    target, original = _existing_upload(tmp_path)
+    temp = tmp_path / '.keep.png.1234.tmp'
+    temp.write_bytes(b'corrupt!')
+
+    with pytest.raises(Exception):
+        normalize_image_file(str(temp), str(target), (1600, 1600) if image_format else None, image_format)
+
+    assert target.read_bytes() == original
+    assert temp.exists() # Left for the caller to delete
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['.keep.png.1234.tmp', 'keep.png']
+
+
+@pytest.mark.parametrize('image_format', [None, 'jpeg'])
+def test_readable_entry_replaces_existing_file(tmp_path, image_format):
+    target, original = _existing_upload(tmp_path)
+    temp = tmp_path / '.keep.png.1234.tmp'
+    Image.new('RGB', (20, 10), (0, 0, 255)).save(temp, 'PNG')
+
+    info = normalize_image_file(str(temp), str(target), (1600, 1600) if image_format else None, image_format)
+
+    assert not temp.exists()
+    assert target.read_bytes() != original
+    assert (info['path'], info['width'], info['height']) == (str(target), 20, 10)
+    assert info['byte_size'] == target.stat().st_size
@@ -0,0 +1,102 @@
+import time
+from fnmatch import fnmatch
+from pathlib import Path
+from flask import current_app
+from sqlalchemy import select, union_all, literal, or_
+from app import db
+from models import Game, Room, Entity, UploadIndexEntry
+from image_utils import IMAGE_SUBDIRS, sharded_image_folders
+from upload_index import IMAGE_INDEX_EXTENSIONS, reconcile_tree, remove_from_index
+from image_ingest import forget_image_metadata
+from upload_storage import get_upload_storage
+
+# --- Orphaned Upload Collection ---
+# Finds image files in the game image folders that no game, room or entity references
+# any more (left behind by renames, compression, deleted games and re-imports) and
+# deletes them once they are older than UPLOAD_GC_GRACE_SECONDS, so an image that was
+# just uploaded but not yet assigned is never collected.
+
+def _image_folders() -> list[str]:
+    return sorted(set(IMAGE_SUBDIRS.values()))
+
+def referenced_upload_paths() -> set[str]:
+    """Every upload path referenced by any game, room or entity, in one query."""
+    subdir = IMAGE_SUBDIRS
+    references = union_all(
+        select(literal(subdir['game_start']).label('subdir'), Game.start_image_path.label('filename')).where(Game.start_image_path.isnot(None)),
+        select(literal(subdir['game_win']), Game.win_image_path).where(Game.win_image_path.isnot(None)),
+        select(literal(subdir['game_loss']), Game.loss_image_path).where(Game.loss_image_path.isnot(None)),
+        select(literal(subdir['room']), Room.image_path).where(Room.image_path.isnot(None)),
+        select(literal(subdir['entity']), Entity.image_path).where(Entity.image_path.isnot(None)),
+    )
+    return {f'{folder}/{filename}' for folder, filename in db.session.execute(references)}
+
+def _is_protected(name: str) -> bool:
+    """Built-in images the client falls back to (standaard_*.png etc.) are never orphans."""
+    return any(fnmatch(name, pattern) for pattern in current_app.config['UPLOAD_GC_PROTECTED_PATTERNS'])
+
+def find_orphaned_uploads() -> list[UploadIndexEntry]:
+    """Index entries of unreferenced files in the game image folders (the index is reconciled first)."""
+    for folder in _image_folders():
+        reconcile_tree(folder)
+    referenced = referenced_upload_paths()
+    folders = _image_folders()
+    in_folders = or_(UploadIndexEntry.parent.in_(folders), # Plus the shard subfolders
+                     *[UploadIndexEntry.path.startswith(folder + '/', autoescape=True) for folder in sharded_image_folders()])
+    entries = db.session.scalars(select(UploadIndexEntry).where(UploadIndexEntry.is_dir.is_(False), in_folders))
+    # Only images: the folders also hold other files, e.g. game JSON next to the adventure images
+    return [entry for entry in entries if entry.path not in referenced and not _is_protected(entry.name)
+            and Path(entry.name).suffix.lower() in IMAGE_INDEX_EXTENSIONS]
+
+def collect_orphaned_uploads(dry_run: bool = True, grace_seconds: int = None, progress=None) -> dict:
+    """
+    Reports orphaned uploads and, unless dry_run, deletes those past the grace period.
+
+    Args:
+        dry_run: Only report what would be deleted.
+        grace_seconds: Minimum age (by mtime) before an orphan is deleted; defaults to UPLOAD_GC_GRACE_SECONDS.
+        progress: Optional callback(deleted, total) while deleting.
+
+    Returns:
+        A summary with the orphans, their total size and what was (or would be) deleted.
+    """
+    if grace_seconds is None:
+        grace_seconds = current_app.config['UPLOAD_GC_GRACE_SECONDS']
+    cutoff_ns = int((time.time() - grace_seconds) * 1e9)
+    orphans = find_orphaned_uploads()
+    expired = [entry for entry in orphans if entry.mtime_ns <= cutoff_ns]
+    summary = {
+        "dry_run": dry_run,
+        "grace_seconds": grace_seconds,
+        "orphans": [{"path": entry.path, "size": entry.size, "mtime": entry.mtime_ns / 1e9} for entry in orphans],
+        "orphan_count": len(orphans),
+        "orphan_bytes": sum(entry.size for entry in orphans),
+        "expired_count": len(expired),
+        "expired_bytes": sum(entry.size for entry in expired),
+        "deleted_count": 0,
+        "deleted_bytes": 0,
+    }
+    if dry_run or not expired:
+        return summary
+
+    # A game may have started using a file while we scanned; check again right before deleting
+    referenced = referenced_upload_paths()
+    storage = get_upload_storage()
+    for index, entry in enumerate(expired, start=1):
+        if entry.path in referenced:
+            continue
+        path, size = entry.path, entry.size
+        try:
+            storage.delete(path)
+        except Exception as e:
+            current_app.logger.error(f"Upload GC: Failed to delete '{path}': {e}")
+            continue
+        forget_image_metadata(path, commit=False)
+        remove_from_index(path)
+        summary["deleted_count"] += 1
+        summary["deleted_bytes"] += size
+        if progress:
+            progress(index, len(expired))
+    current_app.logger.info(f"Upload GC: Deleted {summary['deleted_count']} orphaned uploads "
+                            f"({summary['deleted_bytes']} bytes)")
+    return summary
@@ -0,0 +1,228 @@
+import time
+from pathlib import Path
+from flask import current_app
+from PIL import Image
+from sqlalchemy import select, delete, func, or_
+from sqlalchemy.exc import IntegrityError
+from app import db
+from models import UploadIndexEntry, ImageMetadata
+from upload_storage import get_upload_storage
+
+# --- Uploads Index ---
+# The upload_index table mirrors the uploads tree (path, size, mtime, image dimensions), so
+# the file manager and image pickers query the database instead of walking directories.
+# The file API updates it on upload, rename and delete; everything else (admin compression,
+# files copied in by hand) is picked up by reconcile_directory, which only re-lists a
+# directory when its mtime differs from the one recorded at the last pass. With uploads in a
+# bucket there are no folder mtimes: the API keeps the index current and a folder is only
+# listed again when forced.
+
+IMAGE_INDEX_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.gif', '.webp', '.bmp'} # Dimensions are recorded for these
+SORT_COLUMNS = {
+    'name': func.lower(UploadIndexEntry.name),
+    'size': UploadIndexEntry.size,
+    'mtime': UploadIndexEntry.mtime_ns,
+}
+
+def _uploads_root() -> Path:
+    return Path(current_app.config['UPLOADS_FOLDER']).resolve()
+
+def _parent_of(relative_path: str) -> str | None:
+    if not relative_path:
+        return None
+    return relative_path.rpartition('/')[0]
+
+def _subtree_filter(relative_path: str):
+    """Matches an entry and, for directories, everything below it."""
+    if not relative_path:
+        return UploadIndexEntry.path.isnot(None)
+    return (UploadIndexEntry.path == relative_path) | UploadIndexEntry.path.startswith(relative_path + '/', autoescape=True)
+
+def _image_dimensions(relative_path: str, size: int) -> tuple[int | None, int | None]:
+    """Dimensions from the ingest metadata when current, else from the image header (of a local copy)."""
+    if Path(relative_path).suffix.lower() not in IMAGE_INDEX_EXTENSIONS:
+        return None, None
+    metadata = db.session.get(ImageMetadata, relative_path)
+    if metadata and metadata.byte_size == size:
+        return metadata.width, metadata.height
+    local_path = _uploads_root() / relative_path
+    if get_upload_storage().remote and not local_path.is_file():
+        return None, None # Not downloaded just for its size
+    try:
+        with Image.open(local_path) as img: # Reads the header only
+            return img.size
+    except Exception:
+        return None, None
+
+def _apply_stat(entry: UploadIndexEntry, is_dir: bool, size: int, mtime_ns: int):
+    entry.is_dir = is_dir
+    entry.size = 0 if is_dir else size
+    if is_dir:
+        entry.width = entry.height = None
+        if entry.mtime_ns is None:
+            entry.mtime_ns = 0 # Listed by the next reconcile pass
+    else:
+        entry.mtime_ns = mtime_ns
+        entry.width, entry.height = _image_dimensions(entry.path, size)
+
+def _stat_upload(relative_path: str) -> tuple[bool, int, int] | None:
+    """(is_dir, size, mtime_ns) of an upload, or None when it does not exist."""
+    absolute_path = _uploads_root() / relative_path
+    storage = get_upload_storage()
+    if storage.remote:
+        found = storage.stat(relative_path)
+        if found is None:
+            return None
+        try:
+            mtime_ns = absolute_path.stat().st_mtime_ns # The cached copy, written just now
+        except OSError:
+            mtime_ns = time.time_ns()
+        return found[0] == 'dir', found[1] or 0, mtime_ns
+    try:
+        stat = absolute_path.stat()
+    except FileNotFoundError:
+        return None
+    return absolute_path.is_dir(), stat.st_size, stat.st_mtime_ns
+
+def _new_entry(relative_path: str) -> UploadIndexEntry:
+    return UploadIndexEntry(path=relative_path, parent=_parent_of(relative_path),
+                            name=relative_path.rpartition('/')[2], mtime_ns=None)
+
+def index_path(relative_path: str, commit: bool = True):
+    """Adds, refreshes or (when it no longer exists) removes one file or directory."""
+    relative_path = relative_path.strip('/')
+    found = _stat_upload(relative_path)
+    if found is None:
+        remove_from_index(relative_path, commit=commit)
+        return
+    entry = db.session.get(UploadIndexEntry, relative_path) or _new_entry(relative_path)
+    _apply_stat(entry, *found)
+    db.session.add(entry)
+    if commit:
+        db.session.commit()
+
+def remove_from_index(relative_path: str, commit: bool = True):
+    """Removes an entry and everything below it."""
+    db.session.execute(delete(UploadIndexEntry).where(_subtree_filter(relative_path.strip('/'))))
+    if commit:
+        db.session.commit()
+
+def move_in_index(old_path: str, new_path: str, commit: bool = True):
+    """Follows a rename: the old subtree is dropped and the new one indexed."""
+    remove_from_index(old_path, commit=False)
+    index_path(new_path, commit=False)
+    if commit:
+        db.session.commit()
+
+def reconcile_directory(relative_dir: str = '', force: bool = False) -> dict:
+    """
+    Brings the index entries directly inside a directory in line with the disk.
+    A directory whose mtime matches the last pass is skipped after a single stat()
+    (adding, removing or renaming an entry always changes it); changed files are
+    detected by size and mtime.
+
+    Returns:
+        Counts of 'added', 'updated' and 'removed' entries and whether the directory was 'listed'.
+    """
+    relative_dir = relative_dir.strip('/')
+    counts = {'added': 0, 'updated': 0, 'removed': 0, 'listed': False}
+    storage = get_upload_storage()
+    found = _stat_upload(relative_dir)
+    if found is None or not found[0]:
+        remove_from_index(relative_dir)
+        return counts
+    dir_mtime_ns = 0 if storage.remote else found[2]
+    dir_entry = db.session.get(UploadIndexEntry, relative_dir)
+    if dir_entry is not None and dir_entry.mtime_ns == dir_mtime_ns and not force:
+        return counts
+
+    counts['listed'] = True
+    indexed = {entry.name: entry for entry in db.session.scalars(
+        select(UploadIndexEntry).where(UploadIndexEntry.parent == relative_dir))}
+    try:
+        for name, is_dir, size, mtime_ns in storage.scan(relative_dir):
+            if name.startswith('.'):
+                continue # Hidden and temporary files (e.g. in-progress writes)
+            entry = indexed.pop(name, None)
+            if entry is None:
+                entry = _new_entry(f'{relative_dir}/{name}' if relative_dir else name)
+                counts['added'] += 1
+            elif entry.is_dir == is_dir and (is_dir or (entry.size == size and entry.mtime_ns == mtime_ns)):
+                continue
+            else:
+                counts['updated'] += 1
+            _apply_stat(entry, is_dir, size, mtime_ns)
+            db.session.add(entry)
+        for entry in indexed.values():
+            db.session.execute(delete(UploadIndexEntry).where(_subtree_filter(entry.path)))
+            counts['removed'] += 1
+
+        dir_entry = dir_entry or _new_entry(relative_dir)
+        dir_entry.is_dir = True
+        dir_entry.mtime_ns = dir_mtime_ns
+        db.session.add(dir_entry)
+        db.session.commit()
+    except IntegrityError:
+        # Another worker reconciled the same directory at the same time; its result stands
+        db.session.rollback()
+        current_app.logger.info(f"Upload index: Concurrent reconcile of '{relative_dir or '/'}', skipped")
+    if counts['added'] or counts['updated'] or counts['removed']:
+        current_app.logger.info(f"Upload index: Reconciled '{relative_dir or '/'}' (+{counts['added']} "
+                                f"~{counts['updated']} -{counts['removed']})")
+    return counts
+
+def reconcile_tree(relative_dir: str = '', force: bool = False) -> dict:
+    """Reconciles a directory and every directory below it (one stat per unchanged directory)."""
+    totals = {'directories': 0, 'listed': 0, 'added': 0, 'updated': 0, 'removed': 0}
+    pending = [relative_dir.strip('/')]
+    while pending:
+        current = pending.pop()
+        counts = reconcile_directory(current, force=force)
+        totals['directories'] += 1
+        totals['listed'] += counts['listed']
+        for key in ('added', 'updated', 'removed'):
+            totals[key] += counts[key]
+        pending.extend(db.session.scalars(select(UploadIndexEntry.path).where(
+            UploadIndexEntry.parent == current, UploadIndexEntry.is_dir.is_(True))))
+    return totals
+
+def query_index(relative_dir: str, recursive: bool = False, files_only: bool = False, extensions=None,
+                search: str = None, prefix: str = None, sort: str = 'name', descending: bool = False,
+                page: int = None, per_page: int = None) -> tuple[list[UploadIndexEntry], int]:
+    """
+    Lists indexed entries of a directory (or, recursively, of its whole subtree).
+    Directories come first, then entries ordered by name, size or mtime.
+
+    Args:
+        search: Case-insensitive substring of the name.
+        prefix: Case-insensitive start of the name.
+        extensions: Optional set of extensions (without dot) a file must have.
+        page, per_page: 1-based page; None returns everything.
+
+    Returns:
+        (entries, total number of matches).
+    """
+    relative_dir = relative_dir.strip('/')
+    query = select(UploadIndexEntry)
+    if recursive:
+        query = query.where(_subtree_filter(relative_dir), UploadIndexEntry.path != relative_dir)
+    else:
+        query = query.where(UploadIndexEntry.parent == relative_dir)
+    if files_only:
+        query = query.where(UploadIndexEntry.is_dir.is_(False))
+    if extensions:
+        lower_name = func.lower(UploadIndexEntry.name)
+        query = query.where(or_(*[lower_name.endswith(f'.{extension}') for extension in extensions]))
+    if search:
+        query = query.where(func.lower(UploadIndexEntry.name).contains(search.lower(), autoescape=True))
+    if prefix:
+        query = query.where(func.lower(UploadIndexEntry.name).startswith(prefix.lower(), autoescape=True))
+
+    total = db.session.scalar(select(func.count()).select_from(query.subquery()))
+    sort_column = SORT_COLUMNS.get(sort, SORT_COLUMNS['name'])
+    query = query.order_by(UploadIndexEntry.is_dir.desc(),
+                           sort_column.desc() if descending else sort_column,
+                           UploadIndexEntry.path)
+    if page and per_page:
+        query = query.offset((page - 1) * per_page).limit(per_page)
+    return db.session.scalars(query).all(), total
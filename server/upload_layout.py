@@ -0,0 +1,143 @@
+import os
+import json
+from pathlib import Path
+from flask import current_app
+from sqlalchemy import select, update, func, bindparam
+from app import db
+from models import Room, Entity, ImageMetadata
+from image_utils import IMAGE_SUBDIRS, SHARDED_IMAGE_TYPES, SHARD_PATTERN, shard_prefix
+from storage_stats import TABLE_SIZE_COLUMNS, apply_storage_deltas
+from upload_index import IMAGE_INDEX_EXTENSIONS, reconcile_tree
+from upload_storage import get_upload_storage
+
+# --- Upload Layout Migration ---
+# Moves the room and entity images between the flat layout (images/kamers/hal.jpg) and the
+# sharded one (images/kamers/6c/0f/hal.jpg) and rewrites the database references in bulk.
+# Files are moved first; a reference is only rewritten once its file is at the new place and
+# gone from the old one, so an interrupted run can simply be started again.
+
+LAYOUT_MODELS = {'room': Room, 'entity': Entity}
+BATCH_SIZE = 500
+
+def _other_layout_name(name: str, sharded: bool) -> str | None:
+    """The name in the requested layout, or None when name is in it already."""
+    if sharded:
+        return None if '/' in name else f'{shard_prefix(name)}/{name}'
+    return name.rpartition('/')[2] if SHARD_PATTERN.match(name) else None
+
+def _files_to_move(folder_path: Path, sharded: bool) -> list[str]:
+    """Names (relative to the folder) of the images that are not in the requested layout yet."""
+    if sharded:
+        candidates = [path.name for path in folder_path.iterdir() if path.is_file()]
+    else:
+        candidates = [path.relative_to(folder_path).as_posix() for path in folder_path.glob('*/*/*') if path.is_file()]
+    return sorted(name for name in candidates if not name.rpartition('/')[2].startswith('.')
+                  and Path(name).suffix.lower() in IMAGE_INDEX_EXTENSIONS and _other_layout_name(name, sharded))
+
+def _move_files(folder_path: Path, sharded: bool, dry_run: bool, summary: dict):
+    for name in _files_to_move(folder_path, sharded):
+        new_name = _other_layout_name(name, sharded)
+        target_path = folder_path / new_name
+        if target_path.exists():
+            summary['conflicts'].append(name) # Same name in both layouts: left for the admin
+            continue
+        if not dry_run:
+            target_path.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(folder_path / name, target_path)
+        summary['moved'] += 1
+    if not sharded and not dry_run:
+        # Drop the emptied shard folders, second level first
+        shard_dirs = [(path, path.relative_to(folder_path).as_posix() + '/x') for path in folder_path.glob('*/*')]
+        shard_dirs += [(path, path.relative_to(folder_path).as_posix() + '/00/x') for path in folder_path.glob('*')]
+        for shard_dir, probe in shard_dirs:
+            if shard_dir.is_dir() and SHARD_PATTERN.match(probe):
+                try:
+                    shard_dir.rmdir() # Only succeeds when empty
+                except OSError:
+                    pass
+
+def _renames(folder_path: Path, names, sharded: bool, dry_run: bool) -> dict:
+    """old name -> new name for the names whose file has moved (or, in a dry run, would move)."""
+    renames = {}
+    for name in names:
+        new_name = _other_layout_name(name, sharded)
+        if not new_name:
+            continue
+        old_exists, new_exists = (folder_path / name).exists(), (folder_path / new_name).exists()
+        if (old_exists and not new_exists) if dry_run else (new_exists and not old_exists):
+            renames[name] = new_name
+    return renames
+
+def _rewrite_references(model, renames: dict) -> int:
+    """Points every image_path in renames at its new name, with one batched UPDATE per chunk."""
+    size_column = TABLE_SIZE_COLUMNS[model]
+    table = model.__table__
+    statement = update(table).where(table.c.image_path == bindparam('old_name')).values(image_path=bindparam('new_name'))
+    items = sorted(renames.items())
+    rewritten = 0
+    for start in range(0, len(items), BATCH_SIZE):
+        chunk = items[start:start + BATCH_SIZE]
+        # Bulk updates bypass the storage listeners: account for the changed JSON lengths
+        game_deltas = {}
+        for game_id, name, count in db.session.execute(
+                select(model.game_id, model.image_path, func.count())
+                .where(model.image_path.in_([old_name for old_name, _ in chunk]))
+                .group_by(model.game_id, model.image_path)):
+            delta = count * (len(json.dumps(renames[name])) - len(json.dumps(name)))
+            game_deltas[game_id] = game_deltas.get(game_id, 0) + delta
+            rewritten += count
+        db.session.execute(statement, [{'old_name': old_name, 'new_name': new_name} for old_name, new_name in chunk])
+        for game_id, delta in game_deltas.items():
+            apply_storage_deltas(game_id, {size_column: delta})
+        db.session.commit()
+    return rewritten
+
+def _rewrite_metadata(folder: str, renames: dict):
+    table = ImageMetadata.__table__
+    statement = update(table).where(table.c.path == bindparam('old_path')).values(path=bindparam('new_path'))
+    items = sorted(renames.items())
+    for start in range(0, len(items), BATCH_SIZE):
+        db.session.execute(statement, [{'old_path': f'{folder}/{old_name}', 'new_path': f'{folder}/{new_name}'}
+                                       for old_name, new_name in items[start:start + BATCH_SIZE]])
+        db.session.commit()
+
+def migrate_upload_layout(sharded: bool = True, dry_run: bool = False) -> dict:
+    """
+    Moves the room and entity images into the sharded layout (or, with sharded=False, back to
+    the flat one) and rewrites the references, image metadata, storage stats and upload index.
+    Set UPLOAD_SHARDED_LAYOUT to match, so new uploads follow the same layout.
+
+    Returns:
+        Per image folder: files 'moved', 'references' and 'metadata' rows rewritten, and
+        'conflicts' (names present in both layouts, left alone).
+    """
+    if get_upload_storage().remote:
+        raise RuntimeError("The layout can only be migrated with local upload storage; migrate before moving to a bucket")
+    uploads_root = Path(current_app.config['UPLOADS_FOLDER'])
+    summary = {}
+    for image_type in SHARDED_IMAGE_TYPES:
+        folder = IMAGE_SUBDIRS[image_type]
+        folder_path = uploads_root / folder
+        folder_summary = summary[folder] = {'moved': 0, 'references': 0, 'metadata': 0, 'conflicts': []}
+        if not folder_path.is_dir():
+            continue
+        model = LAYOUT_MODELS[image_type]
+        _move_files(folder_path, sharded, dry_run, folder_summary)
+
+        referenced = db.session.scalars(select(model.image_path).where(model.image_path.isnot(None)).distinct()).all()
+        reference_renames = _renames(folder_path, referenced, sharded, dry_run)
+        recorded = [path[len(folder) + 1:] for path in db.session.scalars(
+            select(ImageMetadata.path).where(ImageMetadata.path.startswith(folder + '/', autoescape=True)))]
+        metadata_renames = _renames(folder_path, recorded, sharded, dry_run)
+        if dry_run:
+            folder_summary['references'] = db.session.scalar(
+                select(func.count()).where(model.image_path.in_(list(reference_renames)))) if reference_renames else 0
+            folder_summary['metadata'] = len(metadata_renames)
+            continue
+        folder_summary['references'] = _rewrite_references(model, reference_renames)
+        _rewrite_metadata(folder, metadata_renames)
+        folder_summary['metadata'] = len(metadata_renames)
+        reconcile_tree(folder)
+        current_app.logger.info(f"Upload layout: '{folder}' {'sharded' if sharded else 'flattened'}, "
+                                f"{folder_summary['moved']} files moved, {folder_summary['references']} references rewritten")
+    return summary
@@ -0,0 +1,248 @@
+import os
+import uuid
+import shutil
+import mimetypes
+from pathlib import Path
+from flask import current_app
+
+try:
+    import boto3 # Optional: only needed for UPLOAD_STORAGE = 's3'
+    from botocore.config import Config as BotoConfig
+    from botocore.exceptions import ClientError
+except ImportError:
+    boto3 = None
+
+# --- Upload Storage Backends ---
+# Where uploaded files live, addressed by their path relative to the uploads folder
+# ('images/kamers/hal.jpg'). UPLOAD_STORAGE = 'local' keeps them in UPLOADS_FOLDER, as before.
+# 's3' keeps them in an S3-compatible bucket (AWS S3, MinIO, ...), so several web nodes can
+# share them without an NFS mount: UPLOADS_FOLDER becomes this node's cache, files changed
+# here are pushed to the bucket, files needed for image processing are fetched on demand,
+# and browsers download uploads from the bucket with pre-signed URLs.
+
+COPY_BUFFER_SIZE = 1024 * 1024
+DELETE_BATCH_SIZE = 1000 # Maximum keys per S3 DeleteObjects call
+
+class LocalStorage:
+    """Uploads in a local folder (the default)."""
+    remote = False
+
+    @property
+    def root(self) -> Path:
+        return Path(current_app.config['UPLOADS_FOLDER'])
+
+    def local_path(self, key: str) -> Path:
+        return self.root / key
+
+    def stat(self, key: str) -> tuple[str, int | None] | None:
+        """('file', size), ('dir', None), or None when nothing exists at key."""
+        path = self.local_path(key)
+        if path.is_file():
+            return 'file', path.stat().st_size
+        return ('dir', None) if path.is_dir() else None
+
+    def size(self, key: str) -> int | None:
+        found = self.stat(key)
+        return found[1] if found and found[0] == 'file' else None
+
+    def fetch(self, key: str) -> Path | None:
+        """A local path holding the current file, or None when it does not exist."""
+        path = self.local_path(key)
+        return path if path.is_file() else None
+
+    def open(self, key: str):
+        """Opens a file for streaming reads; raises FileNotFoundError."""
+        return open(self.local_path(key), 'rb')
+
+    def write(self, key: str, stream) -> int:
+        """Stores a stream under key, replacing any file atomically; returns the bytes written."""
+        path = self.local_path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = path.with_name(f'.{path.name}.{uuid.uuid4().hex}.tmp')
+        try:
+            with open(temp_path, 'wb') as target:
+                shutil.copyfileobj(stream, target, COPY_BUFFER_SIZE)
+            os.replace(temp_path, path)
+        finally:
+            temp_path.unlink(missing_ok=True)
+        return path.stat().st_size
+
+    def push(self, key: str):
+        """Publishes a file that was created or changed in place in the local folder."""
+
+    def make_dir(self, key: str):
+        """Creates a folder; raises FileExistsError when it exists."""
+        self.local_path(key).mkdir(exist_ok=False)
+
+    def move(self, old_key: str, new_key: str):
+        """Renames a file or a folder with everything in it."""
+        self.local_path(old_key).rename(self.local_path(new_key))
+
+    def delete(self, key: str):
+        """Deletes a file, or a folder with everything in it."""
+        path = self.local_path(key)
+        if path.is_dir():
+            shutil.rmtree(path)
+        else:
+            path.unlink(missing_ok=True)
+
+    def scan(self, key: str):
+        """Yields (name, is_dir, size, mtime_ns) for the entries directly inside a folder."""
+        for entry in os.scandir(self.local_path(key)):
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue # Deleted while listing
+            yield entry.name, entry.is_dir(), stat.st_size, stat.st_mtime_ns
+
+    def url(self, key: str) -> str | None:
+        """A direct download URL bypassing the app, or None when the app serves the file."""
+        return None
+
+class S3Storage(LocalStorage):
+    """
+    Uploads in an S3-compatible bucket. The local folder only caches files: a cached copy is
+    used while it matches the object's size and is not older than it.
+    """
+    remote = True
+
+    def __init__(self, bucket: str, prefix: str = '', endpoint_url: str = None, region: str = None,
+                 access_key: str = None, secret_key: str = None, url_expires: int = 3600):
+        if boto3 is None:
+            raise RuntimeError("UPLOAD_STORAGE 's3' requires the boto3 package (pip install boto3)")
+        self.bucket = bucket
+        self.prefix = prefix.strip('/') + '/' if prefix.strip('/') else ''
+        self.url_expires = url_expires
+        self.client = boto3.client(
+            's3', endpoint_url=endpoint_url, region_name=region,
+            aws_access_key_id=access_key, aws_secret_access_key=secret_key,
+            # Path-style addressing for MinIO and other self-hosted endpoints
+            config=BotoConfig(s3={'addressing_style': 'path'}) if endpoint_url else None)
+
+    def _key(self, key: str) -> str:
+        return self.prefix + key.strip('/')
+
+    def _head(self, key: str) -> dict | None:
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=self._key(key))
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return None
+            raise
+
+    def _object_keys(self, key: str):
+        """Keys of the object at key and of every object below it (folder contents and marker)."""
+        object_key = self._key(key)
+        if self._head(key) is not None:
+            yield object_key
+        for page in self.client.get_paginator('list_objects_v2').paginate(Bucket=self.bucket, Prefix=object_key + '/'):
+            for item in page.get('Contents', []):
+                yield item['Key']
+
+    def stat(self, key: str) -> tuple[str, int | None] | None:
+        if not key.strip('/'):
+            return 'dir', None
+        head = self._head(key)
+        if head is not None:
+            return 'file', head['ContentLength']
+        listing = self.client.list_objects_v2(Bucket=self.bucket, Prefix=self._key(key) + '/', MaxKeys=1)
+        return ('dir', None) if listing.get('KeyCount') else None
+
+    def fetch(self, key: str) -> Path | None:
+        head = self._head(key)
+        if head is None:
+            return None
+        path = self.local_path(key)
+        if path.is_file():
+            stat = path.stat()
+            if stat.st_size == head['ContentLength'] and stat.st_mtime >= head['LastModified'].timestamp():
+                return path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = path.with_name(f'.{path.name}.{uuid.uuid4().hex}.tmp')
+        try:
+            self.client.download_file(self.bucket, self._key(key), str(temp_path))
+            os.replace(temp_path, path)
+        finally:
+            temp_path.unlink(missing_ok=True)
+        return path
+
+    def open(self, key: str):
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=self._key(key))['Body']
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey'):
+                raise FileNotFoundError(key) from e
+            raise
+
+    def write(self, key: str, stream) -> int:
+        size = super().write(key, stream) # Cached locally, then uploaded from the file (multipart for big files)
+        self.push(key)
+        return size
+
+    def push(self, key: str):
+        content_type = mimetypes.guess_type(key)[0] or 'application/octet-stream'
+        self.client.upload_file(str(self.local_path(key)), self.bucket, self._key(key),
+                                ExtraArgs={'ContentType': content_type})
+        os.utime(self.local_path(key)) # The cached copy is now as new as the object
+
+    def make_dir(self, key: str):
+        # S3 has no folders; an empty marker object keeps an empty one listed
+        if self.stat(key) is not None:
+            raise FileExistsError(key)
+        self.client.put_object(Bucket=self.bucket, Key=self._key(key) + '/', Body=b'')
+        self.local_path(key).mkdir(parents=True, exist_ok=True)
+
+    def move(self, old_key: str, new_key: str):
+        old_prefix, new_prefix = self._key(old_key), self._key(new_key)
+        moved = list(self._object_keys(old_key))
+        for object_key in moved:
+            self.client.copy({'Bucket': self.bucket, 'Key': object_key}, self.bucket,
+                             new_prefix + object_key[len(old_prefix):]) # Managed copy: multipart for big objects
+        self._delete_keys(moved)
+        old_path, new_path = self.local_path(old_key), self.local_path(new_key)
+        if old_path.exists():
+            new_path.parent.mkdir(parents=True, exist_ok=True)
+            old_path.rename(new_path)
+
+    def delete(self, key: str):
+        self._delete_keys(list(self._object_keys(key)))
+        super().delete(key)
+
+    def _delete_keys(self, object_keys: list[str]):
+        for start in range(0, len(object_keys), DELETE_BATCH_SIZE):
+            self.client.delete_objects(Bucket=self.bucket, Delete={
+                'Objects': [{'Key': object_key} for object_key in object_keys[start:start + DELETE_BATCH_SIZE]],
+                'Quiet': True})
+
+    def scan(self, key: str):
+        prefix = self._key(key) + '/' if key.strip('/') else self.prefix
+        for page in self.client.get_paginator('list_objects_v2').paginate(Bucket=self.bucket, Prefix=prefix, Delimiter='/'):
+            for common_prefix in page.get('CommonPrefixes', []):
+                yield common_prefix['Prefix'][len(prefix):].rstrip('/'), True, 0, 0
+            for item in page.get('Contents', []):
+                name = item['Key'][len(prefix):]
+                if name: # Skips the folder's own marker
+                    yield name, False, item['Size'], int(item['LastModified'].timestamp() * 1e9)
+
+    def url(self, key: str) -> str | None:
+        return self.client.generate_presigned_url('get_object', Params={'Bucket': self.bucket, 'Key': self._key(key)},
+                                                  ExpiresIn=self.url_expires)
+
+def init_upload_storage(app):
+    """Creates the storage backend selected by UPLOAD_STORAGE."""
+    backend = app.config.get('UPLOAD_STORAGE', 'local')
+    if backend == 's3':
+        storage = S3Storage(app.config['S3_BUCKET'], prefix=app.config['S3_PREFIX'],
+                            endpoint_url=app.config['S3_ENDPOINT_URL'], region=app.config['S3_REGION'],
+                            access_key=app.config['S3_ACCESS_KEY_ID'], secret_key=app.config['S3_SECRET_ACCESS_KEY'],
+                            url_expires=app.config['S3_URL_EXPIRES'])
+        app.logger.info(f"Upload storage: S3 bucket '{app.config['S3_BUCKET']}'"
+                        f"{' at ' + app.config['S3_ENDPOINT_URL'] if app.config['S3_ENDPOINT_URL'] else ''}")
+    elif backend == 'local':
+        storage = LocalStorage()
+    else:
+        raise ValueError(f"Unknown UPLOAD_STORAGE '{backend}' (use 'local' or 's3')")
+    app.extensions['upload_storage'] = storage
+
+def get_upload_storage() -> LocalStorage:
+    return current_app.extensions['upload_storage']
@@ -0,0 +1,155 @@
+import os
+import zlib
+import shutil
+import zipfile
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from flask import current_app
+
+# --- ZIP Archive Helpers ---
+# Picks the compression method per entry and spreads deflate work over several cores.
+# Used by game exports and store submissions.
+
+# Formats that are already compressed: deflating them again costs CPU and saves ~nothing
+STORED_EXTENSIONS = {
+    '.jpg', '.jpeg', '.png', '.gif', '.webp', '.avif',
+    '.zip', '.gz', '.bz2', '.xz', '.7z',
+    '.mp3', '.ogg', '.mp4', '.webm', '.woff', '.woff2',
+}
+
+DEFAULT_COMPRESSION_LEVEL = 6
+DEFLATE_CHUNK_SIZE = 256 * 1024 # Input bytes per deflate task
+DEFLATE_WINDOW_SIZE = 32 * 1024 # Each chunk is primed with this much of the previous one
+COPY_BUFFER_SIZE = 1024 * 1024
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def compress_type_for(name: str) -> int:
+    """Returns ZIP_STORED for already-compressed media, ZIP_DEFLATED for everything else."""
+    return zipfile.ZIP_STORED if Path(name).suffix.lower() in STORED_EXTENSIONS else zipfile.ZIP_DEFLATED
+
+def _get_executor() -> ThreadPoolExecutor:
+    """Returns the shared deflate thread pool (zlib releases the GIL while compressing)."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            workers = current_app.config.get('ZIP_COMPRESSION_WORKERS') or os.cpu_count() or 1
+            _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='zip-deflate')
+        return _executor
+
+def _deflate_chunk(data: bytes, level: int, dictionary: bytes, final: bool) -> bytes:
+    """Deflates one chunk as part of a larger raw deflate stream."""
+    if dictionary:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15, zdict=dictionary)
+    else:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    output = compressor.compress(data)
+    # A sync flush ends on a byte boundary without a final block, so the chunks can be
+    # concatenated; only the last chunk finishes the stream.
+    return output + compressor.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+class _ParallelDeflater:
+    """
+    Drop-in for the zlib compressor of a zipfile write handle. Input is cut into chunks
+    that are deflated on the shared pool; output is handed back strictly in order, so
+    the entry's data is identical in layout to a single deflate stream.
+    """
+
+    def __init__(self, level: int):
+        self.level = level
+        self.executor = _get_executor()
+        self.max_pending = self.executor._max_workers * 2 # Bounds memory held by queued chunks
+        self.pending = deque()
+        self.buffer = bytearray()
+        self.dictionary = b''
+
+    def _submit(self, chunk: bytes, final: bool):
+        self.pending.append(self.executor.submit(_deflate_chunk, chunk, self.level, self.dictionary, final))
+        self.dictionary = chunk[-DEFLATE_WINDOW_SIZE:]
+
+    def _collect(self, wait_for: int) -> bytes:
+        """Returns the output of finished chunks at the head of the queue (waiting for at least wait_for)."""
+        output = []
+        while self.pending and (wait_for > 0 or self.pending[0].done()):
+            output.append(self.pending.popleft().result())
+            wait_for -= 1
+        return b''.join(output)
+
+    def compress(self, data) -> bytes:
+        self.buffer += data
+        start = 0
+        while len(self.buffer) - start >= DEFLATE_CHUNK_SIZE:
+            self._submit(bytes(self.buffer[start:start + DEFLATE_CHUNK_SIZE]), final=False)
+            start += DEFLATE_CHUNK_SIZE
+        del self.buffer[:start]
+        return self._collect(wait_for=len(self.pending) - self.max_pending)
+
+    def flush(self) -> bytes:
+        self._submit(bytes(self.buffer), final=True)
+        self.buffer.clear()
+        return self._collect(wait_for=len(self.pending))
+
+def open_archive_entry(zip_file: zipfile.ZipFile, arcname: str, date_time=None, mode: int = 0o644,
+                       force_zip64: bool = False):
+    """
+    Opens a new archive entry for writing, stored or deflated depending on its name.
+    Deflated entries are compressed in parallel chunks at ZIP_COMPRESSION_LEVEL.
+
+    Returns:
+        A writable file object; close it (or use it as a context manager) to finish the entry.
+    """
+    zinfo = zipfile.ZipInfo(arcname, date_time=date_time or datetime.now().timetuple()[:6])
+    zinfo.external_attr = (mode & 0xFFFF) << 16
+    zinfo.compress_type = compress_type_for(arcname)
+    level = current_app.config.get('ZIP_COMPRESSION_LEVEL', DEFAULT_COMPRESSION_LEVEL)
+    zinfo._compresslevel = level # Read by zipfile when it creates the entry's compressor
+
+    handle = zip_file.open(zinfo, 'w', force_zip64=force_zip64)
+    if (zinfo.compress_type == zipfile.ZIP_DEFLATED and getattr(handle, '_compressor', None) is not None
+            and _get_executor()._max_workers > 1):
+        # zipfile still computes the CRC, sizes, headers and data descriptor; only the
+        # deflate work is swapped for the chunked, multi-threaded version.
+        handle._compressor = _ParallelDeflater(level)
+    return handle
+
+def write_archive_file(zip_file: zipfile.ZipFile, source_path, arcname: str):
+    """Copies a file from disk into the archive, streaming it through open_archive_entry."""
+    source_path = Path(source_path)
+    stat = source_path.stat()
+    date_time = datetime.fromtimestamp(stat.st_mtime).timetuple()[:6]
+    if date_time[0] < 1980:
+        date_time = (1980, 1, 1, 0, 0, 0) # Earliest date a ZIP header can hold
+    with open(source_path, 'rb') as source_file, \
+            open_archive_entry(zip_file, arcname, date_time=date_time, mode=stat.st_mode,
+                               force_zip64=stat.st_size > zipfile.ZIP64_LIMIT) as entry:
+        shutil.copyfileobj(source_file, entry, COPY_BUFFER_SIZE)
+
+def write_archive_bytes(zip_file: zipfile.ZipFile, arcname: str, data: bytes):
+    """Writes in-memory data as an archive entry."""
+    with open_archive_entry(zip_file, arcname) as entry:
+        entry.write(data)
+
+def write_archive_upload(zip_file: zipfile.ZipFile, relative_path: str, arcname: str) -> bool:
+    """
+    Copies an uploaded file into the archive from wherever the upload storage keeps it,
+    streaming it from the bucket when it is not local. Returns False if it does not exist.
+    """
+    from upload_storage import get_upload_storage
+    storage = get_upload_storage()
+    if not storage.remote:
+        source_path = storage.local_path(relative_path)
+        if not source_path.is_file():
+            return False
+        write_archive_file(zip_file, source_path, arcname)
+        return True
+    size = storage.size(relative_path)
+    if size is None:
+        return False
+    with storage.open(relative_path) as source_file, \
+            open_archive_entry(zip_file, arcname, force_zip64=size > zipfile.ZIP64_LIMIT) as entry:
+        shutil.copyfileobj(source_file, entry, COPY_BUFFER_SIZE)
+    return True